@@ -0,0 +1,240 @@
+"""Access log parser generated from the nginx log_format of the content-cache workload."""
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import dataclasses
+import re
+from datetime import datetime
+from pathlib import Path
+
+# Installed by the content-cache rock, see content-cache_rock/rockcraft.yaml.
+LOG_FORMAT_PATH = "/srv/content-cache/files/nginx-logging-format.conf"
+LOG_FORMAT_NAME = "content_cache"
+MONTHS = {
+    month: number
+    for number, month in enumerate(
+        ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"],
+        start=1,
+    )
+}
+# Patterns for variables whose value is not simply delimited by the text following them.
+VARIABLE_PATTERNS = {
+    "status": r"\d{3}",
+    "bytes_sent": r"\d+",
+    # Holds a comma separated list of addresses when the request went through several proxies.
+    "http_x_forwarded_for": r".*?",
+}
+# Record fields filled from the variable of the same name in the log format.
+RECORD_VARIABLES = {
+    "ip": "http_x_forwarded_for",
+    "time": "time_local",
+    "request": "request",
+    "status": "status",
+    "bytes_sent": "bytes_sent",
+    "user_agent": "http_user_agent",
+    "request_time": "request_time",
+    "cache_status": "upstream_cache_status",
+    "upstream_time": "upstream_response_time",
+}
+
+
+@dataclasses.dataclass(slots=True)
+class LogRecord:
+    """A parsed access log line.
+
+    Attrs:
+        ip: Client address, the first address of the X-Forwarded-For header.
+        time: Local time the request was logged at.
+        request: The request line, e.g. "GET / HTTP/1.1".
+        status: Response status.
+        bytes_sent: Number of bytes sent to the client.
+        user_agent: Client user agent.
+        request_time: Request processing time in seconds, if logged.
+        cache_status: Cache status, e.g. HIT or MISS, or "-" if the cache was not involved.
+        upstream_time: Time spent receiving the response from the backend in seconds, if
+            the backend was contacted.
+    """
+
+    ip: str
+    time: datetime
+    request: str
+    status: int
+    bytes_sent: int
+    user_agent: str
+    request_time: float | None
+    cache_status: str
+    upstream_time: float | None
+
+    @property
+    def uri(self) -> str:
+        """Return the requested URI, or the whole request line if it is malformed."""
+        parts = self.request.split(" ")
+        return parts[1] if len(parts) == 3 else self.request
+
+
+def read_log_format(path: str = LOG_FORMAT_PATH, name: str = LOG_FORMAT_NAME) -> str:
+    """Read a log_format definition from an nginx configuration file.
+
+    Args:
+        path: nginx configuration file.
+        name: Name of the log format.
+
+    Returns:
+        The format string, with its quoted parts joined.
+
+    Raises:
+        ValueError: if the file does not define the log format.
+    """
+    config = Path(path).read_text(encoding="utf-8")
+    match = re.search(rf"\blog_format\s+{re.escape(name)}\s+((?:'[^']*'\s*)+);", config)
+    if not match:
+        raise ValueError(f"log_format {name} not found in {path}")
+    return "".join(re.findall(r"'([^']*)'", match.group(1)))
+
+
+def compile_log_format(log_format: str) -> re.Pattern:
+    """Compile an nginx log format into a regular expression matching its lines.
+
+    Each variable becomes a group matching up to the literal text that follows it.
+
+    Args:
+        log_format: nginx log format string.
+
+    Returns:
+        A pattern with a named group per variable of the log format.
+    """
+    tokens = re.split(r"\$(\w+)", log_format)
+    pattern = ["^"]
+    # re.split alternates literal text and variable names, starting with literal text.
+    for index in range(1, len(tokens), 2):
+        variable, following = tokens[index], tokens[index + 1]
+        pattern.append(re.escape(tokens[index - 1]) if index == 1 else "")
+        if variable in VARIABLE_PATTERNS:
+            value = VARIABLE_PATTERNS[variable]
+        elif not following:
+            value = r".*"
+        else:
+            value = rf"[^{re.escape(following[0])}]*"
+        pattern.append(f"(?P<{variable}>{value}){re.escape(following)}")
+    pattern.append("$")
+    return re.compile("".join(pattern))
+
+
+class LogParser:
+    """Parse access log lines into LogRecord.
+
+    Timestamps are parsed with a month table instead of strptime, and the last parsed
+    timestamp is cached since consecutive lines are usually logged in the same second.
+    """
+
+    def __init__(self, log_format: str):
+        """Initialize the parser.
+
+        Args:
+            log_format: nginx log format string of the lines to parse.
+
+        Raises:
+            ValueError: if the log format lacks a variable needed by LogRecord.
+        """
+        self._pattern = compile_log_format(log_format)
+        missing = set(RECORD_VARIABLES.values()) - set(self._pattern.groupindex)
+        if missing:
+            raise ValueError(f"log format lacks {', '.join(sorted(missing))}")
+        self._groups = [self._pattern.groupindex[var] for var in RECORD_VARIABLES.values()]
+        self._last_time: tuple[str, datetime] = ("", datetime.min)
+
+    @classmethod
+    def from_config(cls, path: str = LOG_FORMAT_PATH, name: str = LOG_FORMAT_NAME) -> "LogParser":
+        """Create a parser for a log format defined in an nginx configuration file.
+
+        Args:
+            path: nginx configuration file.
+            name: Name of the log format.
+
+        Returns:
+            A parser for the lines of that log format.
+        """
+        return cls(read_log_format(path, name))
+
+    def parse(self, line: str) -> LogRecord | None:
+        """Parse a log line.
+
+        Args:
+            line: A log line, without its trailing newline.
+
+        Returns:
+            The parsed line, or None if the line is malformed.
+        """
+        match = self._pattern.match(line)
+        if match is None:
+            return None
+        ip, time, request, status, sent, agent, request_time, cache, upstream = match.group(
+            *self._groups
+        )
+        timestamp = self.parse_time(time)
+        if timestamp is None:
+            return None
+        return LogRecord(
+            ip.split(",", 1)[0].strip(),
+            timestamp,
+            request,
+            int(status),
+            int(sent),
+            agent,
+            _parse_seconds(request_time),
+            cache,
+            _parse_seconds(upstream),
+        )
+
+    def parse_time(self, time_local: str) -> datetime | None:
+        """Parse a $time_local timestamp, ignoring its UTC offset.
+
+        Args:
+            time_local: Timestamp such as "17/Oct/2026:10:01:02 +0000".
+
+        Returns:
+            The naive local time, or None if the timestamp is malformed.
+        """
+        key = time_local[:20]
+        if key == self._last_time[0]:
+            return self._last_time[1]
+        month = MONTHS.get(key[3:6])
+        if month is None or len(key) != 20 or key[2] + key[6] + key[11] != "//:":
+            return None
+        try:
+            timestamp = datetime(
+                int(key[7:11]),
+                month,
+                int(key[0:2]),
+                int(key[12:14]),
+                int(key[15:17]),
+                int(key[18:20]),
+            )
+        except ValueError:
+            return None
+        self._last_time = (key, timestamp)
+        return timestamp
+
+
+def _parse_seconds(value: str) -> float | None:
+    """Parse a duration logged by nginx.
+
+    Args:
+        value: Seconds with millisecond resolution, a comma separated list of them when
+            several backends were tried, or "-".
+
+    Returns:
+        The total number of seconds, or None if no time was logged.
+    """
+    if value == "-":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        times = [float(part) for part in re.split(r"[,:] ", value) if part != "-"]
+    except ValueError:
+        return None
+    return sum(times) if times else None
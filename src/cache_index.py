@@ -0,0 +1,421 @@
+"""Index of the nginx cache files, run inside the workload container.
+
+The watch command keeps a SQLite index of the cache files up to date with inotify, so that
+purges and inventories do not have to read every cache file.
+"""
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import sqlite3
+import struct
+import sys
+import time
+from typing import Iterator
+
+from cache_purge import (
+    MATCH_MODES,
+    cache_files,
+    is_cache_file_name,
+    read_key,
+    request_uri,
+    strip_slice_range,
+    target_uri,
+)
+
+# Layout of the start of ngx_http_file_cache_header_t on 64-bit platforms.
+CACHE_HEADER = struct.Struct("<Qq")
+CACHE_HEADER_VERSION = 5
+# Rows written between commits while rebuilding the index.
+BATCH_SIZE = 10000
+BUSY_TIMEOUT = 30.0
+# The largest code point, sorting after any other character in an SQLite text column.
+MAX_CHAR = "\U0010ffff"
+GROUP_BY = ["host", "path"]
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    host TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires INTEGER,
+    accessed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_uri ON entries (uri);
+CREATE INDEX IF NOT EXISTS entries_host ON entries (host);
+"""
+
+
+def read_expiry(path: str) -> int | None:
+    """Read the time a cache file stops being valid from its header.
+
+    Args:
+        path: The cache file.
+
+    Returns:
+        The expiry as a Unix timestamp, or None if the header version is unknown.
+    """
+    with open(path, "rb") as cache_file:
+        header = cache_file.read(CACHE_HEADER.size)
+    if len(header) < CACHE_HEADER.size:
+        return None
+    version, valid_sec = CACHE_HEADER.unpack(header)
+    return valid_sec if version == CACHE_HEADER_VERSION else None
+
+
+def group_uri(uri: str, depth: int) -> str:
+    """Return the directory of a request URI, limited to a number of path segments.
+
+    Args:
+        uri: Request URI, such as "/images/2024/logo.png?v=2".
+        depth: Number of leading path segments kept, e.g. 1 for "/images/".
+
+    Returns:
+        The leading segments of the path followed by a slash, or the path itself if it has
+        no more segments than depth.
+    """
+    segments = uri.split("?", 1)[0].split("/")
+    if len(segments) - 1 <= depth:
+        return "/".join(segments)
+    return "/".join(segments[: depth + 1]) + "/"
+
+
+class CacheIndex:
+    """SQLite index of the cache files, by path, with their key, size and times.
+
+    The host of an entry is the part of its key before the request URI, i.e. the scheme
+    and the nginx upstream of the site. The URI excludes the slice range of slices.
+    """
+
+    def __init__(self, path: str):
+        """Open the index, creating it if needed.
+
+        Args:
+            path: The SQLite database file, or ":memory:".
+        """
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        # Readers such as the purge-cache action are not blocked by the watcher writing.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.create_function("group_uri", 2, group_uri, deterministic=True)
+
+    def add(self, path: str) -> bool:
+        """Index or reindex a cache file.
+
+        Args:
+            path: The cache file.
+
+        Returns:
+            Whether the file was indexed, i.e. it exists and is a complete cache file.
+        """
+        try:
+            key = read_key(path)
+            expires = read_expiry(path)
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if key is None:
+            return False
+        uri = request_uri(key)
+        host = key[: len(key) - len(uri)]
+        self.connection.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, key, host, strip_slice_range(uri), stat.st_size, expires, int(stat.st_atime)),
+        )
+        return True
+
+    def remove(self, path: str) -> None:
+        """Remove a cache file, or all the cache files under a directory, from the index.
+
+        Args:
+            path: The cache file or directory.
+        """
+        directory = path.rstrip("/") + "/"
+        self.connection.execute(
+            "DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)",
+            (path, directory, directory + MAX_CHAR),
+        )
+
+    def rebuild(self, cache_paths: list[str]) -> None:
+        """Reindex all the cache files, dropping the entries of removed files.
+
+        Args:
+            cache_paths: The cache directories.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM entries")
+        count = 0
+        for cache_path in cache_paths:
+            if not os.path.isdir(cache_path):
+                continue
+            for entry in cache_files(cache_path):
+                count += self.add(entry.path)
+                if count % BATCH_SIZE == 0:
+                    self.connection.commit()
+        self.connection.commit()
+
+    def find(self, target: str, match: str = "exact") -> Iterator[tuple[str, int]]:
+        """Return the entries whose request URI matches a target.
+
+        Args:
+            target: A request URI, the host of a URL is ignored.
+            match: How the request URIs are compared to the target: exact, prefix or glob.
+
+        Yields:
+            The path and size of the matching cache files.
+
+        Raises:
+            ValueError: if the match mode is unknown.
+        """
+        target = target_uri(target)
+        if match == "exact":
+            query = "SELECT path, size FROM entries WHERE uri = ?"
+            params: tuple = (target,)
+        elif match == "prefix":
+            query = "SELECT path, size FROM entries WHERE uri >= ? AND uri < ?"
+            params = (target, target + MAX_CHAR)
+        elif match == "glob":
+            query = "SELECT path, size FROM entries WHERE uri GLOB ?"
+            params = (target,)
+        else:
+            raise ValueError(
+                f"unknown match mode {match!r}, expected one of {', '.join(MATCH_MODES)}"
+            )
+        yield from self.connection.execute(query, params)
+
+    def purge(self, target: str, match: str = "exact", dry_run: bool = False) -> dict:
+        """Remove the cache files whose request URI matches a target.
+
+        Args:
+            target: A request URI, the host of a URL is ignored.
+            match: How the request URIs are compared to the target: exact, prefix or glob.
+            dry_run: Whether to only count the matching cache files.
+
+        Returns:
+            The number of entries and bytes removed.
+        """
+        entries = size = 0
+        for path, file_size in list(self.find(target, match)):
+            if not dry_run:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+                self.remove(path)
+            entries += 1
+            size += file_size
+        self.connection.commit()
+        return {"entries": entries, "bytes": size}
+
+    def inventory(
+        self, prefix: str = "/", group_by: str = "path", depth: int = 1, limit: int = 20
+    ) -> list[dict]:
+        """Summarize the cached entries whose request URI starts with a prefix.
+
+        Args:
+            prefix: Prefix of the request URIs summarized.
+            group_by: Whether to group entries by host or by leading path segments.
+            depth: Number of leading path segments grouped by.
+            limit: Maximum number of groups returned.
+
+        Returns:
+            Per group, largest first, the number of entries, their total size and the number
+            of expired entries.
+        """
+        group = "host" if group_by == "host" else "group_uri(uri, ?)"
+        params: tuple = () if group_by == "host" else (depth,)
+        query = (
+            f"SELECT {group}, count(*), sum(size), sum(expires < ?) FROM entries"  # noqa: S608
+            " WHERE uri >= ? AND uri < ? GROUP BY 1 ORDER BY 3 DESC, 1 LIMIT ?"
+        )
+        rows = self.connection.execute(
+            query, (*params, int(time.time()), prefix, prefix + MAX_CHAR, limit)
+        )
+        return [
+            {"group": name, "entries": count, "bytes": size, "expired": expired}
+            for name, count, size, expired in rows
+        ]
+
+    def close(self) -> None:
+        """Close the index."""
+        self.connection.close()
+
+
+class Inotify:
+    """Minimal inotify binding, watching directory trees for file changes."""
+
+    def __init__(self) -> None:
+        """Create the inotify instance.
+
+        Raises:
+            OSError: if inotify is not available.
+        """
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._paths: dict[int, str] = {}
+
+    def add_tree(self, directory: str) -> None:
+        """Watch a directory and all its subdirectories.
+
+        Args:
+            directory: The directory.
+
+        Raises:
+            OSError: if a directory cannot be watched, e.g. when max_user_watches is reached.
+        """
+        for path, _, _ in os.walk(directory):
+            watch = self._libc.inotify_add_watch(self.fd, path.encode(), WATCH_MASK)
+            if watch < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno), path)
+            self._paths[watch] = path
+
+    def read_events(self, timeout: float | None = None) -> Iterator[tuple[int, str]]:
+        """Return the pending events, waiting for some if there is none.
+
+        Args:
+            timeout: Maximum time to wait for events in seconds, forever by default.
+
+        Yields:
+            The mask of each event and the path of the file it is about; the path is empty
+            for queue overflows.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            watch, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0").decode()
+            offset += length
+            if mask & IN_IGNORED:
+                self._paths.pop(watch, None)
+                continue
+            directory = self._paths.get(watch)
+            if mask & IN_Q_OVERFLOW or directory is None:
+                yield mask, ""
+                continue
+            yield mask, os.path.join(directory, name)
+
+    def close(self) -> None:
+        """Close the inotify instance."""
+        os.close(self.fd)
+
+
+def handle_event(index: CacheIndex, inotify: Inotify, mask: int, path: str) -> bool:
+    """Update the index after a change of the cache tree.
+
+    Args:
+        index: The cache index.
+        inotify: The inotify instance watching the cache tree.
+        mask: Mask of the inotify event.
+        path: Path of the file or directory the event is about.
+
+    Returns:
+        Whether events were lost, in which case the index must be rebuilt.
+    """
+    if mask & IN_Q_OVERFLOW:
+        return True
+    if mask & IN_ISDIR:
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            inotify.add_tree(path)
+            for entry in cache_files(path):
+                index.add(entry.path)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            index.remove(path)
+        return False
+    if not is_cache_file_name(os.path.basename(path)):
+        return False
+    if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+        index.add(path)
+    elif mask & (IN_DELETE | IN_MOVED_FROM):
+        index.remove(path)
+    return False
+
+
+def watch(index: CacheIndex, cache_paths: list[str], inotify: Inotify) -> None:
+    """Index the cache directories and keep the index up to date until interrupted.
+
+    Args:
+        index: The cache index.
+        cache_paths: The cache directories.
+        inotify: The inotify instance.
+    """
+    # Watch before scanning so that no change is missed in between.
+    for cache_path in cache_paths:
+        os.makedirs(cache_path, exist_ok=True)
+        inotify.add_tree(cache_path)
+    index.rebuild(cache_paths)
+    while True:
+        overflow = False
+        for mask, path in inotify.read_events():
+            overflow = handle_event(index, inotify, mask, path) or overflow
+        if overflow:
+            index.rebuild(cache_paths)
+        index.connection.commit()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Run an index command, printing the results of queries as JSON.
+
+    Args:
+        argv: Command line arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", required=True)
+    commands = parser.add_subparsers(dest="command", required=True)
+    watch_parser = commands.add_parser("watch")
+    watch_parser.add_argument("cache_paths", nargs="+")
+    purge_parser = commands.add_parser("purge")
+    purge_parser.add_argument("target")
+    purge_parser.add_argument("--match", choices=MATCH_MODES, default="exact")
+    purge_parser.add_argument("--dry-run", action="store_true")
+    inventory_parser = commands.add_parser("inventory")
+    inventory_parser.add_argument("--prefix", default="/")
+    inventory_parser.add_argument("--group-by", choices=GROUP_BY, default="path")
+    inventory_parser.add_argument("--depth", type=int, default=1)
+    inventory_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command != "watch" and not os.path.exists(args.db):
+        parser.error(f"the cache index {args.db} does not exist")
+    index = CacheIndex(args.db)
+    try:
+        if args.command == "watch":
+            watch(index, args.cache_paths, Inotify())
+        elif args.command == "purge":
+            json.dump(index.purge(args.target, args.match, args.dry_run), sys.stdout)
+        else:
+            json.dump(
+                index.inventory(args.prefix, args.group_by, args.depth, args.limit), sys.stdout
+            )
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,275 @@
+"""Purge of nginx cache entries by key, run inside the workload container."""
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import argparse
+import fnmatch
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+from urllib.parse import urlsplit
+
+# nginx writes the key after its binary header, which is a few hundred bytes long.
+HEADER_SIZE = 4096
+MAX_HEADER_SIZE = 64 * 1024
+KEY_PREFIX = b"\nKEY: "
+# Appended to the key of each slice when slice caching is enabled.
+SLICE_RANGE_RE = re.compile(r"bytes=\d+-\d+$")
+MATCH_MODES = ["exact", "prefix", "glob"]
+DEFAULT_WORKERS = 4
+
+
+def read_key(path: str) -> str | None:
+    """Read the cache key stored in a cache file.
+
+    Args:
+        path: The cache file.
+
+    Returns:
+        The key, or None if the file is not a complete cache file.
+    """
+    with open(path, "rb") as cache_file:
+        header = cache_file.read(HEADER_SIZE)
+        start = header.find(KEY_PREFIX)
+        if start == -1:
+            return None
+        start += len(KEY_PREFIX)
+        end = header.find(b"\n", start)
+        while end == -1 and len(header) < MAX_HEADER_SIZE:
+            chunk = cache_file.read(HEADER_SIZE)
+            if not chunk:
+                return None
+            header += chunk
+            end = header.find(b"\n", start)
+    if end == -1:
+        return None
+    return header[start:end].decode("utf-8", errors="replace")
+
+
+def request_uri(key: str) -> str:
+    """Return the request URI part of a cache key.
+
+    Args:
+        key: Cache key such as "httpexample-backend/path?query", i.e. the scheme, the
+            upstream name and the request URI, plus the slice range when slicing and the
+            request headers of the cache_key_headers config after a space.
+
+    Returns:
+        The key from the first slash to the first space, or the key as is if it has no
+        slash.
+    """
+    start = key.find("/")
+    return key[start:].split(" ", 1)[0] if start != -1 else key
+
+
+def make_matcher(target: str, match: str = "exact") -> Callable[[str], bool]:
+    """Create a function telling whether a cache key matches a purge target.
+
+    Args:
+        target: A request URI such as "/path?query", or a URL whose host is ignored.
+        match: How the request URI of a key is compared to the target: exact, prefix or
+            glob, such as "/images/*.png".
+
+    Returns:
+        A function taking a cache key and returning whether it matches.
+
+    Raises:
+        ValueError: if the match mode is unknown.
+    """
+    target = target_uri(target)
+    if match == "exact":
+        return lambda key: strip_slice_range(request_uri(key)) == target
+    if match == "prefix":
+        return lambda key: request_uri(key).startswith(target)
+    if match == "glob":
+        pattern = re.compile(fnmatch.translate(target))
+        return lambda key: pattern.match(strip_slice_range(request_uri(key))) is not None
+    raise ValueError(f"unknown match mode {match!r}, expected one of {', '.join(MATCH_MODES)}")
+
+
+def target_uri(target: str) -> str:
+    """Return the request URI of a purge target.
+
+    Args:
+        target: A request URI, or a URL whose host is ignored.
+
+    Returns:
+        The target, without the scheme and host if it is a URL.
+    """
+    parts = urlsplit(target)
+    if not (parts.scheme and parts.netloc):
+        return target
+    uri = parts.path or "/"
+    return f"{uri}?{parts.query}" if parts.query else uri
+
+
+def strip_slice_range(uri: str) -> str:
+    """Remove the slice range appended to the request URI of a slice.
+
+    Args:
+        uri: Request URI part of a cache key.
+
+    Returns:
+        The request URI without the slice range.
+    """
+    return SLICE_RANGE_RE.sub("", uri)
+
+
+def is_cache_file_name(name: str) -> bool:
+    """Tell whether a file of a cache directory is a cache file, rather than one being written.
+
+    Args:
+        name: Name of the file.
+
+    Returns:
+        Whether the file is a cache file: files being written are temporary files named
+        with a numeric extension.
+    """
+    return "." not in name
+
+
+def cache_files(directory: str) -> Iterator[os.DirEntry]:
+    """Walk a cache directory without listing it all in memory.
+
+    Args:
+        directory: A cache directory, or one of its hash subdirectories.
+
+    Yields:
+        The cache files under the directory.
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from cache_files(entry.path)
+            elif entry.is_file(follow_symlinks=False) and is_cache_file_name(entry.name):
+                yield entry
+
+
+class Purger:
+    """Remove the cache files whose key matches, walking hash directories in parallel.
+
+    Attrs:
+        entries: Number of cache files removed.
+        bytes: Total size of the cache files removed.
+        scanned: Number of cache files read.
+    """
+
+    def __init__(self, matcher: Callable[[str], bool], dry_run: bool = False):
+        """Initialize the purger.
+
+        Args:
+            matcher: Function telling whether a cache key is to be purged.
+            dry_run: Whether to only count the matching cache files.
+        """
+        self.entries = 0
+        self.bytes = 0
+        self.scanned = 0
+        self._matcher = matcher
+        self._dry_run = dry_run
+        self._lock = threading.Lock()
+
+    def purge_directory(self, directory: str) -> None:
+        """Remove the matching cache files under a directory.
+
+        Args:
+            directory: A cache directory, or one of its hash subdirectories.
+        """
+        entries = size = scanned = 0
+        for entry in cache_files(directory):
+            scanned += 1
+            try:
+                key = read_key(entry.path)
+                if key is None or not self._matcher(key):
+                    continue
+                file_size = entry.stat(follow_symlinks=False).st_size
+                if not self._dry_run:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                # Removed by the nginx cache manager in the meantime.
+                continue
+            entries += 1
+            size += file_size
+        with self._lock:
+            self.entries += entries
+            self.bytes += size
+            self.scanned += scanned
+
+    def purge(
+        self,
+        cache_paths: list[str],
+        workers: int = DEFAULT_WORKERS,
+        progress: Callable[[int, int], None] | None = None,
+    ) -> None:
+        """Remove the matching cache files under cache directories.
+
+        Each top level hash directory is walked by one worker, so memory only depends on
+        the number of workers and the depth of the cache levels.
+
+        Args:
+            cache_paths: The cache directories.
+            workers: Number of directories walked in parallel.
+            progress: Called with the number of directories done and their total whenever a
+                top level hash directory has been walked.
+        """
+        directories: list[str] = []
+        for cache_path in cache_paths:
+            if not os.path.isdir(cache_path):
+                continue
+            with os.scandir(cache_path) as entries:
+                directories.extend(entry.path for entry in entries if entry.is_dir())
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self.purge_directory, directory) for directory in directories
+            ]
+            for done, future in enumerate(futures, start=1):
+                future.result()
+                if progress is not None:
+                    progress(done, len(directories))
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Purge the matching cache entries and print the totals as JSON.
+
+    Progress is reported on stderr.
+
+    Args:
+        argv: Command line arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("target")
+    parser.add_argument("cache_paths", nargs="+")
+    parser.add_argument("--match", choices=MATCH_MODES, default="exact")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    purger = Purger(make_matcher(args.target, args.match), args.dry_run)
+
+    def progress(done: int, total: int) -> None:
+        """Report the progress of the purge on stderr.
+
+        Args:
+            done: Number of directories walked.
+            total: Number of directories to walk.
+        """
+        print(
+            f"{done}/{total} directories scanned, {purger.entries} entries"
+            f" ({purger.bytes} bytes) purged",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    purger.purge(args.cache_paths, args.workers, progress)
+    json.dump(
+        {"entries": purger.entries, "bytes": purger.bytes, "scanned": purger.scanned},
+        sys.stdout,
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,246 @@
+"""Cache warm-up through the local nginx, run inside the workload container."""
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Iterable
+
+from access_log import LOG_FORMAT_PATH, LogParser
+from cache_purge import target_uri
+from file_reader import readlines_reverse
+from log_report import (
+    SERVED_FROM_CACHE,
+    TOP_K_FACTOR,
+    TOP_K_MIN_CAPACITY,
+    normalize_uri,
+    parse_window,
+)
+from sketches import SpaceSaving
+
+DEFAULT_PORT = 8080
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE = 20.0
+TIMEOUT = 60.0
+CHUNK_SIZE = 64 * 1024
+USER_AGENT = "content-cache-warmer"
+# Number of progress reports over a warm-up.
+PROGRESS_STEPS = 20
+MAX_FAILURES_REPORTED = 20
+
+
+def recent_uris(
+    log_path: str, since: datetime, parser: LogParser, limit: int, strip_query: bool = False
+) -> list[str]:
+    """List the URIs most requested since a given time.
+
+    The access log is read backwards from its end, so only the lines within the window
+    are read. Only successful GET requests are counted, with a Space-Saving summary, leaving
+    out the requests of previous warm-ups.
+
+    Args:
+        log_path: The access log.
+        since: Oldest timestamp accepted.
+        parser: Parser of the log lines.
+        limit: Maximum number of URIs returned.
+        strip_query: Whether to drop query strings from the URIs.
+
+    Returns:
+        The URIs, most requested first.
+    """
+    summary = SpaceSaving(max(limit * TOP_K_FACTOR, TOP_K_MIN_CAPACITY))
+    for line in readlines_reverse(open(log_path, "rb")):  # noqa: SIM115
+        record = parser.parse(line)
+        if record is None:
+            continue
+        if record.time < since:
+            break
+        if (
+            record.status == 200
+            and record.request.startswith("GET ")
+            and record.user_agent != USER_AGENT
+        ):
+            summary.add(normalize_uri(record.uri, strip_query))
+    return [str(uri) for uri, _ in summary.most_common(limit)]
+
+
+class RateLimiter:
+    """Space out requests to stay under a rate, shared by concurrent tasks."""
+
+    def __init__(self, rate: float):
+        """Initialize the limiter.
+
+        Args:
+            rate: Maximum number of requests per second, unlimited if 0.
+        """
+        self._interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        """Wait until the next request may start."""
+        if not self._interval:
+            return
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + self._interval
+        await asyncio.sleep(start - now)
+
+
+async def fetch(host: str, port: int, site: str, uri: str) -> tuple[int, str]:
+    """Request a URI from nginx and read the whole response so that it gets cached.
+
+    Args:
+        host: Address nginx listens on.
+        port: Port nginx listens on.
+        site: Host header of the request.
+        uri: Request URI.
+
+    Returns:
+        The response status and its cache status, "-" if nginx did not report one.
+
+    Raises:
+        ValueError: if the response is not valid HTTP.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            f"GET {uri} HTTP/1.1\r\nHost: {site}\r\nUser-Agent: {USER_AGENT}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1")
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        parts = status_line.split(b" ", 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/") or not parts[1].isdigit():
+            raise ValueError(f"invalid status line {status_line!r}")
+        cache_status = "-"
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "x-cache-status" and value.strip():
+                # nginx reports "$upstream_cache_status from <pod> <namespace>".
+                cache_status = value.split()[0]
+        # The connection is closed after the response, which is discarded.
+        while await reader.read(CHUNK_SIZE):
+            pass
+        return int(parts[1]), cache_status
+    finally:
+        writer.close()
+
+
+async def warm(
+    uris: list[str],
+    site: str,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rate: float = DEFAULT_RATE,
+) -> dict:
+    """Fetch URIs through nginx with bounded concurrency and rate.
+
+    Args:
+        uris: Request URIs to fetch.
+        site: Host header of the requests.
+        host: Address nginx listens on.
+        port: Port nginx listens on.
+        concurrency: Maximum number of requests in flight.
+        rate: Maximum number of requests started per second, unlimited if 0.
+
+    Returns:
+        The number of requests, of responses already cached (hits), of responses fetched
+        from the backend (misses) and of failures, with the first failed URIs.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+    totals = {"requests": len(uris), "hits": 0, "misses": 0, "failures": 0}
+    failed: list[str] = []
+    done = 0
+    step = max(1, len(uris) // PROGRESS_STEPS)
+
+    async def _warm(uri: str) -> None:
+        """Fetch a URI and count its outcome."""
+        nonlocal done
+        async with semaphore:
+            await limiter.wait()
+            try:
+                status, cache_status = await asyncio.wait_for(
+                    fetch(host, port, site, uri), TIMEOUT
+                )
+            except (OSError, ValueError, asyncio.TimeoutError) as exc:
+                status, cache_status = 0, str(exc) or type(exc).__name__
+        if status == 0 or status >= 400:
+            totals["failures"] += 1
+            if len(failed) < MAX_FAILURES_REPORTED:
+                failed.append(f"{uri} ({status or cache_status})")
+        elif cache_status in SERVED_FROM_CACHE:
+            totals["hits"] += 1
+        else:
+            totals["misses"] += 1
+        done += 1
+        if done % step == 0 or done == len(uris):
+            print(
+                f"{done}/{len(uris)} fetched, {totals['hits']} hits, {totals['misses']} misses,"
+                f" {totals['failures']} failures",
+                file=sys.stderr,
+                flush=True,
+            )
+
+    await asyncio.gather(*(_warm(uri) for uri in uris))
+    return {**totals, "failed": failed}
+
+
+def _unique(uris: Iterable[str]) -> list[str]:
+    """Drop duplicate URIs, keeping their order.
+
+    Args:
+        uris: Request URIs.
+
+    Returns:
+        The URIs, each once.
+    """
+    return list(dict.fromkeys(uris))
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Warm the cache and print the totals as JSON.
+
+    Progress is reported on stderr.
+
+    Args:
+        argv: Command line arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("site")
+    parser.add_argument("urls", nargs="*")
+    parser.add_argument("--log-path")
+    parser.add_argument("--window", type=parse_window, default="1h")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--strip-query", action="store_true")
+    parser.add_argument("--log-format", default=LOG_FORMAT_PATH)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE)
+    args = parser.parse_args(argv)
+
+    if args.urls:
+        uris = _unique(target_uri(url) for url in args.urls)
+    elif args.log_path:
+        since = datetime.now() - args.window
+        log_parser = LogParser.from_config(args.log_format)
+        uris = recent_uris(args.log_path, since, log_parser, args.limit, args.strip_query)
+    else:
+        parser.error("either URLs or --log-path are required")
+    result = asyncio.run(
+        warm(uris, args.site, port=args.port, concurrency=args.concurrency, rate=args.rate)
+    )
+    json.dump(result, sys.stdout)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
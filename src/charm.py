@@ -6,13 +6,17 @@
 """Charm for Content-cache on Kubernetes."""
 
 import hashlib
-import itertools
+import json
 import logging
-from collections import Counter
-from datetime import datetime, timedelta
-from urllib.parse import urlparse
+import math
+import os
+import re
+from pathlib import Path
+from typing import Any, Mapping
+from urllib.parse import urlparse, urlsplit
 
 import ops.pebble
+import yaml
 from charms.grafana_k8s.v0.grafana_dashboard import GrafanaDashboardProvider
 from charms.loki_k8s.v0.loki_push_api import LogProxyConsumer
 from charms.nginx_ingress_integrator.v0.nginx_route import (
@@ -22,22 +26,124 @@ from charms.nginx_ingress_integrator.v0.nginx_route import (
 )
 from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
 from ops.charm import ActionEvent, CharmBase, ConfigChangedEvent, UpgradeCharmEvent
+from ops.framework import StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, WaitingStatus
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    Container,
+    MaintenanceStatus,
+    WaitingStatus,
+)
 from tabulate import tabulate  # type: ignore[import-untyped]
 
-from file_reader import readlines_reverse
-
 logger = logging.getLogger(__name__)
 
 CACHE_PATH = "/var/lib/nginx/proxy/cache"
+CACHE_STORAGE_NAME = "cache"
+CACHE_INDEX_NAME = "content-cache-index"
+# Outside of the cache storage, the index is rebuilt whenever its service starts.
+CACHE_INDEX_PATH = "/var/lib/nginx/proxy/cache-index.sqlite"
+# Share of the cache storage nginx may fill, leaving room for temporary files and for the
+# cache manager to evict entries once max_size is exceeded.
+CACHE_STORAGE_USAGE = 0.9
+DEFAULT_CACHE_MAX_SIZE = "10G"
 CONTAINER_NAME = "content-cache"
 EXPORTER_CONTAINER_NAME = "nginx-prometheus-exporter"
 CONTAINER_PORT = 8080
+NGINX_CONFIG_PATH = "/etc/nginx/sites-enabled/default"
+# The upstream of the units sharing the cache has its own file, included by the site config,
+# so that units joining or departing only change this file.
+NGINX_SHARDS_PATH = "/etc/nginx/content-cache/shards.conf"
+PEER_RELATION_NAME = "content-cache-peers"
+# Port of the cache server of each unit when the cache is sharded across the units, the
+# container port then being served by a server forwarding requests to their owner unit.
+SHARD_PORT = 8081
+# Environment of the nginx service; the rest of the config is rendered into the nginx config,
+# which is applied by reloading nginx rather than restarting it.
+SERVICE_ENV_KEYS = ["JUJU_POD_NAME", "JUJU_POD_NAMESPACE", "JUJU_POD_SERVICE_ACCOUNT"]
+# Helper modules pushed into the workload container and run there with Pebble exec.
+HELPERS_PATH = "/srv/content-cache/bin"
+HELPER_MODULES = [
+    "access_log.py",
+    "cache_index.py",
+    "cache_purge.py",
+    "cache_warmer.py",
+    "file_reader.py",
+    "log_exporter.py",
+    "log_report.py",
+    "sketches.py",
+]
+LOG_EXPORTER_NAME = "content-cache-log-exporter"
+LOG_EXPORTER_PORT = 9114
 REQUIRED_JUJU_CONFIGS = ["backend"]
+# nginx size, e.g. 1048576, 512k or 1m.
+SIZE_RE = re.compile(r"^[0-9]+[kKmMgG]?$")
+# nginx time, e.g. 30s, 10m or 1d.
+TIME_RE = re.compile(r"^[0-9]+(ms|[smhdwMy])?$")
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+# A 1m keys zone holds about 8000 keys, per the nginx proxy_cache_path documentation.
+KEYS_PER_MEGABYTE = 8000
+DEFAULT_AVERAGE_OBJECT_SIZE = "128k"
+CACHE_TIER_NAME_RE = re.compile(r"^[a-z0-9-]+$")
+CACHE_TIER_LEVELS_RE = re.compile(r"^[12](:[12]){0,2}$")
+CACHE_VALID_RE = re.compile(r"^(([0-9]{3}|any) )*[0-9]+(ms|[smhdwMy])?$")
+CACHE_USE_STALE_RE = re.compile(r"^[a-z0-9_]+( [a-z0-9_]+)*$")
+# Response headers nginx can be told to ignore when caching, see proxy_ignore_headers.
+IGNORABLE_HEADERS = {
+    "Cache-Control",
+    "Expires",
+    "Set-Cookie",
+    "Vary",
+    "X-Accel-Buffering",
+    "X-Accel-Charset",
+    "X-Accel-Expires",
+    "X-Accel-Limit-Rate",
+    "X-Accel-Redirect",
+}
+# nginx's default proxy_cache_key, whose request URI part the cache key options normalize.
+DEFAULT_CACHE_KEY = "$scheme$proxy_host$request_uri"
+CACHE_KEY_ARG_RE = re.compile(r"^[A-Za-z0-9_]+$")
+CACHE_KEY_HEADER_RE = re.compile(r"^[A-Za-z0-9-]+$")
+SITE_NAME_RE = re.compile(r"^[a-zA-Z0-9*][a-zA-Z0-9.*-]*$")
+# Cache policy options a site of the sites config may override, defaulting to the charm config.
+SITE_POLICY_OPTIONS = [
+    "cache_all",
+    "cache_inactive_time",
+    "cache_use_stale",
+    "cache_valid",
+    "proxy_cache_revalidate",
+]
+# nginx -t error when a backend name has no DNS record, e.g. a unit that just joined.
+UNRESOLVED_UPSTREAM_ERROR = "host not found in upstream"
+# Directive selecting the load balancing method of the backend upstream, by config value.
+UPSTREAM_BALANCING = {
+    "round-robin": None,
+    "least-conn": "least_conn",
+    # Consistent hashing only remaps the URIs of a backend unit when it joins or departs.
+    "uri-hash": "hash $request_uri consistent",
+}
 REQUIRED_INGRESS_RELATION_FIELDS = {"service-hostname", "service-name", "service-port"}
 
 
+def parse_size(size: str) -> int:
+    """Parse an nginx size.
+
+    Args:
+        size: Size such as 1048576, 512k, 1m or 10G.
+
+    Returns:
+        The size in bytes.
+
+    Raises:
+        ValueError: if the size is malformed.
+    """
+    unit = size[-1:].lower() if size[-1:].isalpha() else ""
+    if unit not in SIZE_UNITS:
+        raise ValueError(f"unknown size unit in {size!r}")
+    return int(size[: len(size) - len(unit)]) * SIZE_UNITS[unit]
+
+
 class ContentCacheCharm(CharmBase):
     """Charm the service.
 
@@ -48,11 +154,13 @@ class ContentCacheCharm(CharmBase):
         _metrics_endpoint: Provider of metrics for Prometheus charm
         _logging: Requirer of logs for Loki charm
         _grafana_dashboards: Dashboard Provider for Grafana charm
+        _stored: Hash of the config last applied to the workload container
         unit: Charm's designated juju unit
         model: Charm's designated juju model
     """
 
     on = _NginxRouteCharmEvents()
+    _stored = StoredState()
     ERROR_LOG_PATH = "/var/log/nginx/error.log"
     ACCESS_LOG_PATH = "/var/log/nginx/access.log"
 
@@ -63,19 +171,29 @@ class ContentCacheCharm(CharmBase):
             args: Variable list of positional arguments passed to the parent constructor.
         """
         super().__init__(*args)
+        self._stored.set_default(workload_hash="", shard_addresses="")
 
         self.framework.observe(self.on.start, self._on_start)
         self.framework.observe(self.on.config_changed, self._on_config_changed)
         self.framework.observe(self.on.upgrade_charm, self._on_upgrade_charm)
+        self.framework.observe(self.on.cache_storage_attached, self._on_config_changed)
         self.framework.observe(
             self.on.report_visits_by_ip_action, self._report_visits_by_ip_action
         )
+        self.framework.observe(self.on.report_cache_stats_action, self._report_cache_stats_action)
+        self.framework.observe(self.on.report_top_misses_action, self._report_top_misses_action)
+        self.framework.observe(self.on.purge_cache_action, self._purge_cache_action)
+        self.framework.observe(
+            self.on.report_cache_inventory_action, self._report_cache_inventory_action
+        )
+        self.framework.observe(self.on.warm_cache_action, self._warm_cache_action)
         self.framework.observe(
             self.on.content_cache_pebble_ready, self._on_content_cache_pebble_ready
         )
         # Provide ability for Content-cache to be scraped by Prometheus using prometheus_scrape
         self._metrics_endpoint = MetricsEndpointProvider(
-            self, jobs=[{"static_configs": [{"targets": ["*:9113"]}]}]
+            self,
+            jobs=[{"static_configs": [{"targets": ["*:9113", f"*:{LOG_EXPORTER_PORT}"]}]}],
         )
 
         # Enable log forwarding for Loki and other charms that implement loki_push_api
@@ -93,6 +211,7 @@ class ContentCacheCharm(CharmBase):
         ingress_config = self._make_ingress_config()
         require_nginx_route(
             charm=self,
+            additional_hostnames=ingress_config.get("additional-hostnames", None),
             max_body_size=ingress_config.get("max-body-size", None),
             service_hostname=ingress_config.get("service-hostname"),
             service_name=ingress_config.get("service-name"),
@@ -106,6 +225,19 @@ class ContentCacheCharm(CharmBase):
             nginx_route_relation_name="nginx-proxy",
         )
         self.framework.observe(self.on.nginx_route_available, self._on_config_changed)
+        # Backend units joining or departing change the servers of the upstream.
+        self.framework.observe(self.on["nginx-proxy"].relation_joined, self._on_config_changed)
+        self.framework.observe(self.on["nginx-proxy"].relation_departed, self._on_config_changed)
+        # Units joining, departing or becoming ready change the shards of the cache.
+        self.framework.observe(
+            self.on[PEER_RELATION_NAME].relation_joined, self._on_config_changed
+        )
+        self.framework.observe(
+            self.on[PEER_RELATION_NAME].relation_changed, self._on_config_changed
+        )
+        self.framework.observe(
+            self.on[PEER_RELATION_NAME].relation_departed, self._on_config_changed
+        )
 
     def _on_content_cache_pebble_ready(self, event) -> None:
         """Handle content_cache_pebble_ready event and configure workload container.
@@ -116,6 +248,8 @@ class ContentCacheCharm(CharmBase):
         msg = "Configuring workload container (content-cache-pebble-ready)"
         logger.info(msg)
         self.model.unit.status = MaintenanceStatus(msg)
+        # The container may be new, with none of the config previously applied.
+        self._stored.workload_hash = ""
         self.on.config_changed.emit()
 
     def _on_start(self, event) -> None:
@@ -144,61 +278,322 @@ class ContentCacheCharm(CharmBase):
         Args:
             event: the Juju action event fired when the action executes.
         """
-        results = self._report_visits_by_ip()
-        event.set_results({"ips": tabulate(results, headers=["IP", "Requests"], tablefmt="grid")})
+        group_by = event.params["group-by"]
+        try:
+            results = self._report_visits_by_ip(
+                event.params["window"], group_by, event.params["limit"]
+            )
+        except (ops.pebble.APIError, ops.pebble.ChangeError, ops.pebble.ExecError) as exc:
+            logger.exception("Failed to report visits by IP")
+            event.fail(f"Failed to read the access log: {exc}")
+            return
+        if group_by == "ip":
+            event.set_results(
+                {"ips": tabulate(results, headers=["IP", "Requests"], tablefmt="grid")}
+            )
+            return
+        header = group_by.replace("-", " ").capitalize()
+        event.set_results(
+            {"visits": tabulate(results, headers=[header, "Requests"], tablefmt="grid")}
+        )
 
-    @staticmethod
-    def _filter_lines(line: str) -> bool:
-        """Filter the log lines by date.
+    def _report_visits_by_ip(
+        self, window: str = "20m", group_by: str = "ip", limit: int = 100
+    ) -> list[tuple[str, int]]:
+        """Report requests to nginx grouped and ordered by IP and report action result.
+
+        The access log is aggregated by a helper running in the workload container, so only
+        the counts of the most frequent keys are sent back to the charm.
 
         Args:
-            line: A log line from the log file.
+            window: How far back to look in the access log, e.g. 5m, 1h or 24h.
+            group_by: What to group requests by: ip, ip-prefix, user-agent, uri, status or
+                cache-status.
+            limit: Maximum number of entries returned.
 
         Returns:
-            Indicates if the line must be included or not.
+            A list of tuples composed of a key, an IP address by default, and the number of
+            visits for that key.
         """
-        line_elements = line.split()
+        report = self._run_log_report(
+            "visits", "--window", window, "--group-by", group_by, "--limit", str(limit)
+        )
+        return [(key, count) for key, count in report]
 
-        if len(line_elements) < 4:
-            return False
+    def _report_cache_stats_action(self, event: ActionEvent) -> None:
+        """Handle the report-cache-stats action.
 
-        timestamp_str = line_elements[3].lstrip("[").rstrip("]")
+        Args:
+            event: the Juju action event fired when the action executes.
+        """
         try:
-            timestamp = datetime.strptime(timestamp_str, "%d/%b/%Y:%H:%M:%S")
-        except ValueError:
-            return False
+            stats = self._run_log_report("cache-stats", "--window", event.params["window"])
+        except (ops.pebble.APIError, ops.pebble.ChangeError, ops.pebble.ExecError) as exc:
+            logger.exception("Failed to report cache stats")
+            event.fail(f"Failed to read the access log: {exc}")
+            return
+        rows = [
+            [
+                item["status"],
+                item["requests"],
+                item["bytes"],
+                *(item[name] for name in ("p50", "p95", "p99")),
+            ]
+            for item in stats["statuses"]
+        ]
+        event.set_results(
+            {
+                "requests": stats["requests"],
+                "hit-ratio": self._format_ratio(stats["hit_ratio"]),
+                "bytes-from-cache": stats["bytes_from_cache"],
+                "bytes-from-origin": stats["bytes_from_origin"],
+                "byte-hit-ratio": self._format_ratio(stats["byte_hit_ratio"]),
+                "cache-statuses": tabulate(
+                    rows,
+                    headers=["Cache status", "Requests", "Bytes", "p50 (s)", "p95 (s)", "p99 (s)"],
+                    tablefmt="grid",
+                    floatfmt=".3f",
+                    missingval="-",
+                ),
+            }
+        )
+
+    def _report_top_misses_action(self, event: ActionEvent) -> None:
+        """Handle the report-top-misses action.
+
+        Args:
+            event: the Juju action event fired when the action executes.
+        """
+        args = ["--window", event.params["window"], "--limit", str(event.params["limit"])]
+        if event.params["strip-query"]:
+            args.append("--strip-query")
+        try:
+            misses = self._run_log_report("top-misses", *args)
+        except (ops.pebble.APIError, ops.pebble.ChangeError, ops.pebble.ExecError) as exc:
+            logger.exception("Failed to report top misses")
+            event.fail(f"Failed to read the access log: {exc}")
+            return
+        rows = [
+            [item["uri"], item["misses"], item["bytes"], item["upstream_time"]] for item in misses
+        ]
+        event.set_results(
+            {
+                "misses": tabulate(
+                    rows,
+                    headers=["URI", "Misses", "Bytes", "Avg upstream time (s)"],
+                    tablefmt="grid",
+                    floatfmt=".3f",
+                    missingval="-",
+                )
+            }
+        )
 
-        return timestamp > (datetime.now() - timedelta(minutes=20))
+    def _purge_cache_action(self, event: ActionEvent) -> None:
+        """Handle the purge-cache action.
 
-    def _get_ip(self, line: str) -> str:
-        """Return the IP address of a log line.
+        The cache directories are scanned in the workload container and the cache files
+        whose key matches are removed; nginx fetches them again from the backend on the next
+        request. Progress is streamed to the action log.
 
         Args:
-            line: The log line previously filtered.
+            event: the Juju action event fired when the action executes.
+        """
+        try:
+            cache_paths = self._cache_paths()
+        except ValueError as exc:
+            event.fail(f"Invalid cache config: {exc}")
+            return
+        if self.config.get("cache_index"):
+            command = ["python3", f"{HELPERS_PATH}/cache_index.py", "--db", CACHE_INDEX_PATH]
+            command += ["purge", event.params["target"]]
+        else:
+            command = ["python3", f"{HELPERS_PATH}/cache_purge.py", event.params["target"]]
+            command += cache_paths
+        command += ["--match", event.params["match"]]
+        if event.params["dry-run"]:
+            command.append("--dry-run")
+        try:
+            stdout = self._run_helper_with_progress(event, command)
+        except (ops.pebble.APIError, ops.pebble.ChangeError, ops.pebble.ExecError) as exc:
+            logger.exception("Failed to purge the cache")
+            event.fail(f"Failed to purge the cache: {exc}")
+            return
+        event.set_results(json.loads(stdout))
+
+    def _warm_cache_action(self, event: ActionEvent) -> None:
+        """Handle the warm-cache action.
+
+        The URLs are fetched through nginx from the workload container, so that they are
+        cached as for any client. Progress is streamed to the action log.
+
+        Args:
+            event: the Juju action event fired when the action executes.
+        """
+        urls = event.params["urls"].split()
+        command = [
+            "python3",
+            f"{HELPERS_PATH}/cache_warmer.py",
+            self._make_ingress_config()["service-hostname"],
+            *urls,
+            "--port",
+            str(CONTAINER_PORT),
+            "--concurrency",
+            str(event.params["concurrency"]),
+            "--rate",
+            str(event.params["rate"]),
+        ]
+        if not urls:
+            command += ["--log-path", self.ACCESS_LOG_PATH, "--window", event.params["window"]]
+            command += ["--limit", str(event.params["limit"])]
+            if event.params["strip-query"]:
+                command.append("--strip-query")
+        try:
+            stdout = self._run_helper_with_progress(event, command)
+        except (ops.pebble.APIError, ops.pebble.ChangeError, ops.pebble.ExecError) as exc:
+            logger.exception("Failed to warm the cache")
+            event.fail(f"Failed to warm the cache: {exc}")
+            return
+        warmed = json.loads(stdout)
+        results = {key: warmed[key] for key in ("requests", "hits", "misses", "failures")}
+        if warmed["failed"]:
+            results["failed"] = "\n".join(warmed["failed"])
+        event.set_results(results)
+
+    def _run_helper_with_progress(self, event: ActionEvent, command: list[str]) -> str:
+        """Run a helper in the workload container, logging its progress to the action.
+
+        Args:
+            event: the Juju action event the helper runs for.
+            command: The command running the helper, which reports progress on stderr.
 
         Returns:
-            an IP address.
+            The output of the helper.
+        """
+        container = self.unit.get_container(CONTAINER_NAME)
+        self._push_helpers(container)
+        process = container.exec(command)
+        if process.stderr is not None:
+            for line in process.stderr:
+                event.log(line.rstrip("\n"))
+        stdout, _ = process.wait_output()
+        return stdout
 
-        Raises:
-            ValueError: if the method encounters an empty line,
-                filtering should happen in filter_lines anyway.
+    def _report_cache_inventory_action(self, event: ActionEvent) -> None:
+        """Handle the report-cache-inventory action.
+
+        Args:
+            event: the Juju action event fired when the action executes.
         """
-        if line:
-            return line.split()[0]
-        raise ValueError
+        if not self.config.get("cache_index"):
+            event.fail("The cache index is disabled, set the cache_index config to enable it")
+            return
+        command = [
+            "python3",
+            f"{HELPERS_PATH}/cache_index.py",
+            "--db",
+            CACHE_INDEX_PATH,
+            "inventory",
+            "--prefix",
+            event.params["prefix"],
+            "--group-by",
+            event.params["group-by"],
+            "--depth",
+            str(event.params["depth"]),
+            "--limit",
+            str(event.params["limit"]),
+        ]
+        container = self.unit.get_container(CONTAINER_NAME)
+        try:
+            self._push_helpers(container)
+            stdout, _ = container.exec(command).wait_output()
+        except (ops.pebble.APIError, ops.pebble.ChangeError, ops.pebble.ExecError) as exc:
+            logger.exception("Failed to report the cache inventory")
+            event.fail(f"Failed to query the cache index: {exc}")
+            return
+        # The host of the cache keys is the hashed upstream name of the site.
+        hosts = self._cache_key_hosts() if event.params["group-by"] == "host" else {}
+        rows = [
+            [
+                hosts.get(group["group"], group["group"]),
+                group["entries"],
+                group["bytes"],
+                group["expired"],
+            ]
+            for group in json.loads(stdout)
+        ]
+        event.set_results(
+            {
+                "inventory": tabulate(
+                    rows,
+                    headers=[event.params["group-by"].capitalize(), "Entries", "Bytes", "Expired"],
+                    tablefmt="grid",
+                )
+            }
+        )
 
-    def _report_visits_by_ip(self) -> list[tuple[str, int]]:
-        """Report requests to nginx grouped and ordered by IP and report action result.
+    def _cache_key_hosts(self) -> dict[str, str]:
+        """Map the host part of the cache keys to the names of the sites.
 
         Returns:
-            A list of tuples composed of an IP address and the number of visits to that IP.
+            The site names by scheme and upstream name, the host part of their cache keys.
+        """
+        env_config = self._make_env_config()
+        if env_config is None:
+            return {}
+        try:
+            sites_env_config = self._make_sites_env_config(env_config)
+        except ValueError:
+            sites_env_config = []
+        hosts = {}
+        for site_env_config in [env_config, *sites_env_config]:
+            backend = urlsplit(site_env_config["NGINX_BACKEND"])
+            hosts[f"{backend.scheme}{backend.netloc}"] = site_env_config["CONTENT_CACHE_SITE"]
+        return hosts
+
+    @staticmethod
+    def _format_ratio(ratio: float | None) -> str:
+        """Format a ratio reported by the log_report helper as a percentage.
+
+        Args:
+            ratio: Ratio between 0 and 1, or None if undefined.
+
+        Returns:
+            The ratio as a percentage, or "-" if undefined.
+        """
+        return "-" if ratio is None else f"{ratio:.2%}"
+
+    def _run_log_report(self, report: str, *args: str) -> Any:
+        """Run a report over the access log in the workload container.
+
+        Args:
+            report: Name of the report, as accepted by the log_report helper.
+            args: Extra arguments for the report.
+
+        Returns:
+            The decoded JSON output of the report.
         """
         container = self.unit.get_container(CONTAINER_NAME)
-        reversed_lines = filter(None, readlines_reverse(container.pull(self.ACCESS_LOG_PATH)))
-        line_list = itertools.takewhile(self._filter_lines, reversed_lines)
-        ip_list = map(self._get_ip, line_list)
+        self._push_helpers(container)
+        process = container.exec(
+            ["python3", f"{HELPERS_PATH}/log_report.py", report, self.ACCESS_LOG_PATH, *args]
+        )
+        stdout, _ = process.wait_output()
+        return json.loads(stdout)
 
-        return Counter(ip_list).most_common()
+    @staticmethod
+    def _push_helpers(container: Container) -> None:
+        """Push the helper modules run by the charm into the workload container.
+
+        Args:
+            container: The content-cache workload container.
+        """
+        src_path = Path(__file__).parent
+        for module in HELPER_MODULES:
+            container.push(
+                f"{HELPERS_PATH}/{module}",
+                (src_path / module).read_text(encoding="utf-8"),
+                make_dirs=True,
+            )
 
     def _on_upgrade_charm(self, event: UpgradeCharmEvent) -> None:
         """Handle upgrade_charm event and reconfigure workload container.
@@ -223,40 +618,242 @@ class ContentCacheCharm(CharmBase):
             logger.warning(msg)
             self.unit.status = BlockedStatus(msg)
             return
+        invalid = self._invalid_charm_configs()
+        if invalid:
+            msg = f"Invalid config(s): {', '.join(invalid)}"
+            logger.warning(msg)
+            self.unit.status = BlockedStatus(msg)
+            return
         env_config = self._make_env_config()
         if env_config is None:
             logger.debug("Ingress hasn't been configured yet, waiting")
             event.defer()
             return
         pebble_config = self._make_pebble_config(env_config)
-        nginx_config = self._make_nginx_config(env_config)
+        nginx_configs = self._make_nginx_configs(env_config)
         exporter_config = self._get_nginx_prometheus_exporter_pebble_config()
+        cache_index_config = self._get_cache_index_pebble_config()
+
+        layers = {
+            CONTAINER_NAME: pebble_config,
+            EXPORTER_CONTAINER_NAME: exporter_config,
+            CACHE_INDEX_NAME: cache_index_config,
+        }
 
         container = self.unit.get_container(CONTAINER_NAME)
-        if container.can_connect():
-            msg = "Updating Nginx site config"
-            logger.info(msg)
-            self.unit.status = MaintenanceStatus(msg)
-            container.push("/etc/nginx/sites-enabled/default", nginx_config)
-            container.make_dir(CACHE_PATH, make_parents=True)
-
-            services = container.get_plan().to_dict().get("services", {})
-            if services != pebble_config["services"]:
-                msg = "Updating pebble layer config"
-                logger.info(msg)
-                self.unit.status = MaintenanceStatus(msg)
-                container.add_layer(CONTAINER_NAME, pebble_config, combine=True)  # type: ignore[arg-type]
-                container.add_layer(EXPORTER_CONTAINER_NAME, exporter_config, combine=True)  # type: ignore[arg-type]
-                container.pebble.replan_services()
-        else:
+        if not container.can_connect():
             self.unit.status = WaitingStatus("Waiting for Pebble to start")
             event.defer()
             return
 
+        # Skip the other Pebble calls when the last applied config is still current.
+        workload_hash = self._workload_hash(nginx_configs, layers)
+        if workload_hash == self._stored.workload_hash:
+            logger.debug("Workload container already configured")
+            self._publish_peer_data(ready=True)
+            self.unit.status = ActiveStatus("Ready")
+            return
+
+        # Only store the hash once nginx runs the new config, so a failure is retried.
+        try:
+            self._update_workload(container, nginx_configs, layers)
+        except ops.pebble.ExecError as exc:
+            self._publish_peer_data(ready=False)
+            if UNRESOLVED_UPSTREAM_ERROR in str(exc.stderr):
+                # The DNS records of the units of a just joined nginx-proxy relation may
+                # not exist yet, so wait for them rather than block on a valid config.
+                logger.warning("Backend not resolvable yet, retrying: %s", exc.stderr)
+                self.unit.status = WaitingStatus("Waiting for the backend addresses to resolve")
+                event.defer()
+                return
+            logger.error("Invalid nginx config, keeping the previous one: %s", exc.stderr)
+            self.unit.status = BlockedStatus("Invalid nginx config, see the debug log")
+            return
+        self._stored.workload_hash = workload_hash
+        self._publish_peer_data(ready=True)
+
         msg = "Ready"
         logger.info(msg)
         self.unit.status = ActiveStatus(msg)
 
+    def _make_nginx_configs(self, env_config: dict) -> dict[str, str]:
+        """Render the nginx config files, logging the units joining or leaving the shards.
+
+        Args:
+            env_config: Charm's environment config
+
+        Returns:
+            The content of the nginx config files by path.
+        """
+        nginx_configs = {NGINX_CONFIG_PATH: self._make_nginx_config(env_config)}
+        shards = self._shard_addresses()
+        previous_shards = str(self._stored.shard_addresses).split()
+        if shards != previous_shards:
+            joined = sorted(set(shards) - set(previous_shards))
+            departed = sorted(set(previous_shards) - set(shards))
+            logger.info("Cache shards joined: %s, departed: %s", joined, departed)
+            self._stored.shard_addresses = " ".join(shards)
+        if shards:
+            nginx_configs[NGINX_SHARDS_PATH] = self._make_shards_config(
+                env_config["NGINX_KEYS_ZONE"], shards, env_config["NGINX_CACHE_KEY_URI"]
+            )
+        return nginx_configs
+
+    def _workload_hash(self, nginx_configs: dict[str, str], layers: dict[str, Mapping]) -> str:
+        """Hash everything applied to the workload container by configure_workload_container.
+
+        Args:
+            nginx_configs: The rendered nginx config files by path.
+            layers: The charm layers by name.
+
+        Returns:
+            A SHA-256 hex digest of the nginx configs, layers, cache paths and helper modules.
+        """
+        src_path = Path(__file__).parent
+        applied = {
+            "nginx_configs": nginx_configs,
+            "layers": layers,
+            "cache_paths": self._cache_paths(),
+            "helpers": {
+                module: (src_path / module).read_text(encoding="utf-8")
+                for module in HELPER_MODULES
+            },
+        }
+        encoded = json.dumps(applied, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _update_workload(
+        self, container: Container, nginx_configs: dict[str, str], layers: dict[str, Mapping]
+    ) -> None:
+        """Apply the nginx configs and the Pebble layers to the workload container.
+
+        Only the changed nginx config files are pushed. nginx is restarted by the replan
+        only when its own service changes; otherwise changed nginx config files are tested
+        and nginx is reloaded, keeping connections and the cache, even when the replan
+        restarted other services.
+
+        Args:
+            container: The content-cache workload container.
+            nginx_configs: The rendered nginx config files by path.
+            layers: The charm layers by name.
+
+        Raises:
+            ExecError: if nginx rejected the new config, the previous one being restored.
+        """
+        previous_nginx_configs: dict[str, str | None] = {}
+        for path, nginx_config in nginx_configs.items():
+            previous_nginx_config = self._pull_nginx_config(container, path)
+            if previous_nginx_config == nginx_config:
+                continue
+            msg = f"Updating Nginx config {path}"
+            logger.info(msg)
+            self.unit.status = MaintenanceStatus(msg)
+            container.push(path, nginx_config, make_dirs=True)
+            previous_nginx_configs[path] = previous_nginx_config
+        for cache_path in self._cache_paths():
+            container.make_dir(cache_path, make_parents=True)
+        self._push_helpers(container)
+
+        changed_services = self._changed_services(container, layers)
+        if changed_services:
+            msg = "Updating pebble layer config"
+            logger.info(msg)
+            self.unit.status = MaintenanceStatus(msg)
+            for name, layer in layers.items():
+                container.add_layer(name, layer, combine=True)  # type: ignore[arg-type]
+            container.pebble.replan_services()
+        if not previous_nginx_configs or CONTAINER_NAME in changed_services:
+            return
+        if not self._is_nginx_running(container):
+            # The replan starts the stopped nginx service with the new config.
+            container.pebble.replan_services()
+            return
+        try:
+            self._reload_nginx(container)
+        except ops.pebble.ExecError:
+            self._restore_nginx_configs(container, previous_nginx_configs)
+            raise
+
+    @staticmethod
+    def _restore_nginx_configs(
+        container: Container, previous_nginx_configs: dict[str, str | None]
+    ) -> None:
+        """Put back the nginx config files replaced by a rejected config.
+
+        Args:
+            container: The content-cache workload container.
+            previous_nginx_configs: The previous content of the changed files by path, None
+                for the files that did not exist.
+        """
+        for path, previous_nginx_config in previous_nginx_configs.items():
+            if previous_nginx_config is None:
+                container.remove_path(path)
+            else:
+                container.push(path, previous_nginx_config)
+
+    @staticmethod
+    def _pull_nginx_config(container: Container, path: str) -> str | None:
+        """Read an nginx config file currently in the workload container.
+
+        Args:
+            container: The content-cache workload container.
+            path: The config file.
+
+        Returns:
+            The config, or None if it was not pushed yet.
+        """
+        try:
+            return container.pull(path).read()
+        except ops.pebble.PathError:
+            return None
+
+    @staticmethod
+    def _changed_services(container: Container, layers: dict[str, Mapping]) -> set[str]:
+        """List the services of the charm layers that differ from the Pebble plan.
+
+        Args:
+            container: The content-cache workload container.
+            layers: The charm layers by name.
+
+        Returns:
+            The services missing from the plan or defined differently, which a replan
+            restarts.
+        """
+        services = container.get_plan().to_dict().get("services", {})
+        return {
+            name
+            for layer in layers.values()
+            for name, service in layer.get("services", {}).items()
+            if services.get(name) != service
+        }
+
+    @staticmethod
+    def _is_nginx_running(container: Container) -> bool:
+        """Check whether the nginx service runs in the workload container.
+
+        Args:
+            container: The content-cache workload container.
+
+        Returns:
+            Whether the nginx service is running.
+        """
+        services = container.get_services(CONTAINER_NAME)
+        return CONTAINER_NAME in services and services[CONTAINER_NAME].is_running()
+
+    @staticmethod
+    def _reload_nginx(container: Container) -> None:
+        """Test the nginx config and reload nginx, without dropping connections or the cache.
+
+        nginx is the main process of the service, so SIGHUP is the same as "nginx -s reload":
+        new workers start with the new config while the old ones finish their requests.
+
+        Args:
+            container: The content-cache workload container.
+        """
+        container.exec(["nginx", "-t"]).wait_output()
+        container.send_signal("SIGHUP", CONTAINER_NAME)
+        logger.info("Reloaded nginx")
+
     def _generate_keys_zone(self, name):
         """Generate hashed name to be used by Nginx's key zone.
 
@@ -270,9 +867,23 @@ class ContentCacheCharm(CharmBase):
         hashed_name = hashed_value.hexdigest()[0:12]
         return f"{hashed_name}-cache"
 
+    def _generate_upstream_name(self, name):
+        """Generate hashed name to be used by the Nginx upstream of the backend.
+
+        Args:
+            name: Site name to be encoded.
+
+        Returns:
+            A hashed name to be used by the Nginx upstream.
+        """
+        return self._generate_keys_zone(name).replace("-cache", "-backend")
+
     def _get_nginx_prometheus_exporter_pebble_config(self) -> ops.pebble.LayerDict:
         """Generate pebble config for the nginx-prometheus-exporter container.
 
+        Besides the stub_status exporter, the layer runs the log_exporter helper, which
+        tails the access log and exports requests, bytes and times by cache status.
+
         Returns:
             Pebble layer config for the nginx-prometheus-exporter layer.
         """
@@ -290,6 +901,16 @@ class ContentCacheCharm(CharmBase):
                     "startup": "enabled",
                     "requires": [CONTAINER_NAME],
                 },
+                LOG_EXPORTER_NAME: {
+                    "override": "replace",
+                    "summary": "Access log Prometheus exporter",
+                    "command": (
+                        f"python3 {HELPERS_PATH}/log_exporter.py {self.ACCESS_LOG_PATH}"
+                        f" --port {LOG_EXPORTER_PORT}"
+                    ),
+                    "startup": "enabled",
+                    "requires": [CONTAINER_NAME],
+                },
             },
             "checks": {
                 "nginx-exporter-up": {
@@ -297,6 +918,38 @@ class ContentCacheCharm(CharmBase):
                     "level": "alive",
                     "http": {"url": "http://localhost:9113/metrics"},
                 },
+                "log-exporter-up": {
+                    "override": "replace",
+                    "level": "alive",
+                    "http": {"url": f"http://localhost:{LOG_EXPORTER_PORT}/metrics"},
+                },
+            },
+        }
+
+    def _get_cache_index_pebble_config(self) -> ops.pebble.LayerDict:
+        """Generate pebble config for the cache index service.
+
+        The service runs the cache_index helper, which indexes the cache directories and
+        follows their changes with inotify. It is only started when the cache_index config
+        is enabled; disabling it stops the service on the next replan.
+
+        Returns:
+            Pebble layer config for the cache index layer.
+        """
+        cache_paths = self._cache_paths()
+        return {
+            "summary": "Cache index",
+            "description": "Index of the nginx cache files",
+            "services": {
+                CACHE_INDEX_NAME: {
+                    "override": "replace",
+                    "summary": "Cache index",
+                    "command": (
+                        f"python3 {HELPERS_PATH}/cache_index.py --db {CACHE_INDEX_PATH}"
+                        f" watch {' '.join(cache_paths)}"
+                    ),
+                    "startup": "enabled" if self.config.get("cache_index") else "disabled",
+                },
             },
         }
 
@@ -333,6 +986,14 @@ class ContentCacheCharm(CharmBase):
         if tls_secret_name:
             ingress["tls-secret-name"] = tls_secret_name
 
+        try:
+            sites = self._sites()
+        except ValueError:
+            # Reported by configure_workload_container.
+            sites = []
+        if sites:
+            ingress["additional-hostnames"] = ",".join(site["site"] for site in sites)
+
         return ingress
 
     def _make_env_config(self, domain="svc.cluster.local") -> dict | None:
@@ -356,13 +1017,13 @@ class ContentCacheCharm(CharmBase):
             svc_name = relation.data[relation.app].get("service-name")
             svc_port = relation.data[relation.app].get("service-port")
             backend_site_name = relation.data[relation.app].get("service-hostname")
-            clients = []
-            for peer in relation.units:
+            servers = []
+            for peer in sorted(relation.units, key=lambda unit: unit.name):
                 unit_name = peer.name.replace("/", "-")
                 service_url = f"{unit_name}.{svc_name}-endpoints.{self.model.name}.{domain}"
-                clients.append(f"http://{service_url}:{svc_port}")
-            # XXX: Will need to deal with multiple units at some point
-            backend = clients[0]
+                servers.append(f"{service_url}:{svc_port}")
+            backend = f"http://{servers[0]}"
+            scheme, path = "http", ""
         elif relation:
             return None
         else:
@@ -373,6 +1034,8 @@ class ContentCacheCharm(CharmBase):
             if not backend_site_name:
                 backend_site_name = urlparse(backend).hostname
             site = str(config["site"]) if config.get("site") else self.app.name
+            scheme, address, path = self._parse_backend(backend)
+            servers = [address]
 
         cache_all_configs = ""
         if not config["cache_all"]:
@@ -384,6 +1047,34 @@ class ContentCacheCharm(CharmBase):
         if config.get("proxy_cache_revalidate", False):
             proxy_cache_revalidate = "on"
 
+        slice_size = config.get("cache_slice_size")
+        cache_key_maps, cache_key_uri, cache_key = self._make_cache_key(bool(slice_size))
+        cache_slice = ""
+        if slice_size:
+            cache_slice = self._make_slice_config(
+                str(slice_size), str(config["cache_valid"]), cache_key
+            )
+
+        cache_loader = (
+            f"loader_files={config.get('cache_loader_files', 100)}"
+            f" loader_sleep={config.get('cache_loader_sleep', '50ms')}"
+            f" loader_threshold={config.get('cache_loader_threshold', '200ms')}"
+        )
+        cache_max_size = self._cache_max_size()
+        keys_zone = self._generate_keys_zone(site)
+        proxy_cache, cache_tiers = self._make_cache_tiers(
+            keys_zone, self._cache_tiers(), cache_loader
+        )
+
+        proxy_cache_lock = "on" if config.get("proxy_cache_lock", False) else "off"
+        proxy_cache_background_update = (
+            "on" if config.get("proxy_cache_background_update", False) else "off"
+        )
+
+        upstream = self._generate_upstream_name(site)
+
+        shards = self._shard_addresses()
+
         env_config = {
             "CONTAINER_PORT": CONTAINER_PORT,
             "CONTENT_CACHE_BACKEND": backend,
@@ -392,25 +1083,813 @@ class ContentCacheCharm(CharmBase):
             "JUJU_POD_NAME": self.unit.name,
             "JUJU_POD_NAMESPACE": self.model.name,
             "JUJU_POD_SERVICE_ACCOUNT": self.app.name,
-            # Include nginx / charm configs as environment variables
-            # to pass to the pebble services and ensure it restarts
-            # nginx on changes.
-            "NGINX_BACKEND": backend,
+            # Nginx / charm configs, rendered into the nginx config template.
+            "NGINX_BACKEND": f"{scheme}://{upstream}{path}",
             "NGINX_CACHE_ALL": cache_all_configs,
             "NGINX_BACKEND_SITE_NAME": backend_site_name,
             "NGINX_CACHE_INACTIVE_TIME": config.get("cache_inactive_time", "10m"),
-            "NGINX_CACHE_MAX_SIZE": config.get("cache_max_size", "10G"),
+            "NGINX_CACHE_KEY": (
+                f"\n        proxy_cache_key {cache_key};"
+                if not slice_size and cache_key != DEFAULT_CACHE_KEY
+                else ""
+            ),
+            "NGINX_CACHE_KEY_MAPS": cache_key_maps,
+            "NGINX_CACHE_KEY_URI": cache_key_uri,
+            "NGINX_CACHE_LOADER": cache_loader,
+            "NGINX_CACHE_MAX_SIZE": cache_max_size,
             "NGINX_CACHE_PATH": CACHE_PATH,
+            "NGINX_CACHE_BACKGROUND_UPDATE": proxy_cache_background_update,
+            "NGINX_CACHE_LOCK": proxy_cache_lock,
+            "NGINX_CACHE_LOCK_TIMEOUT": config.get("proxy_cache_lock_timeout", "5s"),
+            "NGINX_CACHE_MIN_USES": config.get("proxy_cache_min_uses", 1),
+            "NGINX_CACHE_PORT": SHARD_PORT if shards else CONTAINER_PORT,
             "NGINX_CACHE_REVALIDATE": proxy_cache_revalidate,
+            "NGINX_CACHE_RULES": self._make_cache_rules(
+                self._cache_rules(),
+                scheme,
+                upstream,
+                path,
+                slicing=bool(slice_size),
+                cache_all=bool(config["cache_all"]),
+            ),
+            "NGINX_CACHE_SLICE": cache_slice,
+            "NGINX_CACHE_TIERS": cache_tiers,
             "NGINX_CACHE_USE_STALE": config["cache_use_stale"],
             "NGINX_CACHE_VALID": config["cache_valid"],
             "NGINX_CLIENT_MAX_BODY_SIZE": client_max_body_size,
-            "NGINX_KEYS_ZONE": self._generate_keys_zone(site),
+            "NGINX_KEYS_ZONE": keys_zone,
+            "NGINX_KEYS_ZONE_SIZE": self._cache_keys_zone_size(cache_max_size),
+            "NGINX_PROXY_CACHE": proxy_cache,
+            "NGINX_SHARDING": self._make_sharding_config(
+                keys_zone, site, shards, str(client_max_body_size)
+            ),
             "NGINX_SITE_NAME": site,
+            "NGINX_UPSTREAM": upstream,
+            "NGINX_UPSTREAM_CONFIG": self._make_upstream_config(servers),
         }
 
         return env_config
 
+    @staticmethod
+    def _parse_backend(backend: str) -> tuple[str, str, str]:
+        """Split a backend URL into the parts the nginx config is rendered from.
+
+        Args:
+            backend: The backend URL.
+
+        Returns:
+            The scheme, the address as host:port, and the path of the backend.
+        """
+        parsed = urlparse(backend)
+        scheme = parsed.scheme
+        # Keep the brackets of IPv6 addresses, but not the user info.
+        address = parsed.netloc.rpartition("@")[2]
+        if parsed.port is None:
+            address = f"{address}:{443 if scheme == 'https' else 80}"
+        return scheme, address, parsed.path
+
+    def _cache_storage_capacity(self) -> int | None:
+        """Return the capacity of the cache storage.
+
+        The storage is mounted both in the workload container, at the cache path, and in
+        the charm container.
+
+        Returns:
+            The size of the cache storage filesystem in bytes, or None if it is not attached.
+        """
+        storages = self.model.storages[CACHE_STORAGE_NAME]
+        if not storages:
+            return None
+        try:
+            stat = os.statvfs(storages[0].location)
+        except OSError:
+            logger.exception("Failed to read the capacity of the cache storage")
+            return None
+        return stat.f_frsize * stat.f_blocks
+
+    def _cache_max_size(self) -> str:
+        """Return the maximum size of the main cache.
+
+        The site caches are budgeted within the cache storage too, so the main cache gets
+        the share of the storage they leave.
+
+        Returns:
+            The configured cache_max_size, capped to the share of the cache storage nginx may
+            fill, or that share of the storage if cache_max_size is not set.
+
+        Raises:
+            ValueError: if the sites config is malformed.
+        """
+        configured = str(self.model.config.get("cache_max_size") or "")
+        capacity = self._cache_storage_capacity()
+        if capacity is None:
+            return configured or DEFAULT_CACHE_MAX_SIZE
+        sites_max_size = sum(parse_size(site["cache_max_size"]) for site in self._sites())
+        usable_size = int(capacity * CACHE_STORAGE_USAGE) - sites_max_size
+        usable = f"{usable_size // SIZE_UNITS['m']}m"
+        if not configured:
+            return usable
+        if parse_size(configured) > parse_size(usable):
+            logger.warning(
+                "cache_max_size %s exceeds the cache storage, using %s instead",
+                configured,
+                usable,
+            )
+            return usable
+        return configured
+
+    def _keys_zone_size(self, max_size: str) -> str:
+        """Return the size of the keys zone needed to index a cache.
+
+        Args:
+            max_size: Maximum size of the cache.
+
+        Returns:
+            The keys zone size, in megabytes, holding the keys of max_size of objects of
+            the configured average size.
+
+        Raises:
+            ValueError: if max_size or cache_average_object_size is malformed.
+        """
+        average_size = str(
+            self.model.config.get("cache_average_object_size") or DEFAULT_AVERAGE_OBJECT_SIZE
+        )
+        average = parse_size(average_size)
+        if not average:
+            raise ValueError(f"cache_average_object_size {average_size!r} must not be 0")
+        keys = parse_size(max_size) / average
+        return f"{max(1, math.ceil(keys / KEYS_PER_MEGABYTE))}m"
+
+    def _cache_keys_zone_size(self, max_size: str) -> str:
+        """Return the size of the keys zone of the main cache.
+
+        Args:
+            max_size: Maximum size of the main cache.
+
+        Returns:
+            The configured cache_keys_zone_size, or the size needed to index the cache.
+        """
+        needed = self._keys_zone_size(max_size)
+        configured = self.model.config.get("cache_keys_zone_size")
+        if not configured:
+            return needed
+        if parse_size(str(configured)) * 2 < parse_size(needed):
+            logger.warning(
+                "cache_keys_zone_size %s is undersized: about %s are needed to index %s of"
+                " cached objects, entries will be evicted before the cache is full",
+                configured,
+                needed,
+                max_size,
+            )
+        return str(configured)
+
+    def _cache_tiers(self) -> list[dict[str, str]]:
+        """Parse the cache tiers defined in addition to the main cache.
+
+        Returns:
+            Per tier, its name, path, max_size, inactive time, levels, keys zone size and
+            URI pattern, with defaults filled in.
+
+        Raises:
+            ValueError: if the cache_tiers config is malformed.
+        """
+        config = self.model.config
+        try:
+            tiers = yaml.safe_load(str(config.get("cache_tiers") or "")) or []
+        except yaml.YAMLError as exc:
+            raise ValueError(f"cache_tiers is not valid YAML: {exc}") from exc
+        if not isinstance(tiers, list) or not all(isinstance(tier, dict) for tier in tiers):
+            raise ValueError("cache_tiers must be a list of mappings")
+        defaults = {
+            "inactive": str(config.get("cache_inactive_time", "10m")),
+            "levels": "1:2",
+        }
+        parsed = []
+        for tier in tiers:
+            tier = {**defaults, **{key: str(value) for key, value in tier.items()}}
+            unknown = set(tier) - {"name", "path", "max_size", "uri", "keys_zone_size", *defaults}
+            if unknown:
+                raise ValueError(f"unknown cache tier key(s): {', '.join(sorted(unknown))}")
+            if not all(key in tier for key in ("name", "max_size", "uri")):
+                raise ValueError("cache tiers need a name, a max_size and a uri")
+            tier.setdefault("path", f"{Path(CACHE_PATH).parent}/{tier['name']}")
+            checks = {
+                "name": CACHE_TIER_NAME_RE,
+                "max_size": SIZE_RE,
+                "inactive": TIME_RE,
+                "levels": CACHE_TIER_LEVELS_RE,
+                "keys_zone_size": SIZE_RE,
+            }
+            for key, pattern in checks.items():
+                if key in tier and not pattern.match(tier[key]):
+                    raise ValueError(f"invalid cache tier {key}: {tier[key]}")
+            tier.setdefault("keys_zone_size", self._keys_zone_size(tier["max_size"]))
+            if '"' in tier["uri"] or tier["uri"].endswith("\\"):
+                raise ValueError(f"invalid cache tier uri: {tier['uri']}")
+            parsed.append(tier)
+        if len({tier["name"] for tier in parsed}) != len(parsed):
+            raise ValueError("cache tier names must be unique")
+        return parsed
+
+    @staticmethod
+    def _make_cache_tiers(
+        keys_zone: str, tiers: list[dict[str, str]], cache_loader: str
+    ) -> tuple[str, str]:
+        """Generate the cache paths of the cache tiers and the map routing requests to them.
+
+        Requests are routed by URI since the cache zone is chosen before the response, and
+        so its size, is known. The first tier whose pattern matches the URI is used, the
+        main cache otherwise. The URI is the path of $request_uri rather than $uri, which
+        the rewrite of the cache rule locations changes before the zone is looked up.
+
+        Args:
+            keys_zone: Keys zone of the main cache.
+            tiers: The cache tiers, as returned by _cache_tiers.
+            cache_loader: Cache loader parameters of the cache paths.
+
+        Returns:
+            The value of the proxy_cache directive, and the proxy_cache_path and map
+            directives of the tiers, each on a new line.
+        """
+        if not tiers:
+            return keys_zone, ""
+        name = keys_zone.split("-", 1)[0]
+        variable = f"$cache_zone_{name}"
+        lines = []
+        for tier in tiers:
+            lines.append(
+                f"proxy_cache_path {tier['path']} use_temp_path=off levels={tier['levels']}"
+                f" keys_zone={keys_zone}-{tier['name']}:{tier['keys_zone_size']}"
+                f" inactive={tier['inactive']} max_size={tier['max_size']} {cache_loader};"
+            )
+        lines += ["", f"map $request_uri $cache_tier_uri_{name} {{", '    "~^([^?]*)" $1;', "}"]
+        lines.append(f"map $cache_tier_uri_{name} {variable} {{")
+        lines.append(f"    default {keys_zone};")
+        for tier in tiers:
+            lines.append(f'    "~{tier["uri"]}" {keys_zone}-{tier["name"]};')
+        lines.append("}")
+        return variable, "".join(f"\n{line}" for line in lines)
+
+    def _sites(self) -> list[dict[str, Any]]:
+        """Parse the sites served in addition to the main site.
+
+        Returns:
+            Per site, its name, backend, backend site name, cache path, cache_max_size, keys
+            zone size and cache policy, with defaults filled in from the charm config.
+
+        Raises:
+            ValueError: if the sites config is malformed.
+        """
+        config = self.model.config
+        try:
+            sites = yaml.safe_load(str(config.get("sites") or "")) or []
+        except yaml.YAMLError as exc:
+            raise ValueError(f"sites is not valid YAML: {exc}") from exc
+        if not isinstance(sites, list) or not all(isinstance(site, dict) for site in sites):
+            raise ValueError("sites must be a list of mappings")
+        defaults = {option: config.get(option) for option in SITE_POLICY_OPTIONS}
+        parsed = [self._parse_site({**defaults, **site}) for site in sites]
+        names = [site["site"] for site in parsed]
+        if len(set(names)) != len(names) or config.get("site") in names:
+            raise ValueError("site names must be unique, and differ from the site config")
+        sites_max_size = sum(parse_size(site["cache_max_size"]) for site in parsed)
+        capacity = self._cache_storage_capacity() if parsed else None
+        if capacity is not None and sites_max_size >= capacity * CACHE_STORAGE_USAGE:
+            raise ValueError("the site caches leave no room for the main cache in the storage")
+        return parsed
+
+    def _parse_site(self, site: dict[str, Any]) -> dict[str, Any]:
+        """Validate a site of the sites config and fill in its defaults.
+
+        Args:
+            site: The site, with the cache policy of the charm config as defaults.
+
+        Returns:
+            The site, with its backend site name, path and keys zone size set.
+
+        Raises:
+            ValueError: if the site is malformed.
+        """
+        unknown = set(site) - {
+            "site",
+            "backend",
+            "backend_site_name",
+            "cache_max_size",
+            "keys_zone_size",
+            "path",
+            *SITE_POLICY_OPTIONS,
+        }
+        if unknown:
+            raise ValueError(f"unknown site key(s): {', '.join(sorted(unknown))}")
+        if not all(site.get(key) for key in ("site", "backend", "cache_max_size")):
+            raise ValueError("sites need a site, a backend and a cache_max_size")
+        for key in ("site", "backend", "backend_site_name", "cache_max_size", "path"):
+            if key in site:
+                site[key] = str(site[key])
+        if not SITE_NAME_RE.match(site["site"]):
+            raise ValueError(f"invalid site: {site['site']}")
+        backend = urlparse(site["backend"])
+        if backend.scheme not in ("http", "https") or not backend.hostname:
+            raise ValueError(f"invalid site backend: {site['backend']}")
+        checks = {
+            "cache_max_size": SIZE_RE,
+            "keys_zone_size": SIZE_RE,
+            "cache_inactive_time": TIME_RE,
+        }
+        for key, pattern in checks.items():
+            if key in site and not pattern.match(str(site[key])):
+                raise ValueError(f"invalid site {key}: {site[key]}")
+        site.setdefault("backend_site_name", backend.hostname)
+        site.setdefault("path", f"{Path(CACHE_PATH).parent}/sites/{site['site']}")
+        site.setdefault("keys_zone_size", self._keys_zone_size(site["cache_max_size"]))
+        return site
+
+    def _make_sites_env_config(self, env_config: dict) -> list[dict]:
+        """Derive the environment config of each site of the sites config.
+
+        Each site is rendered from the nginx config template like the main site, with its
+        own backend upstream, cache zone and cache policy, and without cache tiers or
+        sharding, which only apply to the main site.
+
+        Args:
+            env_config: Charm's environment config, of the main site.
+
+        Returns:
+            The environment config of each site.
+        """
+        slice_size = self.model.config.get("cache_slice_size")
+        cache_key = self._make_cache_key(bool(slice_size))[2]
+        sites_env_config = []
+        for site in self._sites():
+            scheme, address, path = self._parse_backend(site["backend"])
+            keys_zone = self._generate_keys_zone(site["site"])
+            upstream = self._generate_upstream_name(site["site"])
+            cache_valid = str(site["cache_valid"])
+            cache_slice = ""
+            if slice_size:
+                cache_slice = self._make_slice_config(str(slice_size), cache_valid, cache_key)
+            sites_env_config.append(
+                {
+                    **env_config,
+                    "CONTENT_CACHE_BACKEND": site["backend"],
+                    "CONTENT_CACHE_SITE": site["site"],
+                    "NGINX_BACKEND": f"{scheme}://{upstream}{path}",
+                    "NGINX_BACKEND_SITE_NAME": site["backend_site_name"],
+                    "NGINX_CACHE_ALL": (
+                        "" if site["cache_all"] else "proxy_ignore_headers Cache-Control Expires"
+                    ),
+                    "NGINX_CACHE_INACTIVE_TIME": site["cache_inactive_time"],
+                    # The maps of the cache key are defined once, with the main site.
+                    "NGINX_CACHE_KEY_MAPS": "",
+                    "NGINX_CACHE_MAX_SIZE": site["cache_max_size"],
+                    "NGINX_CACHE_PATH": site["path"],
+                    "NGINX_CACHE_PORT": CONTAINER_PORT,
+                    "NGINX_CACHE_REVALIDATE": "on" if site["proxy_cache_revalidate"] else "off",
+                    "NGINX_CACHE_RULES": self._make_cache_rules(
+                        self._cache_rules(),
+                        scheme,
+                        upstream,
+                        path,
+                        slicing=bool(slice_size),
+                        cache_all=bool(site["cache_all"]),
+                    ),
+                    "NGINX_CACHE_SLICE": cache_slice,
+                    "NGINX_CACHE_TIERS": "",
+                    "NGINX_CACHE_USE_STALE": site["cache_use_stale"],
+                    "NGINX_CACHE_VALID": cache_valid,
+                    "NGINX_KEYS_ZONE": keys_zone,
+                    "NGINX_KEYS_ZONE_SIZE": site["keys_zone_size"],
+                    "NGINX_PROXY_CACHE": keys_zone,
+                    "NGINX_SHARDING": "",
+                    "NGINX_SITE_NAME": site["site"],
+                    "NGINX_UPSTREAM": upstream,
+                    "NGINX_UPSTREAM_CONFIG": self._make_upstream_config([address]),
+                }
+            )
+        return sites_env_config
+
+    def _cache_rules(self) -> list[dict[str, Any]]:
+        """Parse the cache policy rules applying to some paths only.
+
+        Returns:
+            The rules, in order, each with a path or a regex and the policy it overrides.
+
+        Raises:
+            ValueError: if the cache_rules config is malformed.
+        """
+        try:
+            rules = yaml.safe_load(str(self.model.config.get("cache_rules") or "")) or []
+        except yaml.YAMLError as exc:
+            raise ValueError(f"cache_rules is not valid YAML: {exc}") from exc
+        if not isinstance(rules, list) or not all(isinstance(rule, dict) for rule in rules):
+            raise ValueError("cache_rules must be a list of mappings")
+        for rule in rules:
+            unknown = set(rule) - {
+                "path",
+                "regex",
+                "cache_valid",
+                "cache_use_stale",
+                "min_uses",
+                "ignore_headers",
+                "bypass",
+            }
+            if unknown:
+                raise ValueError(f"unknown cache rule key(s): {', '.join(sorted(unknown))}")
+            if ("path" in rule) == ("regex" in rule):
+                raise ValueError("cache rules need either a path or a regex")
+            pattern = str(rule.get("regex") or rule.get("path") or "")
+            if not pattern or '"' in pattern or pattern.endswith("\\"):
+                raise ValueError(f"invalid cache rule pattern: {pattern}")
+            self._check_cache_rule_policy(rule)
+        return rules
+
+    @staticmethod
+    def _check_cache_rule_policy(rule: dict[str, Any]) -> None:
+        """Check the policy a cache rule overrides.
+
+        Args:
+            rule: The cache rule.
+
+        Raises:
+            ValueError: if a policy value is invalid.
+        """
+        cache_valid = rule.get("cache_valid", [])
+        if isinstance(cache_valid, str):
+            cache_valid = [cache_valid]
+        if not isinstance(cache_valid, list) or not all(
+            CACHE_VALID_RE.match(str(value)) for value in cache_valid
+        ):
+            raise ValueError(f"invalid cache rule cache_valid: {cache_valid}")
+        if "cache_use_stale" in rule and not CACHE_USE_STALE_RE.match(
+            str(rule["cache_use_stale"])
+        ):
+            raise ValueError(f"invalid cache rule cache_use_stale: {rule['cache_use_stale']}")
+        min_uses = rule.get("min_uses", 1)
+        if not isinstance(min_uses, int) or isinstance(min_uses, bool) or min_uses < 1:
+            raise ValueError(f"invalid cache rule min_uses: {min_uses}")
+        ignore_headers = rule.get("ignore_headers", [])
+        if not isinstance(ignore_headers, list) or not set(ignore_headers) <= IGNORABLE_HEADERS:
+            raise ValueError(f"invalid cache rule ignore_headers: {ignore_headers}")
+        if not isinstance(rule.get("bypass", False), bool):
+            raise ValueError(f"invalid cache rule bypass: {rule['bypass']}")
+
+    @classmethod
+    def _make_cache_rules(
+        cls,
+        rules: list[dict[str, Any]],
+        scheme: str,
+        upstream: str,
+        path: str,
+        slicing: bool = False,
+        cache_all: bool = True,
+    ) -> str:
+        """Generate the locations applying the cache policy of the cache rules.
+
+        The locations are nested in "location /", whose directives they inherit except for
+        those they override and proxy_pass, which is not inherited. They are regular
+        expression locations, so the first rule matching the URI applies, in the order of the
+        rules; paths are prefixes. A rule replaces all the proxy_cache_valid and
+        proxy_ignore_headers of "location /", so the validity of the slices and the headers
+        ignored unless cache_all are repeated in the rules overriding them.
+
+        Args:
+            rules: The cache rules, as returned by _cache_rules.
+            scheme: Scheme of the backend.
+            upstream: Name of the backend upstream.
+            path: Path of the backend URL.
+            slicing: Whether large objects are cached in slices, as 206 responses.
+            cache_all: The cache_all config of the site.
+
+        Returns:
+            The location blocks, each starting with an empty line.
+        """
+        lines = []
+        for rule in rules:
+            pattern = rule["regex"] if "regex" in rule else f"^{re.escape(str(rule['path']))}"
+            lines += ["", f'location ~ "{pattern}" {{']
+            if rule.get("bypass"):
+                lines.append("    proxy_cache off;")
+            cache_valid = rule.get("cache_valid", [])
+            cache_valid = [cache_valid] if isinstance(cache_valid, str) else cache_valid
+            slice_cache_valid = cls._slice_cache_valid(cache_valid) if slicing else None
+            for value in cache_valid + ([slice_cache_valid] if slice_cache_valid else []):
+                lines.append(f"    proxy_cache_valid {value};")
+            if "cache_use_stale" in rule:
+                lines.append(f"    proxy_cache_use_stale {rule['cache_use_stale']};")
+            if "min_uses" in rule:
+                lines.append(f"    proxy_cache_min_uses {rule['min_uses']};")
+            if rule.get("ignore_headers"):
+                ignore_headers = [] if cache_all else ["Cache-Control", "Expires"]
+                ignore_headers += [
+                    header for header in rule["ignore_headers"] if header not in ignore_headers
+                ]
+                lines.append(f"    proxy_ignore_headers {' '.join(ignore_headers)};")
+            if path not in ("", "/"):
+                # proxy_pass cannot replace a part of the URI in a regular expression
+                # location, so the path of the backend is prepended as "location /" does.
+                lines.append(f"    rewrite ^/(.*)$ {path}$1 break;")
+            lines += [f"    proxy_pass {scheme}://{upstream};", "}"]
+        return "".join(f"\n        {line}" if line else "\n" for line in lines)
+
+    def _cache_paths(self) -> list[str]:
+        """Return the directories of all the caches nginx writes to.
+
+        Returns:
+            The main cache directory, then those of the cache tiers and of the sites.
+
+        Raises:
+            ValueError: if the cache_tiers or sites config is malformed.
+        """
+        return [
+            CACHE_PATH,
+            *(tier["path"] for tier in self._cache_tiers()),
+            *(site["path"] for site in self._sites()),
+        ]
+
+    def _make_cache_key(self, slicing: bool = False) -> tuple[str, str, str]:
+        """Generate the cache key normalized according to the cache key configs.
+
+        nginx has no string functions, so query arguments are dropped with a chain of maps,
+        one regular expression per argument. Arguments cannot be sorted either: instead,
+        cache_key_args lists the only arguments kept, which are then written in the key in
+        a fixed order whatever their order in the request. Request headers are appended after
+        a space, which request URIs cannot contain, so that the request URI remains the part
+        of the key between its first slash and its first space.
+
+        Args:
+            slicing: Whether the slice range is part of the key.
+
+        Returns:
+            The map directives, each on a new line, the request URI part of the key, and the
+            whole cache key.
+        """
+        config = self.model.config
+        key_args = sorted(set(str(config.get("cache_key_args") or "").split()))
+        ignore_args = str(config.get("cache_key_ignore_args") or "").split()
+        headers = str(config.get("cache_key_headers") or "").split()
+        lines = []
+        uri = "$request_uri"
+        if key_args or ignore_args:
+            lines += ["", "map $request_uri $cache_key_path {", '    "~^([^?]*)" $1;', "}"]
+        if key_args:
+            uri = "$cache_key_path?" + "&".join(f"{arg}=$arg_{arg}" for arg in key_args)
+        elif ignore_args:
+            variable = "$args"
+            for index, arg in enumerate(ignore_args, start=1):
+                lines += [
+                    f"map {variable} $cache_key_args_{index} {{",
+                    f'    "{self._make_ignore_arg_regex(arg)}" $1$2;',
+                    f"    default {variable};",
+                    "}",
+                ]
+                variable = f"$cache_key_args_{index}"
+            lines += [
+                f"map {variable} $cache_key_args {{",
+                '    "~^&*(.+)$" ?$1;',
+                '    default "";',
+                "}",
+            ]
+            uri = "$cache_key_path$cache_key_args"
+        key = f"$scheme$proxy_host{uri}"
+        if slicing:
+            key += "$slice_range"
+        if headers:
+            header_variables = (f"$http_{header.lower().replace('-', '_')}" for header in headers)
+            key = f'"{key} {" ".join(header_variables)}"'
+        return "".join(f"\n{line}" for line in lines), uri, key
+
+    @staticmethod
+    def _make_ignore_arg_regex(arg: str) -> str:
+        """Generate the map regular expression removing a query argument from the arguments.
+
+        Args:
+            arg: Name of the query argument.
+
+        Returns:
+            A regular expression whose first and second groups are the arguments before and
+            after the first occurrence of the argument, with or without a value.
+        """
+        return f"~^(.*?)(?:^|&){arg}(?:=[^&]*)?(?=&|$)(.*)$"
+
+    def _invalid_cache_key_configs(self) -> list[str]:
+        """Check the names of the query arguments and headers of the cache key configs.
+
+        Returns:
+            The cache key configs naming invalid arguments or headers.
+        """
+        checks = {
+            "cache_key_args": CACHE_KEY_ARG_RE,
+            "cache_key_headers": CACHE_KEY_HEADER_RE,
+            "cache_key_ignore_args": CACHE_KEY_ARG_RE,
+        }
+        return [
+            option
+            for option, pattern in checks.items()
+            if not all(pattern.match(name) for name in str(self.config.get(option) or "").split())
+        ]
+
+    @classmethod
+    def _make_slice_config(
+        cls, slice_size: str, cache_valid: str, cache_key: str = f"{DEFAULT_CACHE_KEY}$slice_range"
+    ) -> str:
+        """Generate the directives caching large objects in slices of a fixed size.
+
+        Each slice is fetched from the backend with its own range request and cached under
+        its own key, so range requests are served as soon as the slices they cover are
+        cached instead of waiting for the whole object.
+
+        Args:
+            slice_size: Size of the slices, e.g. 1m.
+            cache_valid: The cache_valid config, whose caching time also applies to slices.
+            cache_key: The cache key, including the slice range.
+
+        Returns:
+            The directives, each on a new line.
+        """
+        directives = [
+            f"slice {slice_size}",
+            f"proxy_cache_key {cache_key}",
+            "proxy_set_header Range $slice_range",
+        ]
+        slice_cache_valid = cls._slice_cache_valid([cache_valid])
+        if slice_cache_valid:
+            directives.append(f"proxy_cache_valid {slice_cache_valid}")
+        return "".join(f"\n        {directive};" for directive in directives)
+
+    @staticmethod
+    def _slice_cache_valid(cache_valid: list[str]) -> str | None:
+        """Return the validity of the slices, 206 Partial Content responses.
+
+        Args:
+            cache_valid: The proxy_cache_valid values applying to the slices.
+
+        Returns:
+            The value caching 206 responses as long as 200 responses, or None if the values
+            already cover 206 responses or there is none.
+        """
+        values = [value.split() for value in cache_valid if value.split()]
+        if not values or any({"206", "any"} & set(parts[:-1]) for parts in values):
+            return None
+        # A value without codes applies to 200, 301 and 302 responses.
+        times = [parts[-1] for parts in values if len(parts) == 1 or "200" in parts[:-1]]
+        return f"206 {(times or [values[-1][-1]])[0]}"
+
+    def _own_address(self) -> str | None:
+        """Return the address other units reach this unit at over the peer relation.
+
+        Returns:
+            The ingress address of the peer relation binding, bracketed if IPv6, or None if
+            Juju did not assign an address yet.
+        """
+        binding = self.model.get_binding(PEER_RELATION_NAME)
+        if binding is None or binding.network.ingress_address is None:
+            return None
+        address = str(binding.network.ingress_address)
+        return f"[{address}]" if ":" in address else address
+
+    def _publish_peer_data(self, ready: bool) -> None:
+        """Publish the address and readiness of this unit to the other units.
+
+        Args:
+            ready: Whether nginx serves the current config, so that peers may forward requests
+                to this unit.
+        """
+        relation = self.model.get_relation(PEER_RELATION_NAME)
+        address = self._own_address() if relation else None
+        if relation is None or address is None:
+            return
+        data = {"address": address, "ready": "true" if ready else "false"}
+        if any(relation.data[self.unit].get(key) != value for key, value in data.items()):
+            relation.data[self.unit].update(data)
+
+    def _shard_addresses(self) -> list[str]:
+        """Return the addresses of the units sharing the cache, this unit included.
+
+        Returns:
+            The sorted addresses of this unit and of the peers that published they are ready,
+            or an empty list if sharding is disabled or this unit has no address yet.
+        """
+        if not self.model.config.get("cache_sharding"):
+            return []
+        relation = self.model.get_relation(PEER_RELATION_NAME)
+        own_address = self._own_address() if relation else None
+        if relation is None or own_address is None:
+            return []
+        addresses = {own_address}
+        for unit in relation.units:
+            data = relation.data[unit]
+            if data.get("ready") == "true" and data.get("address"):
+                addresses.add(data["address"])
+        return sorted(addresses)
+
+    def _make_sharding_config(
+        self, keys_zone: str, site: str | None, shards: list[str], client_max_body_size: str
+    ) -> str:
+        """Generate the server forwarding each request to the unit caching its key.
+
+        The shards upstream itself is rendered into its own file by _make_shards_config, so
+        that units joining or departing leave this config unchanged.
+
+        Args:
+            keys_zone: Name of the keys zone of the site, from which the upstream is named.
+            site: Name of the site.
+            shards: Addresses of the units sharing the cache.
+            client_max_body_size: Maximum request body size.
+
+        Returns:
+            The include of the shards upstream and the forwarding server, to append after the
+            backend upstream, or an empty string without shards.
+        """
+        if not shards:
+            return ""
+        upstream = keys_zone.replace("-cache", "-shards")
+        lines = [
+            "",
+            "",
+            f"include {NGINX_SHARDS_PATH};",
+            "",
+            "server {",
+            f"    server_name {site};",
+            f"    listen {CONTAINER_PORT};",
+            f"    listen [::]:{CONTAINER_PORT};",
+            "",
+            f"    client_max_body_size {client_max_body_size};",
+            "",
+            "    port_in_redirect off;",
+            "    absolute_redirect off;",
+            "",
+            "    location / {",
+            f"        proxy_pass http://{upstream};",
+            "        proxy_set_header Host $host;",
+            "        proxy_http_version 1.1;",
+            '        proxy_set_header Connection "";',
+            "        # The owner unit buffers the response, and logs the request.",
+            "        proxy_buffering off;",
+            "    }",
+            "",
+            "    location = /stub_status {",
+            "      stub_status;",
+            "    }",
+            "",
+            "    access_log off;",
+            "}",
+        ]
+        return "\n".join(lines)
+
+    def _make_shards_config(
+        self, keys_zone: str, shards: list[str], cache_key_uri: str = "$request_uri"
+    ) -> str:
+        """Generate the upstream of the units sharing the cache.
+
+        The upstream hashes the request URI part of the cache key, the part varying within
+        the site, with consistent hashing: each unit renders the same ring, so all of them forward
+        a URI to the same owner, and a unit joining or departing only remaps about 1/N of the
+        URIs. The owner serves the request from the cache server on SHARD_PORT.
+
+        Args:
+            keys_zone: Name of the keys zone of the site, from which the upstream is named.
+            shards: Addresses of the units sharing the cache.
+            cache_key_uri: The request URI part of the cache key, normalized or not.
+
+        Returns:
+            The upstream block.
+        """
+        upstream = keys_zone.replace("-cache", "-shards")
+        servers = [f"{address}:{SHARD_PORT}" for address in shards]
+        directives = self._make_upstream_config(servers, f"hash {cache_key_uri} consistent")
+        return f"upstream {upstream} {{\n    {directives}\n}}\n"
+
+    def _make_upstream_config(self, servers: list[str], balancing: str | None = None) -> str:
+        """Generate the body of the Nginx upstream pooling the backend servers.
+
+        Args:
+            servers: Addresses of the backend servers, as host:port.
+            balancing: Balancing directive, the one of the upstream_balancing config if unset.
+
+        Returns:
+            The directives of the upstream block, one per line.
+        """
+        config = self.model.config
+        directives = []
+        if balancing is None:
+            balancing = UPSTREAM_BALANCING[str(config.get("upstream_balancing", "round-robin"))]
+        if balancing:
+            directives.append(balancing)
+        max_fails = config.get("upstream_max_fails", 1)
+        fail_timeout = config.get("upstream_fail_timeout", "10s")
+        for server in servers:
+            directives.append(f"server {server} max_fails={max_fails} fail_timeout={fail_timeout}")
+        keepalive = config.get("upstream_keepalive", 32)
+        if keepalive:
+            # Idle connections to the backend are reused by cache misses instead of paying
+            # for a new TCP and TLS handshake each time.
+            directives.append(f"keepalive {keepalive}")
+            keepalive_requests = config.get("upstream_keepalive_requests", 1000)
+            directives.append(f"keepalive_requests {keepalive_requests}")
+            keepalive_timeout = config.get("upstream_keepalive_timeout", "60s")
+            directives.append(f"keepalive_timeout {keepalive_timeout}")
+        return "\n    ".join(f"{directive};" for directive in directives)
+
     def _make_pebble_config(self, env_config) -> dict:
         """Generate our pebble config layer.
 
@@ -429,7 +1908,7 @@ class ContentCacheCharm(CharmBase):
                     "summary": "content-cache",
                     "command": "/srv/content-cache/entrypoint.sh",
                     "startup": "enabled",
-                    "environment": env_config,
+                    "environment": {key: env_config[key] for key in SERVICE_ENV_KEYS},
                 },
             },
             "checks": {
@@ -455,8 +1934,49 @@ class ContentCacheCharm(CharmBase):
             content = file.read()
 
         nginx_config = content.format(**env_config)
+        for site_env_config in self._make_sites_env_config(env_config):
+            nginx_config += "\n" + content.format(**site_env_config)
         return nginx_config
 
+    def _invalid_charm_configs(self) -> list[str]:
+        """Check and return list of configs with invalid values.
+
+        Returns:
+            Settings in the juju configs whose value is invalid.
+        """
+        config = self.model.config
+        invalid = []
+        if config.get("upstream_balancing", "round-robin") not in UPSTREAM_BALANCING:
+            invalid.append("upstream_balancing")
+        slice_size = config.get("cache_slice_size")
+        if slice_size and not SIZE_RE.match(str(slice_size)):
+            invalid.append("cache_slice_size")
+        for option in ("cache_keys_zone_size", "cache_max_size"):
+            value = config.get(option)
+            if value and not SIZE_RE.match(str(value)):
+                invalid.append(option)
+        average_size = config.get("cache_average_object_size")
+        if average_size and not (
+            SIZE_RE.match(str(average_size)) and parse_size(str(average_size))
+        ):
+            invalid.append("cache_average_object_size")
+        for option in ("cache_loader_sleep", "cache_loader_threshold"):
+            if not TIME_RE.match(str(config.get(option, "0"))):
+                invalid.append(option)
+        invalid += self._invalid_cache_key_configs()
+        parsers = {
+            "cache_rules": self._cache_rules,
+            "cache_tiers": self._cache_tiers,
+            "sites": self._sites,
+        }
+        for option, parse in parsers.items():
+            try:
+                parse()
+            except ValueError as exc:
+                logger.warning("Invalid %s: %s", option, exc)
+                invalid.append(option)
+        return sorted(invalid)
+
     def _missing_charm_configs(self) -> list[str]:
         """Check and return list of required but missing configs.
 
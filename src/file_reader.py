@@ -1,33 +1,115 @@
-"""Short module for file reverse reading."""
+"""Short module for file reverse reading and searching."""
 
 # Copyright 2025 Canonical Ltd.
 # See LICENSE file for licensing details.
 
 import os
-from io import StringIO
-from typing import Generator
+from typing import Any, BinaryIO, Callable, Generator
 
+BLOCK_SIZE = 64 * 1024
 
-def readlines_reverse(qfile) -> Generator[str, None, None]:
+
+def readlines_reverse(qfile, block_size: int = BLOCK_SIZE) -> Generator[str, None, None]:
     """Read the lines of a file in reverse order in a lazy way.
 
+    The file is read backwards in blocks of block_size and each block is split on newlines
+    in bulk. The first, possibly partial, line of a block is carried over and completed by
+    the block that precedes it.
+
     Args:
-        qfile: File in StringIO format.
+        qfile: File in StringIO format, or a text or binary file as returned by
+            Container.pull.
+        block_size: Amount of data read from the file at once.
 
     Yields:
         A row from the read file.
     """
     with qfile:
-        qfile.seek(0, os.SEEK_END)
-        position = qfile.tell()
-        line = StringIO("")
-        while position >= 0:
-            qfile.seek(position)
-            next_char = qfile.read(1)
-            if next_char == "\n":
-                yield line.getvalue()[::-1]
-                line = StringIO("")
-            else:
-                line.write(next_char)
-            position -= 1
-        yield line.getvalue()[::-1]
+        # Text files opened from disk expose their binary buffer, which can be seeked to any
+        # offset; in-memory text streams are seeked and split by character instead.
+        stream = getattr(qfile, "buffer", qfile)
+        encoding = getattr(qfile, "encoding", None) or "utf-8"
+        stream.seek(0, os.SEEK_END)
+        position = stream.tell()
+        remainder = stream.read(0)
+        newline = "\n" if isinstance(remainder, str) else b"\n"
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            stream.seek(position)
+            lines = (stream.read(size) + remainder).split(newline)
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                yield _decode(line, encoding)
+        yield _decode(remainder, encoding)
+
+
+def _decode(line: str | bytes, encoding: str) -> str:
+    """Return a line read from a file as text.
+
+    Args:
+        line: The line as read from the file.
+        encoding: Encoding used to decode binary lines.
+
+    Returns:
+        The line decoded to a string.
+    """
+    if isinstance(line, bytes):
+        return line.decode(encoding, errors="replace")
+    return line
+
+
+def bisect_lines(stream: BinaryIO, key: Callable[[bytes], Any], target: Any) -> int:
+    """Find where a file sorted by line key passes a target, reading O(log n) lines.
+
+    Each probe seeks to an offset, resynchronises on the next line start and compares the
+    key of that line. Lines for which key returns None, such as truncated or malformed
+    lines, are skipped over.
+
+    Args:
+        stream: Seekable binary file whose lines are sorted by key.
+        key: Function extracting a comparable key from a line, or None if it has none.
+        target: Key value to look for.
+
+    Returns:
+        Offset of the first line whose key is greater than target, or the size of the file
+        if there is none.
+    """
+    stream.seek(0, os.SEEK_END)
+    low, high = 0, stream.tell()
+    while low < high:
+        mid = (low + high) // 2
+        start, value = _probe(stream, mid, key)
+        if value is not None and value <= target:
+            low = start + 1
+        else:
+            high = mid
+    start, _ = _probe(stream, low, key)
+    return start
+
+
+def _probe(stream: BinaryIO, offset: int, key: Callable[[bytes], Any]) -> tuple[int, Any]:
+    """Read the first line with a key starting at or after an offset.
+
+    Args:
+        stream: Seekable binary file.
+        offset: Offset to start looking from.
+        key: Function extracting a comparable key from a line, or None if it has none.
+
+    Returns:
+        The offset of that line and its key, or the end of the file and None.
+    """
+    if offset > 0:
+        # Discard the end of the line the offset falls in, unless the offset is a line start.
+        stream.seek(offset - 1)
+        stream.readline()
+    else:
+        stream.seek(0)
+    while True:
+        start = stream.tell()
+        line = stream.readline()
+        if not line:
+            return start, None
+        value = key(line)
+        if value is not None:
+            return start, value
@@ -0,0 +1,369 @@
+"""Prometheus exporter of access log metrics, run inside the workload container."""
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import argparse
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import BinaryIO, Iterator
+
+from access_log import LOG_FORMAT_PATH, LogParser, LogRecord
+
+DEFAULT_PORT = 9114
+POLL_INTERVAL = 1.0
+# Upper bounds of the histogram buckets, the +Inf bucket is implicit.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600, 1073741824)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Prometheus histogram with fixed buckets.
+
+    Attrs:
+        bounds: Upper bounds of the buckets.
+        counts: Number of values per bucket, not cumulative; the last one is +Inf.
+        sum: Sum of the values observed.
+    """
+
+    def __init__(self, bounds: tuple[float, ...]):
+        """Initialize the histogram.
+
+        Args:
+            bounds: Sorted upper bounds of the buckets.
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Count a value in its bucket.
+
+        Args:
+            value: The value observed.
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        """Return the samples of the histogram.
+
+        Yields:
+            The sample name suffix, the value of its le label if any and its value.
+        """
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts[:-1], strict=True):
+            cumulative += count
+            yield "_bucket", _format_value(bound), cumulative
+        cumulative += self.counts[-1]
+        yield "_bucket", "+Inf", cumulative
+        yield "_sum", "", self.sum
+        yield "_count", "", cumulative
+
+
+class CacheMetrics:
+    """Access log metrics labelled by upstream cache status.
+
+    Lines are observed by the log tailing thread while the HTTP server renders the metrics,
+    so both go through a lock.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the metrics."""
+        self._lock = threading.Lock()
+        self._requests: dict[str, int] = {}
+        self._bytes_sent: dict[str, int] = {}
+        self._request_durations: dict[str, Histogram] = {}
+        self._upstream_durations: dict[str, Histogram] = {}
+        self._response_sizes: dict[str, Histogram] = {}
+        self._invalid_lines = 0
+
+    def observe(self, record: LogRecord | None) -> None:
+        """Count a log line.
+
+        Args:
+            record: The parsed log line, or None if it is malformed.
+        """
+        with self._lock:
+            if record is None:
+                self._invalid_lines += 1
+                return
+            status = record.cache_status
+            self._requests[status] = self._requests.get(status, 0) + 1
+            self._bytes_sent[status] = self._bytes_sent.get(status, 0) + record.bytes_sent
+            _histogram(self._response_sizes, status, SIZE_BUCKETS).observe(record.bytes_sent)
+            if record.request_time is not None:
+                durations = _histogram(self._request_durations, status, DURATION_BUCKETS)
+                durations.observe(record.request_time)
+            if record.upstream_time is not None:
+                durations = _histogram(self._upstream_durations, status, DURATION_BUCKETS)
+                durations.observe(record.upstream_time)
+
+    def render(self) -> str:
+        """Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            The metrics, one sample per line.
+        """
+        lines: list[str] = []
+        with self._lock:
+            _render_counter(
+                lines,
+                "content_cache_requests_total",
+                "Requests by upstream cache status.",
+                self._requests,
+            )
+            _render_counter(
+                lines,
+                "content_cache_sent_bytes_total",
+                "Bytes sent to clients by upstream cache status.",
+                self._bytes_sent,
+            )
+            _render_histogram(
+                lines,
+                "content_cache_response_size_bytes",
+                "Size of the responses sent to clients by upstream cache status.",
+                self._response_sizes,
+            )
+            _render_histogram(
+                lines,
+                "content_cache_request_duration_seconds",
+                "Request processing time by upstream cache status.",
+                self._request_durations,
+            )
+            _render_histogram(
+                lines,
+                "content_cache_upstream_response_duration_seconds",
+                "Time spent receiving the response from the backend by upstream cache status.",
+                self._upstream_durations,
+            )
+            lines.append("# HELP content_cache_log_invalid_lines_total Malformed log lines.")
+            lines.append("# TYPE content_cache_log_invalid_lines_total counter")
+            lines.append(f"content_cache_log_invalid_lines_total {self._invalid_lines}")
+        return "\n".join(lines) + "\n"
+
+
+def _histogram(histograms: dict[str, Histogram], status: str, bounds: tuple) -> Histogram:
+    """Return the histogram of a cache status, creating it if needed.
+
+    Args:
+        histograms: Histograms by cache status.
+        status: The cache status.
+        bounds: Upper bounds of the buckets of a new histogram.
+
+    Returns:
+        The histogram of that cache status.
+    """
+    if status not in histograms:
+        histograms[status] = Histogram(bounds)
+    return histograms[status]
+
+
+def _render_counter(lines: list[str], name: str, description: str, values: dict) -> None:
+    """Append the samples of a counter labelled by cache status.
+
+    Args:
+        lines: Lines of the exposition to append to.
+        name: Name of the metric.
+        description: Help text of the metric.
+        values: Values by cache status.
+    """
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} counter")
+    for status, value in sorted(values.items()):
+        lines.append(f'{name}{{cache_status="{_escape(status)}"}} {_format_value(value)}')
+
+
+def _render_histogram(
+    lines: list[str], name: str, description: str, histograms: dict[str, Histogram]
+) -> None:
+    """Append the samples of a histogram labelled by cache status.
+
+    Args:
+        lines: Lines of the exposition to append to.
+        name: Name of the metric.
+        description: Help text of the metric.
+        histograms: Histograms by cache status.
+    """
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} histogram")
+    for status, histogram in sorted(histograms.items()):
+        labels = f'cache_status="{_escape(status)}"'
+        for suffix, le, value in histogram.samples():
+            sample_labels = f'{labels},le="{le}"' if le else labels
+            lines.append(f"{name}{suffix}{{{sample_labels}}} {_format_value(value)}")
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text exposition format.
+
+    Args:
+        value: The label value.
+
+    Returns:
+        The value with backslashes, double quotes and newlines escaped.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value, without a fractional part for integers.
+
+    Args:
+        value: The sample value.
+
+    Returns:
+        The value as written in the exposition.
+    """
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class LogTailer:
+    """Follow a log file as it grows, across rotations and truncations.
+
+    Only complete lines are returned: a line still being written is kept until its newline
+    arrives.
+    """
+
+    def __init__(self, path: str, from_start: bool = False):
+        """Initialize the tailer.
+
+        Args:
+            path: The log file to follow.
+            from_start: Whether to read the lines already in the file when it is first
+                opened, rather than only the lines appended afterwards.
+        """
+        self.path = path
+        self._from_start = from_start
+        self._file: BinaryIO | None = None
+        self._inode = 0
+        self._partial = b""
+
+    def read_lines(self) -> Iterator[bytes]:
+        """Return the lines appended since the last call.
+
+        Yields:
+            Complete lines, without their trailing newline.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if self._file is not None and stat.st_ino != self._inode:
+            # Rotated: finish the old file before following the new one from its start.
+            yield from self._read(self._file)
+            self._file.close()
+            self._file = None
+            self._from_start = True
+        if self._file is None:
+            self._file = open(self.path, "rb")  # noqa: SIM115
+            self._inode = stat.st_ino
+            self._partial = b""
+            if not self._from_start:
+                self._file.seek(0, os.SEEK_END)
+        elif stat.st_size < self._file.tell():
+            # Truncated in place.
+            self._file.seek(0)
+            self._partial = b""
+        yield from self._read(self._file)
+
+    def _read(self, log_file: BinaryIO) -> Iterator[bytes]:
+        """Read the complete lines available in a file.
+
+        Args:
+            log_file: The file, positioned after the last line read.
+
+        Yields:
+            Complete lines, without their trailing newline.
+        """
+        for line in log_file:
+            if not line.endswith(b"\n"):
+                self._partial += line
+                return
+            yield self._partial + line[:-1]
+            self._partial = b""
+
+    def close(self) -> None:
+        """Close the log file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def tail(tailer: LogTailer, parser: LogParser, metrics: CacheMetrics) -> None:
+    """Count the lines appended to the access log since the last call.
+
+    Args:
+        tailer: Tailer of the access log.
+        parser: Parser of the log lines.
+        metrics: Metrics to update.
+    """
+    for line in tailer.read_lines():
+        metrics.observe(parser.parse(line.decode("utf-8", errors="replace")))
+
+
+def make_handler(metrics: CacheMetrics) -> type[BaseHTTPRequestHandler]:
+    """Create a request handler serving the metrics on /metrics.
+
+    Args:
+        metrics: Metrics to serve.
+
+    Returns:
+        The request handler class.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """Serve the metrics."""
+
+        def do_GET(self) -> None:
+            """Respond with the metrics, or 404 outside of /metrics."""
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:  # noqa: A002
+            """Do not log scrapes."""
+
+    return MetricsHandler
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Follow the access log and serve its metrics until interrupted.
+
+    Args:
+        argv: Command line arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("log_path")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--log-format", default=LOG_FORMAT_PATH)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    args = parser.parse_args(argv)
+
+    log_parser = LogParser.from_config(args.log_format)
+    metrics = CacheMetrics()
+    server = ThreadingHTTPServer(("", args.port), make_handler(metrics))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Counters start from zero when the exporter starts, which Prometheus handles as a reset.
+    tailer = LogTailer(args.log_path)
+    try:
+        while True:
+            tail(tailer, log_parser, metrics)
+            time.sleep(args.poll_interval)
+    finally:
+        tailer.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,297 @@
+"""Access log reports, run inside the workload container next to the log they read."""
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import argparse
+import ipaddress
+import json
+import operator
+import re
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import BinaryIO, Callable, Hashable, Iterable, Iterator
+
+from access_log import LOG_FORMAT_PATH, LogParser, LogRecord
+from file_reader import bisect_lines
+from sketches import QuantileSketch, SpaceSaving
+
+WINDOW_RE = re.compile(r"^(\d+)([smhd])$")
+WINDOW_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+# Monitored keys per reported key, so the top of the Space-Saving summary is accurate.
+TOP_K_FACTOR = 10
+TOP_K_MIN_CAPACITY = 1000
+# $upstream_cache_status values, in reporting order; "-" when the cache was not involved.
+CACHE_STATUSES = ["HIT", "STALE", "UPDATING", "REVALIDATED", "MISS", "EXPIRED", "BYPASS", "-"]
+SERVED_FROM_CACHE = {"HIT", "STALE", "UPDATING", "REVALIDATED"}
+SERVED_FROM_ORIGIN = {"MISS", "EXPIRED", "BYPASS"}
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+
+def parse_window(value: str) -> timedelta:
+    """Parse a time window such as 5m, 1h or 24h.
+
+    Args:
+        value: Window length followed by a unit among s, m, h or d.
+
+    Returns:
+        The window as a timedelta.
+
+    Raises:
+        ValueError: if the window is not in the expected format.
+    """
+    match = WINDOW_RE.match(value)
+    if not match:
+        raise ValueError(f"invalid window {value!r}, expected e.g. 5m, 1h or 24h")
+    return timedelta(**{WINDOW_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def line_time(parser: LogParser, line: bytes) -> datetime | None:
+    """Return the timestamp of a raw log line without parsing the rest of it.
+
+    Args:
+        parser: Parser of the log lines.
+        line: A log line from the log file.
+
+    Returns:
+        The local time the line was logged at, or None if the line has no valid timestamp.
+    """
+    start = line.find(b"[") + 1
+    if not start:
+        return None
+    # $time_local starts with a fixed width dd/Mon/yyyy:hh:mm:ss date.
+    return parser.parse_time(line[start : start + 20].decode("ascii", "replace"))
+
+
+def get_ip_prefix(record: LogRecord) -> str:
+    """Return the network of the client IP address of a log line.
+
+    Args:
+        record: The parsed log line.
+
+    Returns:
+        The /24 network of an IPv4 address or the /64 network of an IPv6 address, or the
+        address as is if it is not valid.
+    """
+    try:
+        address = ipaddress.ip_address(record.ip)
+    except ValueError:
+        return record.ip
+    prefix = 24 if address.version == 4 else 64
+    return str(ipaddress.ip_network(f"{record.ip}/{prefix}", strict=False))
+
+
+GROUP_BY: dict[str, Callable[[LogRecord], str]] = {
+    "ip": operator.attrgetter("ip"),
+    "ip-prefix": get_ip_prefix,
+    "user-agent": operator.attrgetter("user_agent"),
+    "uri": operator.attrgetter("uri"),
+    "status": lambda record: str(record.status),
+    "cache-status": operator.attrgetter("cache_status"),
+}
+
+
+def window_records(log_file: BinaryIO, since: datetime, parser: LogParser) -> Iterator[LogRecord]:
+    """Return the log lines logged after a given time.
+
+    nginx writes the access log in time order, so the start of the window is found by
+    bisecting the file on the line timestamps and the window is then read forward.
+
+    Args:
+        log_file: Access log opened in binary mode.
+        since: Oldest timestamp accepted.
+        parser: Parser of the log lines.
+
+    Yields:
+        The well-formed lines logged after since, oldest first.
+    """
+    with log_file:
+        log_file.seek(bisect_lines(log_file, lambda line: line_time(parser, line), since))
+        for line in log_file:
+            record = parser.parse(line.decode("utf-8", errors="replace").rstrip("\n"))
+            if record is not None:
+                yield record
+
+
+def top_visits(
+    records: Iterable[LogRecord], group_by: str = "ip", limit: int | None = None
+) -> list[tuple[str, int]]:
+    """Count requests grouped by a key and return the most frequent keys.
+
+    Counting uses a Space-Saving summary, so memory stays bounded however many distinct
+    keys appear and the counts of the top keys may be slightly overestimated.
+
+    Args:
+        records: Parsed log lines within the reported window.
+        group_by: Name of the key to group requests by, one of GROUP_BY.
+        limit: Maximum number of keys returned, all monitored keys by default.
+
+    Returns:
+        A list of tuples composed of a key and its number of requests, most frequent first.
+    """
+    get_key = GROUP_BY[group_by]
+    summary = SpaceSaving(max((limit or 0) * TOP_K_FACTOR, TOP_K_MIN_CAPACITY))
+    for record in records:
+        summary.add(get_key(record))
+    return summary.most_common(limit)  # type: ignore[return-value]
+
+
+def cache_stats(records: Iterable[LogRecord]) -> dict:
+    """Summarize cache efficiency: requests, bytes and request times by cache status.
+
+    Request time percentiles come from one quantile sketch per cache status, so memory
+    stays constant however many lines are read.
+
+    Args:
+        records: Parsed log lines within the reported window.
+
+    Returns:
+        The total number of requests, the hit ratio, the bytes served from the cache and
+        from the backend, and per cache status the number of requests, bytes sent and
+        request time percentiles in seconds.
+    """
+    requests: Counter[str] = Counter()
+    bytes_sent: Counter[str] = Counter()
+    request_times: dict[str, QuantileSketch] = {}
+    for record in records:
+        requests[record.cache_status] += 1
+        bytes_sent[record.cache_status] += record.bytes_sent
+        if record.request_time is not None:
+            if record.cache_status not in request_times:
+                request_times[record.cache_status] = QuantileSketch()
+            request_times[record.cache_status].add(record.request_time)
+
+    order = {status: index for index, status in enumerate(CACHE_STATUSES)}
+    statuses = []
+    for status in sorted(requests, key=lambda status: (order.get(status, len(order)), status)):
+        sketch = request_times.get(status, QuantileSketch())
+        statuses.append(
+            {
+                "status": status,
+                "requests": requests[status],
+                "bytes": bytes_sent[status],
+                **{name: sketch.quantile(q) for name, q in PERCENTILES.items()},
+            }
+        )
+    from_cache = sum(requests[status] for status in SERVED_FROM_CACHE)
+    from_origin = sum(requests[status] for status in SERVED_FROM_ORIGIN)
+    bytes_from_cache = sum(bytes_sent[status] for status in SERVED_FROM_CACHE)
+    bytes_from_origin = sum(bytes_sent[status] for status in SERVED_FROM_ORIGIN)
+    return {
+        "requests": sum(requests.values()),
+        "hit_ratio": _ratio(from_cache, from_origin),
+        "bytes_from_cache": bytes_from_cache,
+        "bytes_from_origin": bytes_from_origin,
+        "byte_hit_ratio": _ratio(bytes_from_cache, bytes_from_origin),
+        "statuses": statuses,
+    }
+
+
+def _ratio(hits: int, misses: int) -> float | None:
+    """Return the share of hits, or None if there was neither hit nor miss.
+
+    Args:
+        hits: Number of hits.
+        misses: Number of misses.
+
+    Returns:
+        The hit ratio, between 0 and 1.
+    """
+    return hits / (hits + misses) if hits + misses else None
+
+
+def normalize_uri(uri: str, strip_query: bool = False) -> str:
+    """Normalize a requested URI so that equivalent requests are counted together.
+
+    Args:
+        uri: The URI of the request line.
+        strip_query: Whether to drop the query string.
+
+    Returns:
+        The URI with repeated slashes collapsed, the fragment dropped and optionally the
+        query string dropped.
+    """
+    uri = uri.split("#", 1)[0]
+    path, separator, query = uri.partition("?")
+    path = re.sub("//+", "/", path)
+    if strip_query or not query:
+        return path
+    return f"{path}{separator}{query}"
+
+
+def top_misses(
+    records: Iterable[LogRecord], limit: int = 20, strip_query: bool = False
+) -> list[dict]:
+    """List the URIs most often fetched from the backend rather than served from the cache.
+
+    URIs are counted with a Space-Saving summary; the bytes and upstream times of a URI are
+    only accumulated while it is monitored, so memory stays bounded.
+
+    Args:
+        records: Parsed log lines within the reported window.
+        limit: Maximum number of URIs returned.
+        strip_query: Whether to drop query strings from the URIs.
+
+    Returns:
+        Per URI, most missed first, the number of misses, bytes sent for these misses and
+        the average upstream response time in seconds.
+    """
+    summary = SpaceSaving(max(limit * TOP_K_FACTOR, TOP_K_MIN_CAPACITY))
+    # URI -> [bytes sent, total upstream time, number of upstream times].
+    totals: dict[Hashable, list] = {}
+    for record in records:
+        if record.cache_status not in SERVED_FROM_ORIGIN:
+            continue
+        uri = normalize_uri(record.uri, strip_query)
+        evicted = summary.add(uri)
+        if evicted is not None:
+            del totals[evicted]
+        total = totals.setdefault(uri, [0, 0.0, 0])
+        total[0] += record.bytes_sent
+        if record.upstream_time is not None:
+            total[1] += record.upstream_time
+            total[2] += 1
+    misses = []
+    for key, count in summary.most_common(limit):
+        sent, upstream_time, upstream_count = totals[key]
+        misses.append(
+            {
+                "uri": key,
+                "misses": count,
+                "bytes": sent,
+                "upstream_time": upstream_time / upstream_count if upstream_count else None,
+            }
+        )
+    return misses
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Print the requested report over the access log as JSON.
+
+    Args:
+        argv: Command line arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("report", choices=["cache-stats", "top-misses", "visits"])
+    parser.add_argument("log_path")
+    parser.add_argument("--window", type=parse_window, default="20m")
+    parser.add_argument("--group-by", choices=sorted(GROUP_BY), default="ip")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--strip-query", action="store_true")
+    parser.add_argument("--log-format", default=LOG_FORMAT_PATH)
+    args = parser.parse_args(argv)
+
+    since = datetime.now() - args.window
+    log_parser = LogParser.from_config(args.log_format)
+    records = window_records(open(args.log_path, "rb"), since, log_parser)  # noqa: SIM115
+    if args.report == "cache-stats":
+        json.dump(cache_stats(records), sys.stdout)
+    elif args.report == "top-misses":
+        json.dump(top_misses(records, args.limit or 20, args.strip_query), sys.stdout)
+    else:
+        json.dump(top_visits(records, args.group_by, args.limit), sys.stdout)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,215 @@
+"""Bounded-memory summaries of the access log, run inside the workload container."""
+
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import math
+from typing import Hashable
+
+
+class SpaceSaving:
+    """Approximate top-k counter using the Space-Saving algorithm.
+
+    At most capacity keys are monitored. When a new key arrives and the summary is full, the
+    key with the lowest count is evicted and the new key takes over its count, so a key's
+    count is overestimated by at most the count it inherited. Any key occurring more than
+    1/capacity of the time is guaranteed to be monitored.
+
+    Keys are kept in buckets by count so that each update is O(1).
+
+    Attrs:
+        capacity: Maximum number of keys monitored.
+    """
+
+    def __init__(self, capacity: int):
+        """Initialize the summary.
+
+        Args:
+            capacity: Maximum number of keys monitored.
+
+        Raises:
+            ValueError: if capacity is not positive.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._counts: dict[Hashable, int] = {}
+        self._errors: dict[Hashable, int] = {}
+        # Keys by count; dicts are used as insertion-ordered sets.
+        self._buckets: dict[int, dict[Hashable, None]] = {}
+        self._min = 0
+
+    def __len__(self) -> int:
+        """Return the number of keys monitored."""
+        return len(self._counts)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Return whether a key is monitored.
+
+        Args:
+            key: The key to look for.
+        """
+        return key in self._counts
+
+    def add(self, key: Hashable) -> Hashable | None:
+        """Count one occurrence of a key.
+
+        Args:
+            key: The key seen.
+
+        Returns:
+            The key evicted to make room for this one, if any.
+        """
+        evicted = None
+        count = self._counts.get(key)
+        if count is None:
+            if len(self._counts) < self.capacity:
+                count = 0
+                self._errors[key] = 0
+            else:
+                count = self._min
+                evicted = next(iter(self._buckets[count]))
+                self._take(evicted, count)
+                del self._counts[evicted]
+                del self._errors[evicted]
+                self._errors[key] = count
+        else:
+            self._take(key, count)
+        self._counts[key] = count + 1
+        self._buckets.setdefault(count + 1, {})[key] = None
+        if count == 0 or (count == self._min and count not in self._buckets):
+            self._min = count + 1
+        return evicted
+
+    def _take(self, key: Hashable, count: int) -> None:
+        """Remove a key from its count bucket.
+
+        Args:
+            key: The key to remove.
+            count: The current count of the key.
+        """
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+
+    def error(self, key: Hashable) -> int:
+        """Return the maximum overestimation of the count of a monitored key.
+
+        Args:
+            key: A monitored key.
+
+        Returns:
+            The count the key inherited when it was first monitored.
+        """
+        return self._errors[key]
+
+    def most_common(self, n: int | None = None) -> list[tuple[Hashable, int]]:
+        """List the keys with the highest counts.
+
+        Args:
+            n: Number of keys to return, all monitored keys by default.
+
+        Returns:
+            The keys and their estimated counts, highest count first.
+        """
+        ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+        return ranked if n is None else ranked[:n]
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative accuracy, after DDSketch.
+
+    Positive values are counted in buckets whose bounds grow geometrically, so any quantile
+    estimate is within relative_accuracy of an actual value of the data set. Memory only
+    depends on the range of the values, e.g. about 600 buckets from 1ms to 60s at 1%, and
+    is capped by collapsing the lowest buckets. Sketches with the same accuracy can be
+    merged, e.g. across units or time windows.
+
+    Attrs:
+        relative_accuracy: Maximum relative error of the quantile estimates.
+        count: Number of values added.
+    """
+
+    # Values below this are counted as zeroes, nginx logs times with millisecond resolution.
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        """Initialize the sketch.
+
+        Args:
+            relative_accuracy: Maximum relative error of the quantile estimates.
+            max_buckets: Maximum number of buckets kept.
+
+        Raises:
+            ValueError: if relative_accuracy is not between 0 and 1.
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.count = 0
+        self._max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: dict[int, int] = {}
+        self._zeros = 0
+
+    def add(self, value: float) -> None:
+        """Add a value to the sketch.
+
+        Args:
+            value: A non-negative value.
+        """
+        self.count += 1
+        if value < self.MIN_VALUE:
+            self._zeros += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self._buckets[key] = self._buckets.get(key, 0) + 1
+        if len(self._buckets) > self._max_buckets:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """Merge the two lowest buckets, trading accuracy of the lowest quantiles for memory."""
+        lowest, second = sorted(self._buckets)[:2]
+        self._buckets[second] += self._buckets.pop(lowest)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Add the values of another sketch to this one.
+
+        Args:
+            other: A sketch with the same relative accuracy.
+
+        Raises:
+            ValueError: if the sketches have different accuracies.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("cannot merge sketches with different accuracies")
+        self.count += other.count
+        self._zeros += other._zeros
+        for key, count in other._buckets.items():
+            self._buckets[key] = self._buckets.get(key, 0) + count
+        while len(self._buckets) > self._max_buckets:
+            self._collapse()
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate a quantile of the values added.
+
+        Args:
+            q: The quantile, between 0 and 1, e.g. 0.99 for the 99th percentile.
+
+        Returns:
+            The estimated quantile, or None if the sketch is empty.
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self._buckets):
+            seen += self._buckets[key]
+            if seen > rank:
+                # The middle of the bucket in relative terms: (gamma^(k-1), gamma^k].
+                return 2 * self._gamma**key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
@@ -0,0 +1,96 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Benchmark the access log parser against the former split and strptime parsing.
+
+Usage: PYTHONPATH=src python3 tests/benchmark/bench_access_log.py --lines 1000000
+"""
+
+import argparse
+import time
+from datetime import datetime
+from typing import Callable
+
+from access_log import LogParser
+
+LOG_FORMAT_PATH = "content-cache_rock/nginx-logging-format.conf"
+LOG_LINE = (
+    "10.{a}.{b}.{c} - - [17/Oct/2026:10:{minute:02d}:{second:02d} +0000] "
+    '"GET /snap/{c}/download HTTP/1.1" 200 {size} "-" "snapd/2.61 (series 16)" '
+    "0.{ms:03d} HIT 0.{ms:03d}"
+)
+
+
+def parse_legacy(line: str) -> tuple[str, datetime] | None:
+    """Parse the IP and time of a line the way the charm used to.
+
+    Args:
+        line: Access log line.
+
+    Returns:
+        The IP and time of the line, or None if it has no valid time.
+    """
+    line_elements = line.split()
+    if len(line_elements) < 4:
+        return None
+    timestamp_str = line_elements[3].lstrip("[").rstrip("]")
+    try:
+        timestamp = datetime.strptime(timestamp_str, "%d/%b/%Y:%H:%M:%S")
+    except ValueError:
+        return None
+    return line.split()[0], timestamp
+
+
+def generate_lines(count: int) -> list[str]:
+    """Generate synthetic access log lines, about ten per second.
+
+    Args:
+        count: Number of lines.
+
+    Returns:
+        The lines.
+    """
+    return [
+        LOG_LINE.format(
+            a=i % 256,
+            b=(i // 256) % 256,
+            c=i % 97,
+            minute=(i // 600) % 60,
+            second=(i // 10) % 60,
+            size=i * 7,
+            ms=i % 1000,
+        )
+        for i in range(count)
+    ]
+
+
+def time_parser(parse: Callable, lines: list[str]) -> float:
+    """Parse all lines and return the throughput.
+
+    Args:
+        parse: Line parser to benchmark.
+        lines: Lines to parse.
+
+    Returns:
+        Lines parsed per second.
+    """
+    start = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=1000000)
+    args = parser.parse_args()
+
+    lines = generate_lines(args.lines)
+    log_parser = LogParser.from_config(LOG_FORMAT_PATH)
+    print(f"before (split + strptime): {time_parser(parse_legacy, lines):>10.0f} lines/s")
+    print(f"after (LogParser):         {time_parser(log_parser.parse, lines):>10.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Benchmark the reverse line reader against the former character-by-character reader.
+
+Usage: PYTHONPATH=src python3 tests/benchmark/bench_file_reader.py --sizes 100M 1G
+
+The legacy reader takes several minutes per 100 MB, use --skip-legacy on the larger logs.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+from typing import Callable
+
+from file_reader import readlines_reverse
+
+LOG_LINE = (
+    '10.{a}.{b}.{c} - - [17/Oct/2026:10:00:00 +0000] "GET /snap/{c}/download HTTP/1.1" '
+    '200 {size} "-" "snapd/2.61" 0.{ms:03d} HIT 0.{ms:03d}\n'
+)
+UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def readlines_reverse_legacy(qfile):
+    """Read lines in reverse one character at a time, as the charm used to.
+
+    Args:
+        qfile: File to read.
+
+    Yields:
+        A row from the read file.
+    """
+    with qfile:
+        qfile.seek(0, os.SEEK_END)
+        position = qfile.tell()
+        line = StringIO("")
+        while position >= 0:
+            qfile.seek(position)
+            next_char = qfile.read(1)
+            if next_char == "\n":
+                yield line.getvalue()[::-1]
+                line = StringIO("")
+            else:
+                line.write(next_char)
+            position -= 1
+        yield line.getvalue()[::-1]
+
+
+def parse_size(size: str) -> int:
+    """Parse a size such as 100M into bytes.
+
+    Args:
+        size: Size with an optional K, M or G suffix.
+
+    Returns:
+        The size in bytes.
+    """
+    unit = UNITS.get(size[-1].upper(), 1)
+    return int(size.rstrip("KkMmGg")) * unit
+
+
+def generate_log(path: Path, size: int) -> None:
+    """Write a synthetic access log of about the given size.
+
+    Args:
+        path: Where to write the log.
+        size: Target size in bytes.
+    """
+    chunk = "".join(
+        LOG_LINE.format(a=i % 256, b=(i // 256) % 256, c=i % 97, size=i * 7, ms=i % 1000)
+        for i in range(10000)
+    ).encode("utf-8")
+    with path.open("wb") as log:
+        written = 0
+        while written < size:
+            log.write(chunk)
+            written += len(chunk)
+
+
+def time_reader(reader, path: Path) -> tuple[float, int]:
+    """Read a whole file in reverse and time it.
+
+    Args:
+        reader: Reverse line reader to benchmark.
+        path: File to read.
+
+    Returns:
+        The elapsed seconds and number of lines read.
+    """
+    start = time.perf_counter()
+    count = sum(1 for _ in reader(path.open(encoding="utf-8")))
+    return time.perf_counter() - start, count
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", default=["100M", "1G"])
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            path = Path(tmp_dir) / f"access-{size}.log"
+            generate_log(path, parse_size(size))
+            readers: list[tuple[str, Callable]] = [("block", readlines_reverse)]
+            if not args.skip_legacy:
+                readers.append(("legacy", readlines_reverse_legacy))
+            for name, reader in readers:
+                elapsed, count = time_reader(reader, path)
+                print(
+                    f"{size:>6} {name:>7}: {count} lines in {elapsed:.2f}s"
+                    f" ({path.stat().st_size / elapsed / 1024**2:.1f} MiB/s)"
+                )
+            path.unlink()
+
+
+if __name__ == "__main__":
+    main()
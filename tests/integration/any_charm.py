@@ -67,3 +67,16 @@ class AnyCharm(AnyCharmBase):
         )
         pid_file.write_text(str(proc_http.pid), encoding="utf8")
         return port
+
+    @staticmethod
+    def count_requests(path: str) -> int:
+        """Count the GET requests for a path received by the HTTP server daemon.
+
+        Args:
+            path: The requested path, including the query string.
+
+        Returns:
+            The number of requests logged for that path.
+        """
+        log = pathlib.Path("/tmp/any.log").read_text(encoding="utf8", errors="replace")
+        return log.count(f'"GET {path} ')
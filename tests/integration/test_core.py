@@ -3,6 +3,8 @@
 
 """Integration test module."""
 
+import concurrent.futures
+import json
 import re
 import secrets
 from typing import List
@@ -89,6 +91,35 @@ async def test_report_visits_by_ip(app: Application):
     assert ip_address_list
 
 
+@pytest.mark.asyncio
+async def test_proxy_cache_lock(
+    ops_test: pytest_operator.plugin.OpsTest, app: Application, ingress_ip: str, run_action
+):
+    """
+    arrange: given charm is deployed with request collapsing enabled in front of any-app
+    act: when an object missing from the cache is requested concurrently
+    assert: then all the requests succeed and the backend only receives one of them.
+    """
+    await app.set_config({"proxy_cache_lock": "true"})  # type: ignore[attr-defined]
+    await ops_test.model.wait_for_idle(apps=[app.name], status=ActiveStatus.name)  # type: ignore[union-attr]
+    # A new query string is a new cache key, but the same file for the backend.
+    path = f"/ok?{secrets.token_hex(8)}"
+
+    def get(_):
+        return requests.get(f"http://{ingress_ip}{path}", headers={"Host": "any-app"}, timeout=30)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
+        responses = list(executor.map(get, range(20)))
+
+    assert all(response.status_code == 200 for response in responses)
+    results = await run_action(
+        "any-app", "rpc", method="count_requests", kwargs=json.dumps({"path": path})
+    )
+    assert json.loads(results["return"]) == 1
+    await app.set_config({"proxy_cache_lock": "false"})  # type: ignore[attr-defined]
+    await ops_test.model.wait_for_idle(apps=[app.name], status=ActiveStatus.name)  # type: ignore[union-attr]
+
+
 @pytest.mark.asyncio
 async def test_openstack_object_storage_plugin(
     ops_test: pytest_operator.plugin.OpsTest,
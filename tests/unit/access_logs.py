@@ -0,0 +1,42 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Access log lines shared by the tests of the access log helpers."""
+
+import re
+from datetime import datetime
+
+from access_log import RECORD_VARIABLES, read_log_format
+
+LOG_FORMAT_PATH = "content-cache_rock/nginx-logging-format.conf"
+LOG_FORMAT = read_log_format(LOG_FORMAT_PATH)
+# Values of the log format variables of a cache hit, by LogRecord field or variable name.
+DEFAULT_VALUES = {
+    "ip": "10.10.10.11",
+    "time": datetime(2026, 10, 17, 10, 1, 2),
+    "request": "GET / HTTP/1.1",
+    "status": 200,
+    "bytes_sent": 612,
+    "user_agent": "curl/8.5.0",
+    "request_time": "0.004",
+    "cache_status": "HIT",
+    "upstream_time": "0.003",
+}
+
+
+def access_log_line(**values) -> str:
+    """Build an access log line in the log format of the content-cache workload.
+
+    Args:
+        values: Values overriding the defaults, by LogRecord field, e.g. cache_status, or
+            by name of a log format variable missing from LogRecord, e.g. http_referer.
+            The time is a datetime, logged in UTC.
+
+    Returns:
+        The access log line, without line terminator.
+    """
+    values = DEFAULT_VALUES | values
+    values["time"] = f"{values['time']:%d/%b/%Y:%H:%M:%S} +0000"
+    variables = {variable: values.pop(field) for field, variable in RECORD_VARIABLES.items()}
+    variables.update(values)
+    return re.sub(r"\$(\w+)", lambda match: str(variables.get(match.group(1), "-")), LOG_FORMAT)
@@ -0,0 +1,36 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""nginx cache files shared by the cache purge and cache index tests."""
+
+import hashlib
+import struct
+
+# Version of the nginx cache file header, see ngx_http_file_cache_header_t.
+CACHE_FILE_VERSION = 5
+
+
+def cache_file(cache_path, key, expires=0, body=b"body"):
+    """Write a cache file laid out like nginx does with levels=1:2.
+
+    Args:
+        cache_path: Directory of the cache.
+        key: Cache key of the response.
+        expires: Expiry timestamp of the response, in the header of the file.
+        body: Body of the cached response.
+
+    Returns:
+        The path of the cache file.
+    """
+    name = hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+    directory = cache_path / name[-1] / name[-3:-1]
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / name
+    path.write_bytes(
+        struct.pack("<Qq", CACHE_FILE_VERSION, expires)
+        + b"\x00" * 300
+        + f"\nKEY: {key}\n".encode()
+        + b"HTTP/1.1 200 OK\r\n\r\n"
+        + body
+    )
+    return path
@@ -0,0 +1,174 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+from datetime import datetime
+
+import pytest
+
+from access_log import LogParser, LogRecord, compile_log_format, read_log_format
+
+LOG_FORMAT_PATH = "content-cache_rock/nginx-logging-format.conf"
+
+
+@pytest.fixture(name="parser")
+def parser_fixture():
+    """Parser for the content_cache log format shipped in the rock."""
+    return LogParser.from_config(LOG_FORMAT_PATH)
+
+
+def test_read_log_format():
+    """
+    arrange: the nginx logging configuration shipped in the rock
+    act: read the content_cache log format from it
+    assert: the quoted parts of the format are joined
+    """
+    log_format = read_log_format(LOG_FORMAT_PATH)
+
+    assert log_format.startswith("$http_x_forwarded_for - $remote_user [$time_local] ")
+    assert log_format.endswith(" $upstream_cache_status $upstream_response_time")
+    assert "'" not in log_format
+
+
+def test_read_log_format_missing(tmp_path):
+    """
+    arrange: an nginx configuration without the log format
+    act: read the content_cache log format from it
+    assert: a ValueError is raised
+    """
+    path = tmp_path / "nginx.conf"
+    path.write_text("log_format other '$remote_addr';\n")
+
+    with pytest.raises(ValueError):
+        read_log_format(str(path))
+
+
+def test_compile_log_format():
+    """
+    arrange: a log format with quoted and bracketed variables
+    act: compile it
+    assert: each variable is captured up to the text following it
+    """
+    pattern = compile_log_format('$remote_addr [$time_local] "$request" $status $rest')
+
+    match = pattern.match('10.0.0.1 [17/Oct/2026:10:01:02 +0000] "GET / HTTP/1.1" 200 a b')
+
+    assert match
+    assert match.groupdict() == {
+        "remote_addr": "10.0.0.1",
+        "time_local": "17/Oct/2026:10:01:02 +0000",
+        "request": "GET / HTTP/1.1",
+        "status": "200",
+        "rest": "a b",
+    }
+
+
+def test_log_parser_missing_variable():
+    """
+    arrange: a log format without the cache status
+    act: create a parser for it
+    assert: a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        LogParser('$remote_addr [$time_local] "$request" $status')
+
+
+@pytest.mark.parametrize(
+    "line,expected",
+    [
+        (
+            '10.1.1.1 - - [17/Oct/2026:10:01:02 +0000] "GET /a?b=c HTTP/1.1" 200 612 "-" '
+            '"curl/8.5.0" 0.004 MISS 0.003',
+            LogRecord(
+                "10.1.1.1",
+                datetime(2026, 10, 17, 10, 1, 2),
+                "GET /a?b=c HTTP/1.1",
+                200,
+                612,
+                "curl/8.5.0",
+                0.004,
+                "MISS",
+                0.003,
+            ),
+        ),
+        (
+            '10.1.1.1, 10.2.2.2 - user [01/Jan/2026:00:00:59 +0100] "GET / HTTP/2.0" 502 0 '
+            '"https://example.com/" "Mozilla/5.0 (X11; Linux)" 1.500 - 0.500, 1.000',
+            LogRecord(
+                "10.1.1.1",
+                datetime(2026, 1, 1, 0, 0, 59),
+                "GET / HTTP/2.0",
+                502,
+                0,
+                "Mozilla/5.0 (X11; Linux)",
+                1.5,
+                "-",
+                1.5,
+            ),
+        ),
+        (
+            '- - - [31/Dec/2025:23:59:59 +0000] "\\x16\\x03" 400 150 "-" "-" 0.000 - -',
+            LogRecord(
+                "-",
+                datetime(2025, 12, 31, 23, 59, 59),
+                "\\x16\\x03",
+                400,
+                150,
+                "-",
+                0.0,
+                "-",
+                None,
+            ),
+        ),
+    ],
+)
+def test_parse(parser, line, expected):
+    """
+    arrange: access log lines in the content_cache format
+    act: parse them
+    assert: the fields are extracted and converted
+    """
+    assert parser.parse(line) == expected
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "",
+        "garbage",
+        '10.1.1.1 - - [17/Oct/2026:10:01:02 +0000] "GET / HTTP/1.1" 200 612',
+        '10.1.1.1 - - [17/Foo/2026:10:01:02 +0000] "GET / HTTP/1.1" 200 612 "-" "-" 0.1 HIT -',
+        '10.1.1.1 - - [32/Oct/2026:10:01:02 +0000] "GET / HTTP/1.1" 200 612 "-" "-" 0.1 HIT -',
+    ],
+)
+def test_parse_malformed(parser, line):
+    """
+    arrange: malformed access log lines
+    act: parse them
+    assert: None is returned
+    """
+    assert parser.parse(line) is None
+
+
+def test_parse_time_cached(parser):
+    """
+    arrange: two timestamps in the same second
+    act: parse them
+    assert: the same datetime is returned without parsing the second one again
+    """
+    first = parser.parse_time("17/Oct/2026:10:01:02 +0000")
+
+    assert parser.parse_time("17/Oct/2026:10:01:02 +0000") is first
+    assert parser.parse_time("17/Oct/2026:10:01:03 +0000") == datetime(2026, 10, 17, 10, 1, 3)
+
+
+def test_record_uri(parser):
+    """
+    arrange: log records with well-formed and malformed request lines
+    act: get their URI
+    assert: the URI is extracted from well-formed request lines only
+    """
+    record = parser.parse(
+        '- - - [17/Oct/2026:10:01:02 +0000] "GET /a?b HTTP/1.1" 200 1 "-" "-" 0.1 HIT -'
+    )
+    assert record.uri == "/a?b"
+    record.request = "garbage"
+    assert record.uri == "garbage"
@@ -0,0 +1,162 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+import os
+import struct
+import time
+
+import pytest
+from cache_files import cache_file
+
+from cache_index import (
+    IN_CREATE,
+    IN_DELETE,
+    IN_ISDIR,
+    IN_MOVED_TO,
+    IN_Q_OVERFLOW,
+    CacheIndex,
+    Inotify,
+    group_uri,
+    handle_event,
+    read_expiry,
+)
+
+
+@pytest.fixture(name="index")
+def index_fixture():
+    """An empty in-memory cache index."""
+    index = CacheIndex(":memory:")
+    yield index
+    index.close()
+
+
+def test_read_expiry(tmp_path):
+    """
+    arrange: a cache file and a file with another header version
+    act: read their expiry
+    assert: the expiry is only read from the known header version
+    """
+    path = cache_file(tmp_path, "httpsite-backend/a", expires=1700000000)
+    other = tmp_path / "other"
+    other.write_bytes(struct.pack("<Qq", 4, 1700000000))
+
+    assert read_expiry(str(path)) == 1700000000
+    assert read_expiry(str(other)) is None
+
+
+@pytest.mark.parametrize(
+    "uri, depth, expected",
+    [
+        ("/images/2024/logo.png?v=2", 1, "/images/"),
+        ("/images/2024/logo.png", 2, "/images/2024/"),
+        ("/images/logo.png", 2, "/images/logo.png"),
+        ("/index.html?a/b", 1, "/index.html"),
+    ],
+)
+def test_group_uri(uri, depth, expected):
+    """
+    arrange: a request URI and a depth
+    act: group the URI
+    assert: the URI is cut after depth path segments
+    """
+    assert group_uri(uri, depth) == expected
+
+
+def test_index_find_and_purge(tmp_path, index):
+    """
+    arrange: an index rebuilt from a cache directory, including a slice
+    act: find and purge entries by exact URI, prefix and glob
+    assert: the matching files are found, removed and dropped from the index
+    """
+    logo = cache_file(tmp_path, "httpsite-backend/img/logo.png")
+    iso = cache_file(tmp_path, "httpsite-backend/big.isobytes=0-1048575")
+    page = cache_file(tmp_path, "httpsite-backend/index.html")
+    index.rebuild([str(tmp_path), str(tmp_path / "missing")])
+
+    assert [path for path, _ in index.find("https://site/big.iso")] == [str(iso)]
+    assert [path for path, _ in index.find("/img/", "prefix")] == [str(logo)]
+    assert [path for path, _ in index.find("/*.html", "glob")] == [str(page)]
+    with pytest.raises(ValueError):
+        list(index.find("/", "regex"))
+
+    size = logo.stat().st_size
+    assert index.purge("/img/", "prefix", dry_run=True) == {"entries": 1, "bytes": size}
+    assert logo.exists()
+    assert index.purge("/img/", "prefix") == {"entries": 1, "bytes": size}
+    assert not logo.exists()
+    assert not list(index.find("/img/", "prefix"))
+    assert page.exists()
+
+
+def test_index_inventory(tmp_path, index):
+    """
+    arrange: an index of entries under two paths and two hosts, one of them expired
+    act: report the inventory by path and by host
+    assert: entries, bytes and expired entries are summed per group, largest first
+    """
+    future = int(time.time()) + 3600
+    images = [
+        cache_file(tmp_path, "httpsite-backend/img/a.png", future, b"x" * 100),
+        cache_file(tmp_path, "httpsite-backend/img/b.png", 1, b"x" * 100),
+    ]
+    cache_file(tmp_path, "httpsother-backend/css/a.css", future)
+    index.rebuild([str(tmp_path)])
+
+    by_path = index.inventory()
+    by_host = index.inventory(group_by="host", limit=1)
+
+    assert [(group["group"], group["entries"], group["expired"]) for group in by_path] == [
+        ("/img/", 2, 1),
+        ("/css/", 1, 0),
+    ]
+    assert by_path[0]["bytes"] == sum(path.stat().st_size for path in images)
+    assert [group["group"] for group in by_host] == ["httpsite-backend"]
+    assert index.inventory(prefix="/css/")[0]["entries"] == 1
+
+
+def test_watch_events(tmp_path, index):
+    """
+    arrange: an inotify instance watching an empty cache directory
+    act: create a hash directory with a cache file moved into it, then delete the file
+    assert: the index follows the cache tree, ignoring temporary files
+    """
+    inotify = Inotify()
+    inotify.add_tree(str(tmp_path))
+
+    def _wait_for(condition):
+        """Handle events until the condition holds, for a few seconds at most."""
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            for mask, path in inotify.read_events(timeout=0.1):
+                assert not handle_event(index, inotify, mask, path)
+        return condition()
+
+    try:
+        (tmp_path / "a").mkdir()
+        path = cache_file(tmp_path, "httpsite-backend/a")
+        temporary = path.with_name(f"{path.name}.0000000001")
+        os.rename(path, temporary)
+        os.rename(temporary, path)
+        assert _wait_for(lambda: list(index.find("/a")))
+        assert [found for found, _ in index.find("/", "prefix")] == [str(path)]
+
+        path.unlink()
+        assert _wait_for(lambda: not list(index.find("/a")))
+    finally:
+        inotify.close()
+
+
+def test_handle_event(tmp_path, index):
+    """
+    arrange: an index with entries under a hash directory
+    act: handle a queue overflow, a file creation and the deletion of the directory
+    assert: overflows request a rebuild and the entries of deleted directories are dropped
+    """
+    path = cache_file(tmp_path, "httpsite-backend/a")
+    index.rebuild([str(tmp_path)])
+    directory = str(path.parent.parent)
+
+    assert handle_event(index, None, IN_Q_OVERFLOW, "")
+    assert not handle_event(index, None, IN_MOVED_TO, str(path))
+    assert not handle_event(index, None, IN_CREATE, f"{path}.0000000002")
+    assert not handle_event(index, None, IN_DELETE | IN_ISDIR, directory)
+    assert not list(index.find("/a"))
@@ -0,0 +1,117 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+import json
+
+import pytest
+from cache_files import cache_file
+
+from cache_purge import Purger, is_cache_file_name, main, make_matcher, read_key
+
+
+@pytest.mark.parametrize(
+    "name,expected", [("1a2b3c", True), ("1a2b3c.0000000001", False), (".1a2b3c", False)]
+)
+def test_is_cache_file_name(name, expected):
+    """
+    arrange: names of cache files and of the temporary files of cache files being written
+    act: check the names
+    assert: only the cache files are recognized
+    """
+    assert is_cache_file_name(name) == expected
+
+
+def test_read_key(tmp_path):
+    """
+    arrange: a cache file, a file without key and a file whose key is not terminated
+    act: read their keys
+    assert: only the complete key is returned
+    """
+    path = cache_file(tmp_path, "httpsite-backend/a?b=1")
+    (tmp_path / "empty").write_bytes(b"\x00" * 10)
+    (tmp_path / "partial").write_bytes(b"\x00\nKEY: httpsite-backend/a")
+
+    assert read_key(str(path)) == "httpsite-backend/a?b=1"
+    assert read_key(str(tmp_path / "empty")) is None
+    assert read_key(str(tmp_path / "partial")) is None
+
+
+@pytest.mark.parametrize(
+    "target, match, key, expected",
+    [
+        pytest.param("/a", "exact", "httpsite-backend/a", True, id="exact"),
+        pytest.param("/a", "exact", "httpsite-backend/ab", False, id="exact other"),
+        pytest.param("/a", "exact", "httpsite-backend/abytes=0-1023", True, id="exact slice"),
+        pytest.param("https://site/a?b=1", "exact", "httpsbackend/a?b=1", True, id="url"),
+        pytest.param("/a", "exact", "httpsite-backend/a gzip, br", True, id="exact headers"),
+        pytest.param(
+            "/a", "exact", "httpsite-backend/abytes=0-1023 gzip", True, id="exact slice headers"
+        ),
+        pytest.param("/img/", "prefix", "httpsite-backend/img/x.png", True, id="prefix"),
+        pytest.param("/img/", "prefix", "httpsite-backend/css/x", False, id="prefix other"),
+        pytest.param("/img/*.png", "glob", "httpsite-backend/img/a/b.png", True, id="glob"),
+        pytest.param("/img/*.png", "glob", "httpsite-backend/img/b.jpg", False, id="glob other"),
+    ],
+)
+def test_make_matcher(target, match, key, expected):
+    """
+    arrange: a purge target and match mode
+    act: match a cache key
+    assert: the request URI of the key is compared to the target
+    """
+    assert make_matcher(target, match)(key) is expected
+
+
+def test_make_matcher_invalid():
+    """
+    arrange: an unknown match mode
+    act: create a matcher
+    assert: a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        make_matcher("/", "regex")
+
+
+def test_purger(tmp_path):
+    """
+    arrange: two cache directories with matching and other entries, and a temporary file
+    act: purge a prefix, first as a dry run
+    assert: only the matching entries are removed and counted with their size
+    """
+    main_path, tier_path = tmp_path / "cache", tmp_path / "large"
+    purged = [
+        cache_file(main_path, "httpsite-backend/img/a.png"),
+        cache_file(tier_path, "httpsite-backend/img/b.iso", body=b"x" * 1000),
+    ]
+    kept = cache_file(main_path, "httpsite-backend/index.html")
+    temporary = kept.with_name(f"{kept.name}.0000000001")
+    temporary.write_bytes(kept.read_bytes())
+    size = sum(path.stat().st_size for path in purged)
+    progress = []
+
+    dry_run = Purger(make_matcher("/img/", "prefix"), dry_run=True)
+    dry_run.purge([str(main_path), str(tier_path), str(tmp_path / "missing")])
+    purger = Purger(make_matcher("/img/", "prefix"))
+    purger.purge([str(main_path), str(tier_path)], progress=lambda *args: progress.append(args))
+
+    assert dry_run.entries == purger.entries == 2
+    assert dry_run.bytes == purger.bytes == size
+    assert purger.scanned == 3
+    assert not any(path.exists() for path in purged)
+    assert kept.exists() and temporary.exists()
+    assert progress[-1] == (len(progress), len(progress))
+
+
+def test_main(tmp_path, capsys):
+    """
+    arrange: a cache directory with an entry
+    act: purge it from the command line
+    assert: the totals are printed as JSON and the progress on stderr
+    """
+    path = cache_file(tmp_path, "httpsite-backend/a")
+    size = path.stat().st_size
+
+    main(["https://site/a", str(tmp_path)])
+
+    captured = capsys.readouterr()
+    assert json.loads(captured.out) == {"entries": 1, "bytes": size, "scanned": 1}
+    assert "1/1 directories scanned, 1 entries" in captured.err
@@ -0,0 +1,128 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from access_logs import LOG_FORMAT_PATH, access_log_line
+
+from access_log import LogParser
+from cache_warmer import RateLimiter, main, recent_uris, warm
+
+PARSER = LogParser.from_config(LOG_FORMAT_PATH)
+NOW = datetime.now()
+
+
+async def _serve(statuses):
+    """Start an HTTP server answering with a status and cache status per path."""
+
+    async def _handle(reader, writer):
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        path = request_line.split()[1].decode()
+        status, cache_status = statuses.get(path, (404, "-"))
+        writer.write(
+            f"HTTP/1.1 {status} OK\r\nX-Cache-Status: {cache_status} from pod model\r\n"
+            "Content-Length: 4\r\n\r\nbody".encode()
+        )
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(_handle, "127.0.0.1", 0)
+
+
+def test_recent_uris(tmp_path):
+    """
+    arrange: an access log with requests before and within the window
+    act: list the most requested URIs
+    assert: only successful GET requests within the window, other than previous warm-ups,
+        are counted, most requested first
+    """
+    log_path = tmp_path / "access.log"
+    lines = [
+        access_log_line(time=NOW - timedelta(hours=2), request="GET /old HTTP/1.1"),
+        access_log_line(time=NOW, request="GET /a HTTP/1.1"),
+        access_log_line(time=NOW, request="GET /a HTTP/1.1"),
+        access_log_line(time=NOW, request="GET /b?x=1 HTTP/1.1"),
+        access_log_line(time=NOW, request="GET /b?x=2 HTTP/1.1"),
+        access_log_line(time=NOW, request="GET /b?x=3 HTTP/1.1"),
+        access_log_line(time=NOW, request="GET /c HTTP/1.1", status=404),
+        access_log_line(time=NOW, request="POST /d HTTP/1.1"),
+        access_log_line(time=NOW, request="GET /e HTTP/1.1", user_agent="content-cache-warmer"),
+        "malformed",
+    ]
+    log_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    since = NOW - timedelta(hours=1)
+
+    assert recent_uris(str(log_path), since, PARSER, 1) == ["/a"]
+    assert recent_uris(str(log_path), since, PARSER, 10, strip_query=True) == ["/b", "/a"]
+
+
+def test_rate_limiter():
+    """
+    arrange: a limiter allowing 100 requests per second
+    act: wait for 5 request slots
+    assert: the requests are spaced out by the rate
+    """
+    limiter = RateLimiter(100)
+
+    async def _wait():
+        start = time.monotonic()
+        for _ in range(5):
+            await limiter.wait()
+        return time.monotonic() - start
+
+    assert asyncio.run(_wait()) >= 0.039
+
+
+def test_warm(capsys):
+    """
+    arrange: a server answering with a cached, an uncached and a missing object
+    act: warm these objects and one on a closed port
+    assert: hits, misses and failures are counted and progress is reported
+    """
+
+    async def _warm():
+        server = await _serve({"/hit": (200, "HIT"), "/miss": (200, "MISS")})
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await warm(["/hit", "/miss", "/missing"], "mysite.local", port=port, rate=0)
+
+    result = asyncio.run(_warm())
+
+    assert result == {
+        "requests": 3,
+        "hits": 1,
+        "misses": 1,
+        "failures": 1,
+        "failed": ["/missing (404)"],
+    }
+    assert "3/3 fetched, 1 hits, 1 misses, 1 failures" in capsys.readouterr().err
+
+
+def test_main_connection_error(capsys):
+    """
+    arrange: nothing listens on port 1
+    act: warm URLs from the command line
+    assert: duplicate URLs are fetched once and the connection failure is reported
+    """
+    main(["mysite.local", "https://mysite.local/a", "/a", "--port", "1"])
+
+    result = json.loads(capsys.readouterr().out)
+    assert result["requests"] == 1
+    assert result["failures"] == 1
+    assert result["failed"][0].startswith("/a (")
+
+
+def test_main_requires_urls():
+    """
+    arrange: neither URLs nor an access log
+    act: run the warmer
+    assert: it exits with a usage error
+    """
+    with pytest.raises(SystemExit):
+        main(["mysite.local"])
@@ -1,15 +1,15 @@
 # Copyright 2025 Canonical Ltd.
 # See LICENSE file for licensing details.
 import copy
-import io
-from datetime import datetime, timedelta
+import json
+import re
 from unittest import mock
 
 import pytest
-from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus
-from ops.testing import Harness
+from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, WaitingStatus
+from ops.testing import ActionFailed, ExecResult, Harness
 
-from charm import CONTAINER_PORT, ContentCacheCharm
+from charm import CONTAINER_PORT, ContentCacheCharm, parse_size
 
 BASE_CONFIG = {
     "site": "mysite.local",
@@ -27,9 +27,21 @@ JUJU_ENV_CONFIG = {
     "NGINX_BACKEND_SITE_NAME": "mybackend.local",
     "NGINX_CACHE_ALL": False,
     "NGINX_CACHE_INACTIVE_TIME": "10m",
+    "NGINX_CACHE_KEY": "",
+    "NGINX_CACHE_KEY_MAPS": "",
+    "NGINX_CACHE_KEY_URI": "$request_uri",
+    "NGINX_CACHE_LOADER": "loader_files=100 loader_sleep=50ms loader_threshold=200ms",
     "NGINX_CACHE_MAX_SIZE": "10G",
     "NGINX_CACHE_PATH": "/var/lib/nginx/proxy/cache",
+    "NGINX_CACHE_BACKGROUND_UPDATE": "off",
+    "NGINX_CACHE_LOCK": "off",
+    "NGINX_CACHE_LOCK_TIMEOUT": "5s",
+    "NGINX_CACHE_MIN_USES": 1,
+    "NGINX_CACHE_PORT": 8080,
     "NGINX_CACHE_REVALIDATE": "off",
+    "NGINX_CACHE_RULES": "",
+    "NGINX_CACHE_SLICE": "",
+    "NGINX_CACHE_TIERS": "",
     "NGINX_CACHE_USE_STALE": "error timeout updating http_500 http_502 http_503 http_504",
     "NGINX_CACHE_VALID": "200 1h",
     "NGINX_CLIENT_MAX_BODY_SIZE": "1m",
@@ -61,10 +73,6 @@ PEBBLE_CONFIG = {
     },
 }
 
-DATE_NOW = datetime.now().strftime("%d/%b/%Y:%H:%M:%S")
-DATE_20 = (datetime.now() - timedelta(minutes=20, seconds=5)).strftime("%d/%b/%Y:%H:%M:%S")
-DATE_19 = (datetime.now() - timedelta(minutes=19, seconds=55)).strftime("%d/%b/%Y:%H:%M:%S")
-
 
 class TestCharm:
     """Unit test battery for the content-cache charm.
@@ -166,76 +174,409 @@ class TestCharm:
         """
         config = self.config
         harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
         harness.update_config(config)
         make_pebble_config.assert_called_once()
         make_nginx_config.assert_called_once()
-        assert add_layer.call_count == 2
+        assert add_layer.call_count == 3
         assert harness.charm.unit.status, ActiveStatus("Ready")
 
-    @mock.patch("ops.model.Container.pull")
-    @pytest.mark.parametrize(
-        "test_input,expected",
-        [
-            ("", []),
-            (
-                f"10.10.10.11 - - [{DATE_NOW}\n"
-                f"10.10.10.11 - - [{DATE_NOW}\n"
-                f"10.10.10.11 - - [{DATE_NOW}\n"
-                f"10.10.10.12 - - [{DATE_NOW}\n"
-                f"10.10.10.12 - - [{DATE_NOW}",
-                [("10.10.10.11", 3), ("10.10.10.12", 2)],
-            ),
-            (
-                f"10.10.10.11 - - [{DATE_NOW}\n"
-                f"10.10.10.11 - - [{DATE_NOW}\n"
-                f"10.10.10.11 - - [{DATE_NOW}",
-                [("10.10.10.11", 3)],
-            ),
-            (f"10.10.10.11 - - [{DATE_NOW}", [("10.10.10.11", 1)]),
-            (
-                f"10.10.10.12 - - [{DATE_20}\n10.10.10.10 - - [{DATE_19}\n",
-                [("10.10.10.10", 1)],
-            ),
-        ],
-    )
-    def test_report_visits_by_ip(self, mock_pull, test_input, expected):
+    def test_report_visits_by_ip(self):
         """
-        arrange: some nginx log lines are simulated
-        act: process the log line
-        assert: only the log lines logged less than 20 minutes ago are accepted
+        arrange: the log report helper in the workload returns some counts
+        act: run the report-visits-by-ip action
+        assert: the helper is pushed and run in the workload and its counts are tabulated
         """
-        mock_pull.return_value = io.StringIO(test_input)
-        action = self.harness.charm._report_visits_by_ip()
-        assert action == expected
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        executed = []
 
-    @pytest.mark.parametrize(
-        "test_input,expected", [(f"10.10.10.11 - - [{DATE_NOW}", "10.10.10.11")]
-    )
-    def test_get_ip(self, test_input, expected):
+        def handler(args):
+            executed.append(args.command)
+            return ExecResult(stdout='[["10.10.10.11", 3], ["10.10.10.12", 2]]')
+
+        harness.handle_exec(CONTAINER_NAME, ["python3"], handler=handler)
+
+        output = harness.run_action("report-visits-by-ip", {"window": "1h"})
+
+        assert executed == [
+            [
+                "python3",
+                "/srv/content-cache/bin/log_report.py",
+                "visits",
+                "/var/log/nginx/access.log",
+                "--window",
+                "1h",
+                "--group-by",
+                "ip",
+                "--limit",
+                "100",
+            ]
+        ]
+        container = harness.charm.unit.get_container(CONTAINER_NAME)
+        assert container.exists("/srv/content-cache/bin/access_log.py")
+        assert container.exists("/srv/content-cache/bin/file_reader.py")
+        assert container.exists("/srv/content-cache/bin/log_report.py")
+        assert container.exists("/srv/content-cache/bin/sketches.py")
+        assert "10.10.10.11 |          3" in output.results["ips"]
+        assert "10.10.10.12 |          2" in output.results["ips"]
+
+    def test_report_visits_by_ip_group_by(self):
+        """
+        arrange: the log report helper in the workload returns counts by user agent
+        act: run the report-visits-by-ip action grouping by user agent with a limit
+        assert: the grouping and limit are passed to the helper and its counts are tabulated
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        executed = []
+
+        def handler(args):
+            executed.append(args.command)
+            return ExecResult(stdout='[["snapd/2.61", 30]]')
+
+        harness.handle_exec(CONTAINER_NAME, ["python3"], handler=handler)
+
+        output = harness.run_action("report-visits-by-ip", {"group-by": "user-agent", "limit": 5})
+
+        assert executed[0][-6:] == ["--window", "20m", "--group-by", "user-agent", "--limit", "5"]
+        assert "ips" not in output.results
+        assert "User agent" in output.results["visits"]
+        assert "snapd/2.61" in output.results["visits"]
+
+    def test_report_cache_stats(self):
+        """
+        arrange: the log report helper in the workload returns cache statistics
+        act: run the report-cache-stats action
+        assert: the statistics are returned with formatted ratios and a table by status
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        executed = []
+        stats = {
+            "requests": 4,
+            "hit_ratio": 0.75,
+            "bytes_from_cache": 300,
+            "bytes_from_origin": 100,
+            "byte_hit_ratio": 0.75,
+            "statuses": [
+                {
+                    "status": "HIT",
+                    "requests": 3,
+                    "bytes": 300,
+                    "p50": 0.001,
+                    "p95": 0.002,
+                    "p99": 0.002,
+                },
+                {
+                    "status": "MISS",
+                    "requests": 1,
+                    "bytes": 100,
+                    "p50": None,
+                    "p95": None,
+                    "p99": None,
+                },
+            ],
+        }
+
+        def handler(args):
+            executed.append(args.command)
+            return ExecResult(stdout=json.dumps(stats))
+
+        harness.handle_exec(CONTAINER_NAME, ["python3"], handler=handler)
+
+        output = harness.run_action("report-cache-stats", {"window": "1h"})
+
+        assert executed[0][2:] == ["cache-stats", "/var/log/nginx/access.log", "--window", "1h"]
+        assert output.results["requests"] == 4
+        assert output.results["hit-ratio"] == "75.00%"
+        assert output.results["bytes-from-origin"] == 100
+        assert (
+            "| HIT            |          3 |     300 |     0.001 |"
+            in output.results["cache-statuses"]
+        )
+
+    def test_report_top_misses(self):
+        """
+        arrange: the log report helper in the workload returns the top misses
+        act: run the report-top-misses action stripping query strings
+        assert: the parameters are passed to the helper and the misses are tabulated
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        executed = []
+        misses = [{"uri": "/big.iso", "misses": 3, "bytes": 3000, "upstream_time": 0.5}]
+
+        def handler(args):
+            executed.append(args.command)
+            return ExecResult(stdout=json.dumps(misses))
+
+        harness.handle_exec(CONTAINER_NAME, ["python3"], handler=handler)
+
+        output = harness.run_action("report-top-misses", {"strip-query": True})
+
+        assert executed[0][2:] == [
+            "top-misses",
+            "/var/log/nginx/access.log",
+            "--window",
+            "20m",
+            "--limit",
+            "20",
+            "--strip-query",
+        ]
+        assert (
+            "| /big.iso |        3 |    3000 |                   0.500 |"
+            in output.results["misses"]
+        )
+
+    def test_purge_cache(self):
+        """
+        arrange: a cache tier and the purge helper in the workload reporting progress
+        act: run the purge-cache action with a glob
+        assert: the main and tier cache paths are scanned, progress is logged and the totals
+            are returned
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        harness.update_config({"cache_tiers": "- {name: large, max_size: 100g, uri: '\\.iso$'}"})
+        executed = []
+
+        def handler(args):
+            executed.append(args.command)
+            return ExecResult(
+                stdout=json.dumps({"entries": 2, "bytes": 4096, "scanned": 10}),
+                stderr="16/32 directories scanned, 1 entries (2048 bytes) purged\n",
+            )
+
+        harness.handle_exec(CONTAINER_NAME, ["python3"], handler=handler)
+
+        output = harness.run_action("purge-cache", {"target": "/img/*.png", "match": "glob"})
+
+        assert executed[0][1:] == [
+            "/srv/content-cache/bin/cache_purge.py",
+            "/img/*.png",
+            "/var/lib/nginx/proxy/cache",
+            "/var/lib/nginx/proxy/large",
+            "--match",
+            "glob",
+        ]
+        assert output.logs == ["16/32 directories scanned, 1 entries (2048 bytes) purged"]
+        assert output.results == {"entries": 2, "bytes": 4096, "scanned": 10}
+
+    def test_purge_cache_exec_error(self):
+        """
+        arrange: the purge helper fails in the workload
+        act: run the purge-cache action
+        assert: the action fails
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        harness.handle_exec(
+            CONTAINER_NAME, ["python3"], result=ExecResult(exit_code=1, stderr="Traceback")
+        )
+
+        with pytest.raises(ActionFailed):
+            harness.run_action("purge-cache", {"target": "/", "match": "prefix"})
+
+    def test_purge_cache_index(self):
+        """
+        arrange: the cache index is enabled
+        act: run the purge-cache action
+        assert: the entries are looked up in the index rather than by scanning the cache
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        harness.update_config({"cache_index": True})
+        executed = []
+
+        def handler(args):
+            executed.append(args.command)
+            return ExecResult(stdout=json.dumps({"entries": 1, "bytes": 512}))
+
+        harness.handle_exec(CONTAINER_NAME, ["python3"], handler=handler)
+
+        output = harness.run_action("purge-cache", {"target": "/a", "dry-run": True})
+
+        assert executed[0][1:] == [
+            "/srv/content-cache/bin/cache_index.py",
+            "--db",
+            "/var/lib/nginx/proxy/cache-index.sqlite",
+            "purge",
+            "/a",
+            "--match",
+            "exact",
+            "--dry-run",
+        ]
+        assert output.results == {"entries": 1, "bytes": 512}
+
+    def test_report_cache_inventory(self):
+        """
+        arrange: the cache index is enabled and returns some groups
+        act: run the report-cache-inventory action grouping by host
+        assert: the parameters are passed to the helper and the groups are tabulated, named
+            after the sites whose upstream is in the cache key
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        harness.update_config(
+            {
+                **self.config,
+                "cache_index": True,
+                "sites": "- {site: docs.local, backend: 'https://docs:443', cache_max_size: 1g}",
+            }
+        )
+        executed = []
+        charm = harness.charm
+        groups = [
+            {"group": "httpsite-backend", "entries": 3, "bytes": 3000, "expired": 1},
+            {
+                "group": f"http{charm._generate_upstream_name('mysite.local')}",
+                "entries": 2,
+                "bytes": 2000,
+                "expired": 0,
+            },
+            {
+                "group": f"https{charm._generate_upstream_name('docs.local')}",
+                "entries": 1,
+                "bytes": 1000,
+                "expired": 0,
+            },
+        ]
+
+        def handler(args):
+            executed.append(args.command)
+            return ExecResult(stdout=json.dumps(groups))
+
+        harness.handle_exec(CONTAINER_NAME, ["python3"], handler=handler)
+
+        output = harness.run_action("report-cache-inventory", {"group-by": "host"})
+
+        assert executed[0][4:] == [
+            "inventory",
+            "--prefix",
+            "/",
+            "--group-by",
+            "host",
+            "--depth",
+            "1",
+            "--limit",
+            "20",
+        ]
+        inventory = output.results["inventory"]
+        assert "| httpsite-backend |         3 |    3000 |         1 |" in inventory
+        assert "| mysite.local     |         2 |    2000 |         0 |" in inventory
+        assert "| docs.local       |         1 |    1000 |         0 |" in inventory
+
+    def test_report_cache_inventory_disabled(self):
+        """
+        arrange: the cache index is disabled
+        act: run the report-cache-inventory action
+        assert: the action fails
         """
-        arrange: some nginx log lines are simulated
-        act: process the log line
-        assert: return the IP of the log line
+        with pytest.raises(ActionFailed):
+            self.harness.run_action("report-cache-inventory")
+
+    @pytest.mark.parametrize("enabled, startup", [(False, "disabled"), (True, "enabled")])
+    def test_get_cache_index_pebble_config(self, enabled, startup):
+        """
+        arrange: a cache tier, with the cache index enabled or not
+        act: generate the cache index pebble layer
+        assert: the service watches the main and tier caches and starts if enabled
         """
-        action = self.harness.charm._get_ip(test_input)
-        assert action == expected
+        harness = self.harness
+        harness.disable_hooks()
+        harness.update_config(
+            {
+                "cache_index": enabled,
+                "cache_tiers": "- {name: large, max_size: 100g, uri: '\\.iso$'}",
+            }
+        )
+
+        layer = harness.charm._get_cache_index_pebble_config()
+
+        service = layer["services"]["content-cache-index"]
+        assert service["command"] == (
+            "python3 /srv/content-cache/bin/cache_index.py"
+            " --db /var/lib/nginx/proxy/cache-index.sqlite"
+            " watch /var/lib/nginx/proxy/cache /var/lib/nginx/proxy/large"
+        )
+        assert service["startup"] == startup
 
     @pytest.mark.parametrize(
-        "test_input,expected",
+        "params, expected_args",
         [
-            (f"10.10.10.11 - - [{DATE_19}", True),
-            ("", False),
-            (f"10.10.10.11 - - [{DATE_20}", False),
+            pytest.param(
+                {"urls": "/a https://mysite.local/b"},
+                ["/a", "https://mysite.local/b", "--port", "8080", "--concurrency", "8"],
+                id="urls",
+            ),
+            pytest.param(
+                {"window": "24h", "limit": 10, "strip-query": True},
+                ["--port", "8080", "--concurrency", "8", "--rate", "20", "--log-path"],
+                id="access log",
+            ),
         ],
     )
-    def test_filter_lines(self, test_input, expected):
+    def test_warm_cache(self, params, expected_args):
+        """
+        arrange: the warmer helper in the workload reporting progress and a failure
+        act: run the warm-cache action with URLs or from the access log
+        assert: the helper fetches through the site, progress is logged and the totals and
+            failures are returned
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        harness.disable_hooks()
+        harness.update_config(self.config)
+        harness.enable_hooks()
+        executed = []
+        warmed = {"requests": 2, "hits": 0, "misses": 1, "failures": 1, "failed": ["/b (404)"]}
+
+        def handler(args):
+            executed.append(args.command)
+            return ExecResult(
+                stdout=json.dumps(warmed), stderr="2/2 fetched, 0 hits, 1 misses, 1 failures\n"
+            )
+
+        harness.handle_exec(CONTAINER_NAME, ["python3"], handler=handler)
+
+        output = harness.run_action("warm-cache", params)
+
+        command = executed[0]
+        assert command[1:3] == ["/srv/content-cache/bin/cache_warmer.py", "mysite.local"]
+        assert command[3 : 3 + len(expected_args)] == expected_args
+        if "urls" not in params:
+            assert command[-6:] == [
+                "/var/log/nginx/access.log",
+                "--window",
+                "24h",
+                "--limit",
+                "10",
+                "--strip-query",
+            ]
+        assert output.logs == ["2/2 fetched, 0 hits, 1 misses, 1 failures"]
+        assert output.results == {
+            "requests": 2,
+            "hits": 0,
+            "misses": 1,
+            "failures": 1,
+            "failed": "/b (404)",
+        }
+
+    def test_report_visits_by_ip_exec_error(self):
         """
-        arrange: a nginx log line is simulated
-        act: process the log line
-        assert: only the line logged less than 20 minutes ago is accepted.
+        arrange: the log report helper fails in the workload
+        act: run the report-visits-by-ip action
+        assert: the action fails
         """
-        action = self.harness.charm._filter_lines(test_input)
-        assert action == expected
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        harness.handle_exec(
+            CONTAINER_NAME, ["python3"], result=ExecResult(exit_code=1, stderr="No such file")
+        )
+
+        with pytest.raises(ActionFailed):
+            harness.run_action("report-visits-by-ip")
 
     @mock.patch("charm.ContentCacheCharm._make_pebble_config")
     @mock.patch("ops.model.Container.add_layer")
@@ -285,12 +626,13 @@ class TestCharm:
         """
         config = self.config
         harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
 
         config = copy.deepcopy(BASE_CONFIG)
-        make_pebble_config.return_value = {"services": "content-cache"}
+        make_pebble_config.return_value = {"services": {"content-cache": {}}}
         harness.update_config(config)
         make_pebble_config.assert_called_once()
-        assert add_layer.call_count == 2
+        assert add_layer.call_count == 3
         assert harness.charm.unit.status == ActiveStatus("Ready")
 
     @mock.patch("charm.ContentCacheCharm._make_pebble_config")
@@ -321,10 +663,11 @@ class TestCharm:
         """
         config = self.config
         harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
 
         config = copy.deepcopy(BASE_CONFIG)
         harness.update_config(config)
-        assert make_pebble_config.call_count == 2
+        assert make_pebble_config.call_count == 3
         assert harness.charm.unit.status == ActiveStatus("Ready")
         container = harness.charm.unit.get_container(CONTAINER_NAME)
         assert container.isdir(CACHE_PATH)
@@ -355,6 +698,7 @@ class TestCharm:
         """
         config = self.config
         harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
 
         config = copy.deepcopy(BASE_CONFIG)
         make_pebble_config.return_value = {"services": {}}
@@ -436,6 +780,24 @@ class TestCharm:
         expected["tls-secret-name"] = "mysite-com-tls"  # nosec
         assert harness.charm._make_ingress_config() == expected
 
+    def test_make_ingress_config_sites(self):
+        """
+        arrange: define additional sites
+        act: generate the ingress config
+        assert: the ingress routes the hostnames of the sites too
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["sites"] = """
+- {site: docs.local, backend: "http://docs:80", cache_max_size: 1g}
+- {site: api.local, backend: "http://api:80", cache_max_size: 1g}
+"""
+        harness.update_config(self.config)
+
+        ingress_config = harness.charm._make_ingress_config()
+
+        assert ingress_config["additional-hostnames"] == "docs.local,api.local"
+
     def test_make_ingress_config_with_proxy_relation(self):
         """
         arrange: set nginx-proxy relation
@@ -470,9 +832,19 @@ class TestCharm:
         expected["CONTAINER_PORT"] = 8080
         expected["CONTENT_CACHE_BACKEND"] = "http://mybackend.local:80"
         expected["CONTENT_CACHE_SITE"] = "mysite.local"
-        expected["NGINX_BACKEND"] = "http://mybackend.local:80"
+        expected["NGINX_BACKEND"] = "http://39c631ffb52d-backend"
         expected["NGINX_KEYS_ZONE"] = harness.charm._generate_keys_zone("mysite.local")
+        expected["NGINX_KEYS_ZONE_SIZE"] = "11m"
+        expected["NGINX_PROXY_CACHE"] = expected["NGINX_KEYS_ZONE"]
+        expected["NGINX_SHARDING"] = ""
         expected["NGINX_SITE_NAME"] = "mysite.local"
+        expected["NGINX_UPSTREAM"] = "39c631ffb52d-backend"
+        expected["NGINX_UPSTREAM_CONFIG"] = (
+            "server mybackend.local:80 max_fails=1 fail_timeout=10s;\n"
+            "    keepalive 32;\n"
+            "    keepalive_requests 1000;\n"
+            "    keepalive_timeout 60s;"
+        )
         expected["NGINX_CACHE_ALL"] = "proxy_ignore_headers Cache-Control Expires"
         assert harness.charm._make_env_config() == expected
 
@@ -501,6 +873,258 @@ class TestCharm:
         new_site = new_env_config["CONTENT_CACHE_SITE"]
         assert new_site == relations_data["service-hostname"]
 
+    def test_make_env_config_upstream_pool(self):
+        """
+        arrange: set nginx-proxy relation with several backend units
+        act: add and remove backend units
+        assert: the upstream pools all the backend units with the configured balancing
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["upstream_balancing"] = "uri-hash"
+        self.config["upstream_max_fails"] = 3
+        self.config["upstream_fail_timeout"] = "30s"
+        self.config["upstream_keepalive"] = 0
+        harness.update_config(self.config)
+        relation_id = harness.add_relation("nginx-proxy", "hello-kubecon")
+        harness.update_relation_data(
+            relation_id,
+            "hello-kubecon",
+            {
+                "service-name": "test-proxy",
+                "service-hostname": "foo.internal",
+                "service-port": "8000",
+            },
+        )
+        for unit in ("hello-kubecon/0", "hello-kubecon/1", "hello-kubecon/2"):
+            harness.add_relation_unit(relation_id, unit)
+        harness.remove_relation_unit(relation_id, "hello-kubecon/1")
+
+        env_config = harness.charm._make_env_config()
+
+        assert env_config["NGINX_BACKEND"] == f"http://{env_config['NGINX_UPSTREAM']}"
+        domain = "test-proxy-endpoints.None.svc.cluster.local:8000"
+        assert env_config["NGINX_UPSTREAM_CONFIG"].split("\n    ") == [
+            "hash $request_uri consistent;",
+            f"server hello-kubecon-0.{domain} max_fails=3 fail_timeout=30s;",
+            f"server hello-kubecon-2.{domain} max_fails=3 fail_timeout=30s;",
+        ]
+
+    @pytest.mark.parametrize(
+        "backend,server,proxy_pass",
+        [
+            ("http://mybackend.local", "mybackend.local:80", "http://39c631ffb52d-backend"),
+            ("https://mybackend.local", "mybackend.local:443", "https://39c631ffb52d-backend"),
+            (
+                "http://[fd00::1]:8080/swift/v1",
+                "[fd00::1]:8080",
+                "http://39c631ffb52d-backend/swift/v1",
+            ),
+        ],
+    )
+    def test_make_env_config_backend_upstream(self, backend, server, proxy_pass):
+        """
+        arrange: configure a backend URL
+        act: generate the env config
+        assert: the upstream holds the backend address and nginx proxies to the upstream
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["backend"] = backend
+        self.config["upstream_balancing"] = "least-conn"
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        assert env_config["NGINX_BACKEND"] == proxy_pass
+        assert env_config["NGINX_UPSTREAM_CONFIG"].split("\n    ") == [
+            "least_conn;",
+            f"server {server} max_fails=1 fail_timeout=10s;",
+            "keepalive 32;",
+            "keepalive_requests 1000;",
+            "keepalive_timeout 60s;",
+        ]
+
+    def test_make_env_config_upstream_keepalive(self):
+        """
+        arrange: configure the keepalive connection pool to the backend
+        act: generate the env config
+        assert: the upstream keeps the configured number of connections open
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["upstream_keepalive"] = 64
+        self.config["upstream_keepalive_requests"] = 10000
+        self.config["upstream_keepalive_timeout"] = "5m"
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        assert env_config["NGINX_UPSTREAM_CONFIG"].split("\n    ")[1:] == [
+            "keepalive 64;",
+            "keepalive_requests 10000;",
+            "keepalive_timeout 5m;",
+        ]
+
+    @pytest.mark.parametrize(
+        "sharding,own_address,expected",
+        [
+            (False, "10.1.0.1", []),
+            (True, "10.1.0.1", ["10.1.0.1", "10.1.0.3"]),
+            (True, "fd00::1", ["10.1.0.3", "[fd00::1]"]),
+        ],
+    )
+    def test_shard_addresses(self, sharding, own_address, expected):
+        """
+        arrange: set the peer relation with a ready unit, a unit not ready and a departed unit
+        act: list the shard addresses
+        assert: shards are this unit and the ready peers when sharding is enabled
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_sharding"] = sharding
+        harness.update_config(self.config)
+        harness.add_network(own_address, endpoint="content-cache-peers")
+        relation_id = harness.add_relation("content-cache-peers", "content-cache-k8s")
+        for unit, address, ready in (
+            ("content-cache-k8s/1", "10.1.0.3", "true"),
+            ("content-cache-k8s/2", "10.1.0.4", "false"),
+            ("content-cache-k8s/3", "10.1.0.2", "true"),
+        ):
+            harness.add_relation_unit(relation_id, unit)
+            harness.update_relation_data(relation_id, unit, {"address": address, "ready": ready})
+        harness.remove_relation_unit(relation_id, "content-cache-k8s/3")
+
+        assert harness.charm._shard_addresses() == expected
+
+    def test_make_nginx_config_sharding(self):
+        """
+        arrange: enable sharding with two units in the peer relation
+        act: set nginx config
+        assert: ensure the container port forwards requests to the cache server of their owner,
+            through the shards upstream rendered in its own file
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_sharding"] = True
+        harness.update_config(self.config)
+        harness.add_network("10.1.0.2", endpoint="content-cache-peers")
+        relation_id = harness.add_relation("content-cache-peers", "content-cache-k8s")
+        harness.add_relation_unit(relation_id, "content-cache-k8s/1")
+        harness.update_relation_data(
+            relation_id, "content-cache-k8s/1", {"address": "10.1.0.1", "ready": "true"}
+        )
+
+        env_config = harness.charm._make_env_config()
+        nginx_configs = harness.charm._make_nginx_configs(env_config)
+
+        assert env_config["NGINX_CACHE_PORT"] == 8081
+        with open("tests/files/nginx_config_sharding.txt") as f:
+            expected = f.read()
+            assert nginx_configs["/etc/nginx/sites-enabled/default"] == expected
+        assert nginx_configs["/etc/nginx/content-cache/shards.conf"] == (
+            "upstream 39c631ffb52d-shards {\n"
+            "    hash $request_uri consistent;\n"
+            "    server 10.1.0.1:8081 max_fails=1 fail_timeout=10s;\n"
+            "    server 10.1.0.2:8081 max_fails=1 fail_timeout=10s;\n"
+            "    keepalive 32;\n"
+            "    keepalive_requests 1000;\n"
+            "    keepalive_timeout 60s;\n"
+            "}\n"
+        )
+
+    def test_configure_workload_container_invalid_upstream_balancing(self):
+        """
+        arrange: an unknown upstream balancing method is configured
+        act: configure the workload container
+        assert: the unit is blocked
+        """
+        harness = self.harness
+        self.config["upstream_balancing"] = "random"
+
+        harness.update_config(self.config)
+
+        assert harness.charm.unit.status == BlockedStatus("Invalid config(s): upstream_balancing")
+
+    @pytest.mark.parametrize(
+        "config,expected",
+        [
+            ({}, []),
+            ({"cache_slice_size": "1m", "upstream_balancing": "uri-hash"}, []),
+            ({"cache_slice_size": "1 MB"}, ["cache_slice_size"]),
+            (
+                {"cache_slice_size": "-1", "upstream_balancing": "random"},
+                ["cache_slice_size", "upstream_balancing"],
+            ),
+            ({"cache_tiers": "- name: hot\n  max_size: 1g\n  uri: ^/static/"}, []),
+            ({"cache_tiers": "name: hot"}, ["cache_tiers"]),
+            ({"cache_tiers": "- name: hot\n  max_size: 1g"}, ["cache_tiers"]),
+            ({"cache_tiers": "- name: Hot\n  max_size: 1g\n  uri: ^/"}, ["cache_tiers"]),
+            ({"cache_tiers": "- name: hot\n  max_size: 1g\n  uri: ^/\n  ram: 1"}, ["cache_tiers"]),
+            ({"cache_tiers": "- {name: hot, max_size: 1g, uri: ^/, levels: 3}"}, ["cache_tiers"]),
+            (
+                {
+                    "cache_tiers": "[{name: a, max_size: 1g, uri: x}, {name: a, max_size: 1g, uri: y}]"
+                },
+                ["cache_tiers"],
+            ),
+            ({"cache_tiers": "- [unbalanced"}, ["cache_tiers"]),
+            ({"sites": "- {site: a.local, backend: 'http://a:80', cache_max_size: 1g}"}, []),
+            ({"sites": "site: a.local"}, ["sites"]),
+            ({"cache_key_ignore_args": "utm_source fbclid", "cache_key_headers": "Accept"}, []),
+            ({"cache_key_args": "page q-x"}, ["cache_key_args"]),
+            ({"cache_key_ignore_args": "utm.source"}, ["cache_key_ignore_args"]),
+            ({"cache_key_headers": "Accept_Encoding"}, ["cache_key_headers"]),
+            (
+                {
+                    "cache_rules": (
+                        "- {path: /static/, cache_valid: [200 1y, any 1m], min_uses: 2}\n"
+                        "- {regex: ^/api/, bypass: true}"
+                    )
+                },
+                [],
+            ),
+            ({"cache_rules": "path: /static/"}, ["cache_rules"]),
+            ({"cache_rules": "- {cache_valid: 200 1y}"}, ["cache_rules"]),
+            ({"cache_rules": "- {path: /a, regex: ^/b}"}, ["cache_rules"]),
+            ({"cache_rules": "- {path: /a, cache_valid: 1 year}"}, ["cache_rules"]),
+            ({"cache_rules": "- {path: /a, min_uses: 0}"}, ["cache_rules"]),
+            ({"cache_rules": "- {path: /a, ignore_headers: [Host]}"}, ["cache_rules"]),
+            ({"cache_rules": "- {path: /a, bypass: sometimes}"}, ["cache_rules"]),
+            ({"cache_rules": "- {path: /a, cache_use_stale: 'error;'}"}, ["cache_rules"]),
+            ({"cache_rules": "- {regex: 'a\"'}"}, ["cache_rules"]),
+            ({"sites": "- {site: a.local, backend: 'http://a:80'}"}, ["sites"]),
+            ({"sites": "- {site: a.local, backend: a, cache_max_size: 1g}"}, ["sites"]),
+            ({"sites": "- {site: 'a b', backend: 'http://a:80', cache_max_size: 1g}"}, ["sites"]),
+            (
+                {"sites": "- {site: a.local, backend: 'http://a:80', cache_max_size: 1g, tls: 1}"},
+                ["sites"],
+            ),
+            (
+                {"sites": "- {site: mysite.local, backend: 'http://a:80', cache_max_size: 1g}"},
+                ["sites"],
+            ),
+            ({"cache_max_size": "10 GB"}, ["cache_max_size"]),
+            ({"cache_average_object_size": "0"}, ["cache_average_object_size"]),
+            ({"cache_keys_zone_size": "lots"}, ["cache_keys_zone_size"]),
+            (
+                {"cache_loader_sleep": "fast", "cache_loader_threshold": "1s"},
+                ["cache_loader_sleep"],
+            ),
+        ],
+    )
+    def test_invalid_charm_configs(self, config, expected):
+        """
+        arrange: define charm config with valid and invalid values
+        act: check the charm config
+        assert: the configs with invalid values are returned
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        harness.update_config({**self.config, **config})
+
+        assert harness.charm._invalid_charm_configs() == expected
+
     def test_make_pebble_config(self):
         """
         arrange: define pebble config
@@ -513,9 +1137,31 @@ class TestCharm:
         harness.update_config(config)
         env_config = harness.charm._make_env_config()
         expected = PEBBLE_CONFIG
-        expected["services"]["content-cache"]["environment"] = harness.charm._make_env_config()
+        expected["services"]["content-cache"]["environment"] = {
+            "JUJU_POD_NAME": "content-cache-k8s/0",
+            "JUJU_POD_NAMESPACE": None,
+            "JUJU_POD_SERVICE_ACCOUNT": "content-cache-k8s",
+        }
         assert harness.charm._make_pebble_config(env_config) == expected
 
+    def test_get_nginx_prometheus_exporter_pebble_config(self):
+        """
+        arrange: nothing
+        act: generate the exporter pebble layer
+        assert: the layer runs the stub_status exporter and the access log exporter helper
+        """
+        layer = self.harness.charm._get_nginx_prometheus_exporter_pebble_config()
+
+        log_exporter = layer["services"]["content-cache-log-exporter"]
+        assert log_exporter["command"] == (
+            "python3 /srv/content-cache/bin/log_exporter.py /var/log/nginx/access.log --port 9114"
+        )
+        assert log_exporter["requires"] == [CONTAINER_NAME]
+        assert "nginx-prometheus-exporter" in layer["services"]
+        assert layer["checks"]["log-exporter-up"]["http"] == {
+            "url": "http://localhost:9114/metrics"
+        }
+
     def test_make_nginx_config(self):
         """
         arrange: define nginx config
@@ -648,3 +1294,813 @@ class TestCharm:
         with open("tests/files/nginx_config_proxy_cache_revalidate.txt") as f:
             expected = f.read()
             assert harness.charm._make_nginx_config(env_config) == expected
+
+    @pytest.mark.parametrize(
+        "cache_valid,expected",
+        [
+            ("200 1h", ["proxy_cache_valid 206 1h;"]),
+            ("200 302 10m", ["proxy_cache_valid 206 10m;"]),
+            ("200 206 1h", []),
+            ("any 5m", []),
+        ],
+    )
+    def test_make_env_config_cache_slice(self, cache_valid, expected):
+        """
+        arrange: define configuration with slice caching enabled
+        act: generate environment configuration
+        assert: slices are cached under their own key, including 206 responses
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_slice_size"] = "4m"
+        self.config["cache_valid"] = cache_valid
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        assert env_config["NGINX_CACHE_SLICE"].split("\n        ")[1:] == [
+            "slice 4m;",
+            "proxy_cache_key $scheme$proxy_host$request_uri$slice_range;",
+            "proxy_set_header Range $slice_range;",
+            *expected,
+        ]
+
+    def test_make_nginx_config_cache_slice(self):
+        """
+        arrange: define nginx config with slice caching enabled
+        act: set nginx config
+        assert: ensure nginx config contains the slice directives
+        """
+        config = self.config
+        harness = self.harness
+        harness.disable_hooks()
+        config["cache_slice_size"] = "1m"
+        harness.update_config(config)
+        env_config = harness.charm._make_env_config()
+        with open("tests/files/nginx_config_cache_slice.txt") as f:
+            expected = f.read()
+            assert harness.charm._make_nginx_config(env_config) == expected
+
+    def test_make_nginx_config_cache_tiers(self):
+        """
+        arrange: define nginx config with a memory tier and a disk tier for large files
+        act: set nginx config
+        assert: ensure nginx config routes requests to the cache zones of the tiers by URI
+        """
+        config = self.config
+        harness = self.harness
+        harness.disable_hooks()
+        config["cache_tiers"] = """
+- name: hot
+  path: /dev/shm/cache
+  max_size: 48m
+  inactive: 1h
+  keys_zone_size: 1m
+  uri: \\.(css|js)$
+- name: large
+  max_size: 500g
+  levels: "1:2:2"
+  uri: ^/(isos|snaps)/
+"""
+        harness.update_config(config)
+        env_config = harness.charm._make_env_config()
+        with open("tests/files/nginx_config_cache_tiers.txt") as f:
+            expected = f.read()
+            assert harness.charm._make_nginx_config(env_config) == expected
+
+    @pytest.mark.parametrize(
+        "request_uri,zone",
+        [
+            ("/isos/ubuntu.iso?mirror=1", "39c631ffb52d-cache-large"),
+            ("/static/app.js", "39c631ffb52d-cache-hot"),
+            ("/static/isos/", "39c631ffb52d-cache"),
+        ],
+    )
+    def test_make_nginx_config_cache_tiers_rules(self, request_uri, zone):
+        """
+        arrange: define cache tiers and cache rules, with a backend path
+        act: set nginx config and route a request through its maps
+        assert: the tiers are routed by the request path, which the rewrite of the rule
+            locations to the backend path doesn't change
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["backend"] = "http://mybackend.local:80/swift/v1"
+        self.config["cache_tiers"] = """
+- {name: hot, max_size: 48m, uri: \\.(css|js)$}
+- {name: large, max_size: 500g, uri: ^/(isos|snaps)/}
+"""
+        self.config["cache_rules"] = "- {regex: ., cache_valid: 200 1d}"
+        harness.update_config(self.config)
+
+        nginx_config = harness.charm._make_nginx_config(harness.charm._make_env_config())
+
+        assert "rewrite ^/(.*)$ /swift/v1$1 break;" in nginx_config
+        maps = {
+            target: (source, re.findall(r'"~(.*)" (\S+);', body))
+            for source, target, body in re.findall(
+                r"\nmap (\$\S+) (\$\S+) \{\n(.*?)\n\}", nginx_config, re.S
+            )
+        }
+        source, zones = maps["$cache_zone_39c631ffb52d"]
+        path_source, [(path_pattern, _)] = maps[source]
+        assert path_source == "$request_uri"
+        path = re.match(path_pattern, request_uri).group(1)
+        routed = [name for pattern, name in zones if re.search(pattern, path)]
+        assert (routed or ["39c631ffb52d-cache"])[0] == zone
+
+    def test_make_nginx_config_cache_rules(self):
+        """
+        arrange: define cache rules for immutable assets and for an API, with a backend path
+        act: set nginx config
+        assert: ensure each rule is a location nested in "location /", in order, proxying to
+            the backend path and overriding the cache policy
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["backend"] = "http://mybackend.local:80/swift/v1"
+        self.config["cache_rules"] = """
+- path: /static/
+  cache_valid: [200 301 1y, any 1m]
+  ignore_headers: [Cache-Control, Expires]
+- regex: \\.(png|jpe?g)$
+  cache_valid: 200 1d
+  cache_use_stale: error timeout
+  min_uses: 2
+- path: /api/
+  bypass: true
+"""
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        with open("tests/files/nginx_config_cache_rules.txt") as f:
+            expected = f.read()
+            assert harness.charm._make_nginx_config(env_config) == expected
+
+    def test_make_cache_rules_slicing(self):
+        """
+        arrange: define cache rules overriding the cache validity and the ignored headers,
+            with slicing on and cache_all off
+        act: make the env config
+        assert: the rules repeat the validity of the slices and the headers ignored by
+            "location /", which nginx doesn't merge into nested locations
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_all"] = False
+        self.config["cache_slice_size"] = "1m"
+        self.config["cache_rules"] = """
+- {path: /static/, cache_valid: 200 1y, ignore_headers: [Set-Cookie, Expires]}
+- {path: /partial/, cache_valid: [206 1d, any 1m]}
+- {path: /api/, cache_valid: 404 1m}
+- {path: /stale/, cache_use_stale: error}
+"""
+        harness.update_config(self.config)
+
+        rules = harness.charm._make_env_config()["NGINX_CACHE_RULES"]
+
+        locations = [location.split("\n") for location in rules.split("location ")[1:]]
+        directives = [
+            [line.strip() for line in lines if "proxy_cache_valid" in line or "ignore" in line]
+            for lines in locations
+        ]
+        assert directives == [
+            [
+                "proxy_cache_valid 200 1y;",
+                "proxy_cache_valid 206 1y;",
+                "proxy_ignore_headers Cache-Control Expires Set-Cookie;",
+            ],
+            ["proxy_cache_valid 206 1d;", "proxy_cache_valid any 1m;"],
+            ["proxy_cache_valid 404 1m;", "proxy_cache_valid 206 1m;"],
+            [],
+        ]
+
+    @pytest.mark.parametrize(
+        "config,slicing,uri,key",
+        [
+            pytest.param(
+                {}, False, "$request_uri", "$scheme$proxy_host$request_uri", id="default"
+            ),
+            pytest.param(
+                {},
+                True,
+                "$request_uri",
+                "$scheme$proxy_host$request_uri$slice_range",
+                id="slicing",
+            ),
+            pytest.param(
+                {"cache_key_ignore_args": "utm_source fbclid"},
+                False,
+                "$cache_key_path$cache_key_args",
+                "$scheme$proxy_host$cache_key_path$cache_key_args",
+                id="ignore args",
+            ),
+            pytest.param(
+                {"cache_key_args": "q page q", "cache_key_ignore_args": "utm_source"},
+                False,
+                "$cache_key_path?page=$arg_page&q=$arg_q",
+                "$scheme$proxy_host$cache_key_path?page=$arg_page&q=$arg_q",
+                id="sorted args",
+            ),
+            pytest.param(
+                {"cache_key_headers": "Accept-Encoding X-Device"},
+                True,
+                "$request_uri",
+                '"$scheme$proxy_host$request_uri$slice_range $http_accept_encoding'
+                ' $http_x_device"',
+                id="headers",
+            ),
+        ],
+    )
+    def test_make_cache_key(self, config, slicing, uri, key):
+        """
+        arrange: define the cache key configs
+        act: generate the cache key
+        assert: the request URI part of the key is normalized, and headers are appended
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        harness.update_config({**self.config, **config})
+
+        maps, cache_key_uri, cache_key = harness.charm._make_cache_key(slicing)
+
+        assert (cache_key_uri, cache_key) == (uri, key)
+        assert bool(maps) == (uri != "$request_uri")
+
+    @pytest.mark.parametrize(
+        "args,expected",
+        [
+            ("", ""),
+            ("a=1", "?a=1"),
+            ("utm_source=x", ""),
+            ("utm_source=x&a=1", "?a=1"),
+            ("a=1&utm_source=x", "?a=1"),
+            ("a=1&utm_source=x&b=2", "?a=1&b=2"),
+            ("a=1&utm_source&b=2", "?a=1&b=2"),
+            ("a=1&utm_source=x&fbclid=y&b=2", "?a=1&b=2"),
+            ("fbclid=y&utm_source=x", ""),
+            ("xutm_source=x&utm_sourcex=y", "?xutm_source=x&utm_sourcex=y"),
+        ],
+    )
+    def test_make_cache_key_ignore_args(self, args, expected):
+        """
+        arrange: ignore query arguments in the cache key
+        act: apply the chain of maps of the cache key to query strings, as nginx does
+        assert: only the ignored arguments are removed from the key
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_key_ignore_args"] = "utm_source fbclid"
+        harness.update_config(self.config)
+
+        maps = harness.charm._make_cache_key()[0]
+        for arg in ("utm_source", "fbclid"):
+            regex = harness.charm._make_ignore_arg_regex(arg)
+            assert f'"{regex}" $1$2;' in maps
+            match = re.match(regex[1:], args)
+            if match:
+                args = match.group(1) + match.group(2)
+        match = re.match("^&*(.+)$", args)
+        assert '"~^&*(.+)$" ?$1;' in maps
+
+        assert (f"?{match.group(1)}" if match else "") == expected
+
+    def test_make_nginx_config_cache_key(self):
+        """
+        arrange: ignore query arguments and add a header to the cache key, with an extra site
+        act: set nginx config
+        assert: ensure the maps are defined once and each site uses the normalized key
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_key_ignore_args"] = "utm_source fbclid"
+        self.config["cache_key_headers"] = "Accept-Encoding"
+        self.config["sites"] = (
+            "- {site: docs.local, backend: 'http://docs:80', cache_max_size: 1g}"
+        )
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        with open("tests/files/nginx_config_cache_key.txt") as f:
+            expected = f.read()
+            assert harness.charm._make_nginx_config(env_config) == expected
+
+    def test_make_nginx_config_sites(self):
+        """
+        arrange: define an additional site with its own backend and cache policy
+        act: set nginx config
+        assert: ensure the site has its own server block, backend upstream and cache zone
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["sites"] = """
+- site: docs.local
+  backend: https://docs-backend.local/docs
+  cache_max_size: 1g
+  cache_valid: 200 1d
+  cache_all: true
+"""
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        with open("tests/files/nginx_config_sites.txt") as f:
+            expected = f.read()
+            assert harness.charm._make_nginx_config(env_config) == expected
+        assert harness.charm._cache_paths() == [
+            "/var/lib/nginx/proxy/cache",
+            "/var/lib/nginx/proxy/sites/docs.local",
+        ]
+
+    @mock.patch("ops.model.Container.send_signal")
+    def test_configure_workload_container_reload(self, send_signal):
+        """
+        arrange: the workload is configured and nginx runs
+        act: change a config rendered into the nginx config only
+        assert: the new config is tested and nginx reloaded, without replanning
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        container = harness.charm.unit.get_container(CONTAINER_NAME)
+        container.make_dir("/etc/nginx/sites-enabled", make_parents=True)
+        executed = []
+        harness.handle_exec(
+            CONTAINER_NAME, ["nginx"], handler=lambda args: executed.append(args.command)
+        )
+        harness.update_config(self.config)
+        assert container.get_service(CONTAINER_NAME).is_running()
+        assert not executed
+
+        with mock.patch("ops.model.Container.add_layer") as add_layer:
+            harness.update_config({"cache_valid": "200 2h"})
+
+        add_layer.assert_not_called()
+        assert executed == [["nginx", "-t"]]
+        send_signal.assert_called_once_with("SIGHUP", CONTAINER_NAME)
+        assert (
+            "proxy_cache_valid 200 2h;"
+            in container.pull("/etc/nginx/sites-enabled/default").read()
+        )
+        assert harness.charm.unit.status == ActiveStatus("Ready")
+
+    @pytest.mark.parametrize(
+        "config",
+        [
+            pytest.param({"cache_tiers": "- {name: large, max_size: 1g, uri: iso$}"}, id="tiers"),
+            pytest.param(
+                {"sites": "- {site: docs.local, backend: 'http://docs:80', cache_max_size: 1g}"},
+                id="sites",
+            ),
+        ],
+    )
+    @mock.patch("ops.model.Container.send_signal")
+    def test_configure_workload_container_reload_with_replan(self, send_signal, config):
+        """
+        arrange: the workload is configured and nginx runs
+        act: change a config adding a cache path, which also changes the cache index service
+        assert: the other services are replanned and nginx is still reloaded
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        container = harness.charm.unit.get_container(CONTAINER_NAME)
+        executed = []
+        harness.handle_exec(
+            CONTAINER_NAME, ["nginx"], handler=lambda args: executed.append(args.command)
+        )
+        harness.update_config(self.config)
+        plan = container.get_plan().to_dict()["services"]
+
+        harness.update_config(config)
+
+        new_plan = container.get_plan().to_dict()["services"]
+        assert new_plan["content-cache-index"] != plan["content-cache-index"]
+        assert new_plan[CONTAINER_NAME] == plan[CONTAINER_NAME]
+        assert executed == [["nginx", "-t"]]
+        send_signal.assert_called_once_with("SIGHUP", CONTAINER_NAME)
+        assert harness.charm.unit.status == ActiveStatus("Ready")
+
+    @mock.patch("ops.model.Container.send_signal")
+    def test_configure_workload_container_peer_joined(self, send_signal):
+        """
+        arrange: the workload is configured with sharding and nginx runs
+        act: a peer unit joins, then publishes that it is ready
+        assert: only the shards upstream file is pushed and nginx is reloaded, without
+            replanning, and this unit publishes its address and readiness
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        container = harness.charm.unit.get_container(CONTAINER_NAME)
+        harness.handle_exec(CONTAINER_NAME, ["nginx"], result=0)
+        harness.add_network("10.1.0.2", endpoint="content-cache-peers")
+        relation_id = harness.add_relation("content-cache-peers", "content-cache-k8s")
+        self.config["cache_sharding"] = True
+        harness.update_config(self.config)
+        site_config = container.pull("/etc/nginx/sites-enabled/default").read()
+
+        with mock.patch("ops.model.Container.add_layer") as add_layer:
+            harness.add_relation_unit(relation_id, "content-cache-k8s/1")
+            send_signal.assert_not_called()
+            with mock.patch("ops.model.Container.push", wraps=container.push) as push:
+                harness.update_relation_data(
+                    relation_id, "content-cache-k8s/1", {"address": "10.1.0.1", "ready": "true"}
+                )
+
+        add_layer.assert_not_called()
+        assert [
+            call.args[0] for call in push.call_args_list if call.args[0].startswith("/etc/nginx")
+        ] == ["/etc/nginx/content-cache/shards.conf"]
+        send_signal.assert_called_once_with("SIGHUP", CONTAINER_NAME)
+        assert container.pull("/etc/nginx/sites-enabled/default").read() == site_config
+        assert (
+            "server 10.1.0.1:8081" in container.pull("/etc/nginx/content-cache/shards.conf").read()
+        )
+        assert harness.get_relation_data(relation_id, "content-cache-k8s/0") == {
+            "address": "10.1.0.2",
+            "ready": "true",
+        }
+
+    def test_configure_workload_container_pebble_calls(self):
+        """
+        arrange: the workload is configured
+        act: emit config-changed with nothing changed, with a changed config, then
+            pebble-ready
+        assert: an unchanged config makes no Pebble call beyond the connection check, while a
+            changed config and a new container are applied again
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        container = harness.charm.unit.get_container(CONTAINER_NAME)
+        container.make_dir("/etc/nginx/sites-enabled", make_parents=True)
+        harness.handle_exec(CONTAINER_NAME, ["nginx"], result=0)
+        harness.update_config(self.config)
+        pebble = mock.Mock(wraps=container.pebble)
+
+        with mock.patch.object(container, "_pebble", pebble):
+            harness.charm.on.config_changed.emit()
+            unchanged_calls = [call[0] for call in pebble.method_calls]
+            harness.update_config({"cache_valid": "200 2h"})
+            changed_calls = len(pebble.method_calls) - len(unchanged_calls)
+            pebble.reset_mock()
+            harness.charm.on.content_cache_pebble_ready.emit(container)
+
+        assert unchanged_calls == ["get_system_info"]
+        assert changed_calls > 0
+        assert pebble.push.called
+        assert harness.charm.unit.status == ActiveStatus("Ready")
+
+    @mock.patch("ops.model.Container.send_signal")
+    def test_configure_workload_container_invalid_nginx_config(self, send_signal):
+        """
+        arrange: the workload is configured and nginx runs
+        act: change the config while nginx rejects the new config
+        assert: the previous config is restored, nginx is not reloaded and the unit is blocked
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        container = harness.charm.unit.get_container(CONTAINER_NAME)
+        container.make_dir("/etc/nginx/sites-enabled", make_parents=True)
+        harness.update_config(self.config)
+        previous = container.pull("/etc/nginx/sites-enabled/default").read()
+        harness.handle_exec(
+            CONTAINER_NAME, ["nginx", "-t"], result=ExecResult(exit_code=1, stderr="emerg")
+        )
+
+        harness.update_config({"cache_valid": "200 2h"})
+
+        send_signal.assert_not_called()
+        assert container.pull("/etc/nginx/sites-enabled/default").read() == previous
+        assert harness.charm.unit.status == BlockedStatus(
+            "Invalid nginx config, see the debug log"
+        )
+
+    @mock.patch("ops.model.Container.send_signal")
+    def test_configure_workload_container_unresolved_upstream(self, send_signal):
+        """
+        arrange: the workload is configured and nginx runs
+        act: join a backend unit whose DNS record doesn't exist yet, then once it resolves
+        assert: the unit waits for the backend instead of blocking, then reloads nginx
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        container = harness.charm.unit.get_container(CONTAINER_NAME)
+        harness.update_config(self.config)
+        previous = container.pull("/etc/nginx/sites-enabled/default").read()
+        stderr = (
+            'nginx: [emerg] host not found in upstream "hello-kubecon-0.hello-kubecon-endpoints'
+            '.test-model.svc.cluster.local:80" in /etc/nginx/sites-enabled/default:12'
+        )
+        harness.handle_exec(
+            CONTAINER_NAME, ["nginx", "-t"], result=ExecResult(exit_code=1, stderr=stderr)
+        )
+        relation_id = harness.add_relation(
+            "nginx-proxy",
+            "hello-kubecon",
+            app_data={
+                "service-name": "test-proxy",
+                "service-hostname": "foo.internal",
+                "service-port": "80",
+            },
+        )
+
+        harness.add_relation_unit(relation_id, "hello-kubecon/0")
+
+        send_signal.assert_not_called()
+        assert container.pull("/etc/nginx/sites-enabled/default").read() == previous
+        assert harness.charm.unit.status == WaitingStatus(
+            "Waiting for the backend addresses to resolve"
+        )
+
+        harness.handle_exec(CONTAINER_NAME, ["nginx", "-t"], result=0)
+        harness.framework.reemit()
+
+        send_signal.assert_called_once_with("SIGHUP", CONTAINER_NAME)
+        assert "hello-kubecon-0" in container.pull("/etc/nginx/sites-enabled/default").read()
+        assert harness.charm.unit.status == ActiveStatus("Ready")
+
+    @mock.patch("ops.model.Container.send_signal")
+    def test_configure_workload_container_retry_rejected_config(self, send_signal):
+        """
+        arrange: the workload is configured and nginx rejected a config change
+        act: emit config-changed again once nginx accepts the config
+        assert: the config is applied again and nginx is reloaded
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        container = harness.charm.unit.get_container(CONTAINER_NAME)
+        harness.update_config(self.config)
+        harness.handle_exec(
+            CONTAINER_NAME, ["nginx", "-t"], result=ExecResult(exit_code=1, stderr="emerg")
+        )
+        harness.update_config({"cache_valid": "200 2h"})
+        harness.handle_exec(CONTAINER_NAME, ["nginx", "-t"], result=0)
+
+        harness.charm.on.config_changed.emit()
+
+        send_signal.assert_called_once_with("SIGHUP", CONTAINER_NAME)
+        assert "200 2h" in container.pull("/etc/nginx/sites-enabled/default").read()
+        assert harness.charm.unit.status == ActiveStatus("Ready")
+
+    def test_configure_workload_container_nginx_stopped(self):
+        """
+        arrange: the workload is configured and the nginx service is stopped
+        act: change the nginx config
+        assert: nginx is started with the new config
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        container = harness.charm.unit.get_container(CONTAINER_NAME)
+        harness.update_config(self.config)
+        container.stop(CONTAINER_NAME)
+
+        harness.update_config({"cache_valid": "200 2h"})
+
+        assert container.get_service(CONTAINER_NAME).is_running()
+        assert harness.charm.unit.status == ActiveStatus("Ready")
+
+    def test_configure_workload_container_unchanged_no_pebble(self):
+        """
+        arrange: the workload is configured, then Pebble can't be reached
+        act: emit config-changed with nothing changed
+        assert: the unit waits for Pebble instead of reporting Ready
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        harness.update_config(self.config)
+        harness.set_can_connect(CONTAINER_NAME, False)
+
+        harness.charm.on.config_changed.emit()
+
+        assert harness.charm.unit.status == WaitingStatus("Waiting for Pebble to start")
+
+    @mock.patch("ops.model.Container.make_dir")
+    @mock.patch("ops.model.Container.push")
+    @mock.patch("ops.model.Container.pebble")
+    def test_configure_workload_container_cache_tiers(self, pebble, push, make_dir):
+        """
+        arrange: define cache tiers
+        act: configure workload container
+        assert: the directories of the main cache and of the tiers are created
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        self.config["cache_tiers"] = "- {name: hot, path: /dev/shm/cache, max_size: 48m, uri: x}"
+
+        harness.update_config(self.config)
+
+        make_dir.assert_has_calls(
+            [
+                mock.call(CACHE_PATH, make_parents=True),
+                mock.call("/dev/shm/cache", make_parents=True),
+            ]
+        )
+
+    @pytest.mark.parametrize(
+        "size,expected",
+        [("1048576", 1048576), ("512k", 524288), ("1m", 1048576), ("10G", 10737418240)],
+    )
+    def test_parse_size(self, size, expected):
+        """
+        arrange: nothing
+        act: parse an nginx size
+        assert: the size is returned in bytes
+        """
+        assert parse_size(size) == expected
+
+    @pytest.mark.parametrize("size", ["", "12x", "1.5m", "k"])
+    def test_parse_size_invalid(self, size):
+        """
+        arrange: nothing
+        act: parse a malformed nginx size
+        assert: a ValueError is raised
+        """
+        with pytest.raises(ValueError):
+            parse_size(size)
+
+    @pytest.mark.parametrize("average_size", ["0", "12x"])
+    @pytest.mark.parametrize(
+        "config,option",
+        [
+            pytest.param(
+                {"cache_tiers": "- {name: hot, max_size: 48m, uri: x}"}, "cache_tiers", id="tiers"
+            ),
+            pytest.param(
+                {"sites": "- {site: a.local, backend: 'http://a:80', cache_max_size: 1g}"},
+                "sites",
+                id="sites",
+            ),
+        ],
+    )
+    def test_configure_workload_container_invalid_average_object_size(
+        self, average_size, config, option
+    ):
+        """
+        arrange: define cache tiers or sites, sized from the average object size
+        act: set a zero or malformed cache_average_object_size
+        assert: the unit is blocked and the ingress config can still be made
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+
+        harness.update_config({**self.config, **config, "cache_average_object_size": average_size})
+
+        assert harness.charm.unit.status == BlockedStatus(
+            f"Invalid config(s): cache_average_object_size, {option}"
+        )
+        assert harness.charm._make_ingress_config()
+
+    @pytest.mark.parametrize(
+        "cache_max_size,capacity,expected",
+        [
+            ("", None, "10G"),
+            ("20G", None, "20G"),
+            ("", 100 * 2**30, "92160m"),
+            ("20G", 100 * 2**30, "20G"),
+            ("200G", 100 * 2**30, "92160m"),
+        ],
+    )
+    @mock.patch("os.statvfs")
+    def test_cache_max_size(self, statvfs, cache_max_size, capacity, expected):
+        """
+        arrange: define cache_max_size with or without an attached cache storage
+        act: generate environment configuration
+        assert: max_size defaults to and is capped by 90% of the cache storage
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_max_size"] = cache_max_size
+        harness.update_config(self.config)
+        if capacity is not None:
+            harness.add_storage("cache", attach=True)
+            statvfs.return_value = mock.Mock(f_frsize=4096, f_blocks=capacity // 4096)
+
+        env_config = harness.charm._make_env_config()
+
+        assert env_config["NGINX_CACHE_MAX_SIZE"] == expected
+
+    @pytest.mark.parametrize(
+        "cache_max_size,expected", [("", "40960m"), ("20G", "20G"), ("60G", "40960m")]
+    )
+    @mock.patch("os.statvfs")
+    def test_cache_max_size_sites(self, statvfs, cache_max_size, expected):
+        """
+        arrange: attach a cache storage and define sites with their own cache_max_size
+        act: generate environment configuration
+        assert: the main cache gets the share of the cache storage the sites leave
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        harness.add_storage("cache", attach=True)
+        statvfs.return_value = mock.Mock(f_frsize=4096, f_blocks=100 * 2**30 // 4096)
+        self.config["cache_max_size"] = cache_max_size
+        self.config["sites"] = """
+- {site: a.local, backend: 'http://a:80', cache_max_size: 30g}
+- {site: b.local, backend: 'http://b:80', cache_max_size: 20g}
+"""
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        assert env_config["NGINX_CACHE_MAX_SIZE"] == expected
+
+    @mock.patch("os.statvfs")
+    def test_configure_workload_container_sites_exceed_storage(self, statvfs):
+        """
+        arrange: attach a cache storage
+        act: define sites whose caches take all the cache storage nginx may fill
+        assert: the unit is blocked on the sites config
+        """
+        harness = self.harness
+        harness.set_can_connect(CONTAINER_NAME, True)
+        harness.add_storage("cache", attach=True)
+        statvfs.return_value = mock.Mock(f_frsize=4096, f_blocks=100 * 2**30 // 4096)
+        self.config["sites"] = "- {site: a.local, backend: 'http://a:80', cache_max_size: 90g}"
+
+        harness.update_config(self.config)
+
+        assert harness.charm.unit.status == BlockedStatus("Invalid config(s): sites")
+
+    @pytest.mark.parametrize(
+        "cache_max_size,average_size,expected",
+        [
+            ("10G", "", "11m"),
+            ("500G", "128k", "512m"),
+            ("500G", "1m", "64m"),
+            ("1G", "1m", "1m"),
+        ],
+    )
+    def test_make_env_config_keys_zone_size(self, cache_max_size, average_size, expected):
+        """
+        arrange: define the cache size and the average size of the cached objects
+        act: generate environment configuration
+        assert: the keys zone is sized to index the cache
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_max_size"] = cache_max_size
+        self.config["cache_average_object_size"] = average_size
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        assert env_config["NGINX_KEYS_ZONE_SIZE"] == expected
+
+    @pytest.mark.parametrize(
+        "keys_zone_size,undersized",
+        [("200m", True), ("400m", False), ("1g", False)],
+    )
+    def test_make_env_config_keys_zone_size_override(self, keys_zone_size, undersized, caplog):
+        """
+        arrange: override the keys zone size of a 500G cache needing a 512m keys zone
+        act: generate environment configuration
+        assert: the override is used, with a warning if it is clearly undersized
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_max_size"] = "500G"
+        self.config["cache_keys_zone_size"] = keys_zone_size
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        assert env_config["NGINX_KEYS_ZONE_SIZE"] == keys_zone_size
+        assert ("cache_keys_zone_size" in caplog.text) == undersized
+
+    def test_make_env_config_cache_loader(self):
+        """
+        arrange: define the cache loader configuration
+        act: generate environment configuration
+        assert: the cache loader parameters are set for the cache path
+        """
+        harness = self.harness
+        harness.disable_hooks()
+        self.config["cache_loader_files"] = 1000
+        self.config["cache_loader_sleep"] = "10ms"
+        self.config["cache_loader_threshold"] = "1s"
+        harness.update_config(self.config)
+
+        env_config = harness.charm._make_env_config()
+
+        assert env_config["NGINX_CACHE_LOADER"] == (
+            "loader_files=1000 loader_sleep=10ms loader_threshold=1s"
+        )
+
+    def test_make_nginx_config_proxy_cache_lock(self):
+        """
+        arrange: define nginx config with request collapsing and background updates enabled
+        act: set nginx config
+        assert: ensure nginx config contains the proxy_cache_lock directives
+        """
+        config = self.config
+        harness = self.harness
+        harness.disable_hooks()
+        config["proxy_cache_lock"] = True
+        config["proxy_cache_lock_timeout"] = "10s"
+        config["proxy_cache_background_update"] = True
+        config["proxy_cache_min_uses"] = 2
+        harness.update_config(config)
+        env_config = harness.charm._make_env_config()
+        with open("tests/files/nginx_config_proxy_cache_lock.txt") as f:
+            expected = f.read()
+            assert harness.charm._make_nginx_config(env_config) == expected
@@ -0,0 +1,138 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+import io
+
+import pytest
+
+from file_reader import bisect_lines, readlines_reverse
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "",
+        "\n",
+        "single line",
+        "first\nsecond\nthird",
+        "first\nsecond\nthird\n",
+        "\n\nblank lines\n\n",
+        "a much longer line that straddles several blocks\nshort\n",
+        "ünïcödé líñé\nsecond ✓ line\n",
+    ],
+)
+@pytest.mark.parametrize("block_size", [1, 2, 3, 7, 64 * 1024])
+def test_readlines_reverse_text(content, block_size):
+    """
+    arrange: an in-memory text stream
+    act: read its lines in reverse with several block sizes
+    assert: the lines are the ones of the file, in reverse order
+    """
+    lines = list(readlines_reverse(io.StringIO(content), block_size=block_size))
+
+    assert lines == content.split("\n")[::-1]
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 5, 64 * 1024])
+def test_readlines_reverse_binary(block_size):
+    """
+    arrange: a binary stream with multibyte characters crossing block boundaries
+    act: read its lines in reverse
+    assert: the lines are decoded and returned in reverse order
+    """
+    content = "ünïcödé líñé\nsecond ✓ line\nlast"
+
+    lines = list(readlines_reverse(io.BytesIO(content.encode("utf-8")), block_size=block_size))
+
+    assert lines == ["last", "second ✓ line", "ünïcödé líñé"]
+
+
+def test_readlines_reverse_text_file(tmp_path):
+    """
+    arrange: a text file opened from disk, as returned by Container.pull
+    act: read its lines in reverse
+    assert: the lines are returned in reverse order and the file is closed
+    """
+    path = tmp_path / "access.log"
+    path.write_text("10.0.0.1 - - one\n10.0.0.2 - - two ✓\n", encoding="utf-8")
+    qfile = path.open(encoding="utf-8")
+
+    lines = list(readlines_reverse(qfile, block_size=4))
+
+    assert lines == ["", "10.0.0.2 - - two ✓", "10.0.0.1 - - one"]
+    assert qfile.closed
+
+
+def test_readlines_reverse_is_lazy():
+    """
+    arrange: a stream whose lines are consumed one at a time
+    act: stop reading after the last line
+    assert: only the end of the stream has been read
+    """
+    content = "x" * 1000 + "\nlast line"
+    stream = io.StringIO(content)
+
+    lines = readlines_reverse(stream, block_size=16)
+
+    assert next(lines) == "last line"
+    assert stream.tell() == len(content)
+
+
+def _key(line):
+    """Return the integer a test line starts with, if any."""
+    value = line.split(b" ", 1)[0]
+    return int(value) if value.isdigit() else None
+
+
+@pytest.mark.parametrize("target,expected_line", [(-1, 0), (0, 1), (41, 21), (99, 50), (500, 50)])
+def test_bisect_lines(target, expected_line):
+    """
+    arrange: a file with sorted keys of varying line lengths
+    act: bisect it for several targets
+    assert: the offset of the first line with a key greater than the target is returned
+    """
+    lines = [f"{2 * i} {'x' * (i % 7)}\n".encode() for i in range(50)]
+    stream = io.BytesIO(b"".join(lines))
+
+    offset = bisect_lines(stream, _key, target)
+
+    assert offset == sum(len(line) for line in lines[:expected_line])
+
+
+def test_bisect_lines_skips_lines_without_key():
+    """
+    arrange: a sorted file with malformed lines, including a truncated last line
+    act: bisect it
+    assert: the malformed lines are skipped over
+    """
+    stream = io.BytesIO(b"1 a\nbad\n2 b\nworse\n3 c\n4 d\ntrunc")
+
+    assert bisect_lines(stream, _key, 1) == len(b"1 a\nbad\n")
+    assert bisect_lines(stream, _key, 3) == len(b"1 a\nbad\n2 b\nworse\n3 c\n")
+    assert bisect_lines(stream, _key, 4) == len(stream.getvalue())
+
+
+def test_bisect_lines_empty():
+    """
+    arrange: an empty file
+    act: bisect it
+    assert: offset 0 is returned
+    """
+    assert bisect_lines(io.BytesIO(b""), _key, 1) == 0
+
+
+def test_bisect_lines_reads_few_lines():
+    """
+    arrange: a large sorted file
+    act: bisect it
+    assert: only a logarithmic number of lines are read
+    """
+    stream = io.BytesIO(b"".join(f"{i}\n".encode() for i in range(100000)))
+    calls = []
+
+    def key(line):
+        calls.append(line)
+        return _key(line.strip())
+
+    bisect_lines(stream, key, 12345)
+
+    assert len(calls) < 40
@@ -0,0 +1,153 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+from access_logs import LOG_FORMAT_PATH, access_log_line
+
+from access_log import LogParser
+from log_exporter import CacheMetrics, Histogram, LogTailer, make_handler, tail
+
+PARSER = LogParser.from_config(LOG_FORMAT_PATH)
+
+
+def test_histogram():
+    """
+    arrange: a histogram with a few buckets
+    act: observe values below, on and above the bounds
+    assert: the samples are cumulative and end with the +Inf bucket, sum and count
+    """
+    histogram = Histogram((0.1, 1.0))
+
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert list(histogram.samples()) == [
+        ("_bucket", "0.1", 2),
+        ("_bucket", "1", 3),
+        ("_bucket", "+Inf", 4),
+        ("_sum", "", pytest.approx(5.65)),
+        ("_count", "", 4),
+    ]
+
+
+def test_cache_metrics_render():
+    """
+    arrange: metrics observing hits, a miss without upstream time and a malformed line
+    act: render them
+    assert: the counters and histograms are labelled by cache status
+    """
+    metrics = CacheMetrics()
+    for line in (
+        access_log_line(),
+        access_log_line(bytes_sent=388),
+        access_log_line(
+            cache_status="MISS", bytes_sent=2048, request_time="0.200", upstream_time="-"
+        ),
+        "malformed",
+    ):
+        metrics.observe(PARSER.parse(line))
+
+    lines = metrics.render().splitlines()
+
+    assert "# TYPE content_cache_requests_total counter" in lines
+    assert 'content_cache_requests_total{cache_status="HIT"} 2' in lines
+    assert 'content_cache_requests_total{cache_status="MISS"} 1' in lines
+    assert 'content_cache_sent_bytes_total{cache_status="HIT"} 1000' in lines
+    assert 'content_cache_sent_bytes_total{cache_status="MISS"} 2048' in lines
+    assert "# TYPE content_cache_request_duration_seconds histogram" in lines
+    assert (
+        'content_cache_request_duration_seconds_bucket{cache_status="HIT",le="0.005"} 2' in lines
+    )
+    assert 'content_cache_request_duration_seconds_bucket{cache_status="MISS",le="0.1"} 0' in lines
+    assert 'content_cache_request_duration_seconds_count{cache_status="MISS"} 1' in lines
+    assert 'content_cache_response_size_bytes_bucket{cache_status="MISS",le="10240"} 1' in lines
+    assert 'content_cache_upstream_response_duration_seconds_count{cache_status="HIT"} 2' in lines
+    assert not any(
+        line.startswith(
+            'content_cache_upstream_response_duration_seconds_count{cache_status="MISS"'
+        )
+        for line in lines
+    )
+    assert "content_cache_log_invalid_lines_total 1" in lines
+
+
+def test_log_tailer(tmp_path):
+    """
+    arrange: a log file with existing lines
+    act: append complete and partial lines, then rotate and truncate the file
+    assert: only the complete lines written after the tailer started are returned once
+    """
+    path = tmp_path / "access.log"
+    path.write_bytes(b"old\n")
+    tailer = LogTailer(str(path))
+
+    assert not list(tailer.read_lines())
+    with path.open("ab") as log_file:
+        log_file.write(b"one\ntw")
+    assert list(tailer.read_lines()) == [b"one"]
+    with path.open("ab") as log_file:
+        log_file.write(b"o\n")
+    assert list(tailer.read_lines()) == [b"two"]
+
+    with path.open("ab") as log_file:
+        log_file.write(b"three\n")
+    os.rename(path, tmp_path / "access.log.1")
+    path.write_bytes(b"four\n")
+    assert list(tailer.read_lines()) == [b"three", b"four"]
+
+    path.write_bytes(b"5\n")
+    assert list(tailer.read_lines()) == [b"5"]
+    tailer.close()
+
+
+def test_log_tailer_missing_file(tmp_path):
+    """
+    arrange: a tailer of a log file not created yet
+    act: read lines before and after the file is created
+    assert: nothing is returned until the file exists, then its lines are read from the start
+    """
+    path = tmp_path / "access.log"
+    tailer = LogTailer(str(path), from_start=True)
+
+    assert not list(tailer.read_lines())
+    path.write_bytes(b"one\n")
+    assert list(tailer.read_lines()) == [b"one"]
+    tailer.close()
+
+
+def test_metrics_endpoint(tmp_path):
+    """
+    arrange: an access log tailed into metrics served over HTTP
+    act: scrape /metrics and another path
+    assert: the metrics are served in the text format and other paths return 404
+    """
+    path = tmp_path / "access.log"
+    path.write_text(
+        f"{access_log_line()}\n{access_log_line(cache_status='MISS')}\n", encoding="utf-8"
+    )
+    metrics = CacheMetrics()
+    tailer = LogTailer(str(path), from_start=True)
+    tail(tailer, PARSER, metrics)
+    tailer.close()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(metrics))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        with urllib.request.urlopen(f"{url}/metrics") as response:  # nosec B310
+            content_type = response.headers["Content-Type"]
+            body = response.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{url}/")  # nosec B310
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert 'content_cache_requests_total{cache_status="MISS"} 1' in body.splitlines()
+    assert error.value.code == 404
@@ -0,0 +1,349 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from access_logs import LOG_FORMAT_PATH, access_log_line
+
+import log_report
+from access_log import LogParser
+
+PARSER = LogParser.from_config(LOG_FORMAT_PATH)
+NOW = datetime.now()
+SINCE = NOW - timedelta(minutes=20)
+DATE_20 = NOW - timedelta(minutes=20, seconds=5)
+DATE_19 = NOW - timedelta(minutes=19, seconds=55)
+
+
+@pytest.mark.parametrize(
+    "test_input,expected",
+    [
+        ([], []),
+        (
+            [access_log_line(ip="10.10.10.11", time=NOW)] * 3
+            + [access_log_line(ip="10.10.10.12", time=NOW)] * 2,
+            [("10.10.10.11", 3), ("10.10.10.12", 2)],
+        ),
+        ([access_log_line(ip="10.10.10.11", time=NOW)] * 3, [("10.10.10.11", 3)]),
+        ([access_log_line(ip="10.10.10.11", time=NOW)], [("10.10.10.11", 1)]),
+        (
+            [
+                access_log_line(ip="10.10.10.12", time=DATE_20),
+                access_log_line(ip="10.10.10.10", time=DATE_19),
+                "",
+            ],
+            [("10.10.10.10", 1)],
+        ),
+        (
+            [access_log_line(ip="10.10.10.13, 10.1.0.1", time=NOW), "10.10.10.13 - - [malformed"],
+            [("10.10.10.13", 1)],
+        ),
+    ],
+)
+def test_top_visits(test_input, expected):
+    """
+    arrange: some nginx log lines are simulated
+    act: count the visits by IP in the window
+    assert: only the log lines logged less than 20 minutes ago are accepted
+    """
+    log_file = io.BytesIO("\n".join(test_input).encode())
+
+    records = log_report.window_records(log_file, SINCE, PARSER)
+
+    assert log_report.top_visits(records) == expected
+
+
+@pytest.mark.parametrize(
+    "group_by,expected",
+    [
+        ("ip", [("10.10.10.11", 2), ("10.10.10.12", 1), ("2001:db8::1", 1)]),
+        ("ip-prefix", [("10.10.10.0/24", 3), ("2001:db8::/64", 1)]),
+        ("user-agent", [("curl/8.5.0", 3), ("snapd/2.61", 1)]),
+        ("uri", [("/", 2), ("/a?b=c", 1), ("BAD", 1)]),
+        ("status", [("200", 3), ("404", 1)]),
+        ("cache-status", [("HIT", 3), ("MISS", 1)]),
+    ],
+)
+def test_top_visits_group_by(group_by, expected):
+    """
+    arrange: some nginx log lines with various fields
+    act: count the visits grouped by each supported key
+    assert: the counts are grouped by that key
+    """
+    lines = [
+        access_log_line(ip="10.10.10.11"),
+        access_log_line(ip="10.10.10.11", request="GET /a?b=c HTTP/1.1", status=404),
+        access_log_line(ip="10.10.10.12", user_agent="snapd/2.61", cache_status="MISS"),
+        access_log_line(ip="2001:db8::1", request="BAD"),
+    ]
+
+    records = [PARSER.parse(line) for line in lines]
+
+    assert log_report.top_visits(records, group_by) == expected
+
+
+def test_top_visits_limit():
+    """
+    arrange: more distinct clients than the Space-Saving summary monitors
+    act: count the visits by IP with a limit
+    assert: the heavy hitters are returned first and only limit entries are returned
+    """
+    lines = [access_log_line(ip=f"10.0.{i // 256}.{i % 256}") for i in range(5000)]
+    lines += [access_log_line(ip="10.10.10.11")] * 100 + [access_log_line(ip="10.10.10.12")] * 50
+
+    top = log_report.top_visits(map(PARSER.parse, lines), limit=2)
+
+    assert [ip for ip, _ in top] == ["10.10.10.11", "10.10.10.12"]
+
+
+@pytest.mark.parametrize(
+    "test_input,expected",
+    [
+        (b"10.10.10.11 - - [17/Oct/2026:10:01:02 +0000]", datetime(2026, 10, 17, 10, 1, 2)),
+        (b"", None),
+        (b"10.10.10.11 - -", None),
+        (b"10.10.10.11 - - [not a date]", None),
+    ],
+)
+def test_line_time(test_input, expected):
+    """
+    arrange: a nginx log line is simulated
+    act: parse the timestamp of the line
+    assert: the timestamp is returned, or None if the line has none
+    """
+    assert log_report.line_time(PARSER, test_input) == expected
+
+
+@pytest.mark.parametrize(
+    "test_input,expected",
+    [
+        ("30s", timedelta(seconds=30)),
+        ("5m", timedelta(minutes=5)),
+        ("1h", timedelta(hours=1)),
+        ("24h", timedelta(hours=24)),
+        ("7d", timedelta(days=7)),
+    ],
+)
+def test_parse_window(test_input, expected):
+    """
+    arrange: a window as given to the action
+    act: parse it
+    assert: the window has the expected length
+    """
+    assert log_report.parse_window(test_input) == expected
+
+
+@pytest.mark.parametrize("test_input", ["", "5", "m", "-5m", "5w", "1h30m"])
+def test_parse_window_invalid(test_input):
+    """
+    arrange: an invalid window
+    act: parse it
+    assert: a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        log_report.parse_window(test_input)
+
+
+def test_window_records():
+    """
+    arrange: an access log spanning a day with a malformed line in it
+    act: read the last hour of it
+    assert: only the well-formed lines of the last hour are returned, oldest first
+    """
+    start = datetime(2026, 10, 17)
+    lines = [
+        access_log_line(ip=f"10.0.0.{i % 250}", time=start + timedelta(minutes=i))
+        for i in range(24 * 60)
+    ]
+    lines.insert(23 * 60 + 5, "garbage")
+    log_file = io.BytesIO("\n".join(lines).encode())
+
+    window = list(log_report.window_records(log_file, start + timedelta(hours=23), PARSER))
+
+    assert len(window) == 59
+    assert window[0] == PARSER.parse(lines[23 * 60 + 1])
+    assert window[-1] == PARSER.parse(lines[-1])
+
+
+def test_main_visits(tmp_path, capsys):
+    """
+    arrange: an access log with recent and old lines
+    act: run the visits report from the command line
+    assert: the counts of the lines in the window are printed as JSON
+    """
+    log_path = tmp_path / "access.log"
+    log_path.write_text(
+        "\n".join(
+            [
+                access_log_line(ip="10.10.10.12", time=DATE_20),
+                access_log_line(ip="10.10.10.10", time=DATE_19),
+                access_log_line(ip="10.10.10.10", time=NOW),
+                "",
+            ]
+        )
+    )
+
+    log_report.main(
+        [
+            "visits",
+            str(log_path),
+            "--window",
+            "1h",
+            "--limit",
+            "1",
+            "--log-format",
+            LOG_FORMAT_PATH,
+        ]
+    )
+
+    assert json.loads(capsys.readouterr().out) == [["10.10.10.10", 2]]
+
+
+def test_cache_stats():
+    """
+    arrange: log lines with various cache statuses and request times
+    act: summarize the cache statistics
+    assert: requests, bytes and request time percentiles are reported by cache status
+    """
+    statuses = [
+        ("HIT", 100, "0.001", 90),
+        ("HIT", 100, "0.100", 10),
+        ("MISS", 1000, "0.500", 20),
+        ("REVALIDATED", 100, "0.050", 5),
+        ("-", 10, "-", 3),
+    ]
+    lines = [
+        access_log_line(cache_status=cache_status, bytes_sent=size, request_time=request_time)
+        for cache_status, size, request_time, count in statuses
+        for _ in range(count)
+    ]
+
+    stats = log_report.cache_stats(map(PARSER.parse, lines))
+
+    assert stats["requests"] == 128
+    assert stats["hit_ratio"] == 105 / 125
+    assert stats["bytes_from_cache"] == 10500
+    assert stats["bytes_from_origin"] == 20000
+    assert stats["byte_hit_ratio"] == 10500 / 30500
+    assert [item["status"] for item in stats["statuses"]] == ["HIT", "REVALIDATED", "MISS", "-"]
+    hit = stats["statuses"][0]
+    assert (hit["requests"], hit["bytes"]) == (100, 10000)
+    assert hit["p50"] == pytest.approx(0.001, rel=0.01)
+    assert hit["p95"] == pytest.approx(0.1, rel=0.01)
+    assert hit["p99"] == pytest.approx(0.1, rel=0.01)
+    assert stats["statuses"][2]["p99"] == pytest.approx(0.5, rel=0.01)
+    assert stats["statuses"][3]["p50"] is None
+
+
+def test_cache_stats_empty():
+    """
+    arrange: no log lines
+    act: summarize the cache statistics
+    assert: the ratios are undefined
+    """
+    stats = log_report.cache_stats([])
+
+    assert stats["requests"] == 0
+    assert stats["hit_ratio"] is None
+    assert stats["byte_hit_ratio"] is None
+    assert stats["statuses"] == []
+
+
+def test_main_cache_stats(tmp_path, capsys):
+    """
+    arrange: an access log with recent lines
+    act: run the cache-stats report from the command line
+    assert: the statistics are printed as JSON
+    """
+    log_path = tmp_path / "access.log"
+    log_path.write_text(access_log_line(ip="10.10.10.10", time=NOW, cache_status="MISS") + "\n")
+
+    log_report.main(["cache-stats", str(log_path), "--log-format", LOG_FORMAT_PATH])
+
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["requests"] == 1
+    assert stats["statuses"][0]["status"] == "MISS"
+
+
+@pytest.mark.parametrize(
+    "uri,strip_query,expected",
+    [
+        ("/a/b", False, "/a/b"),
+        ("//a///b/", False, "/a/b/"),
+        ("/a?b=1&c=2", False, "/a?b=1&c=2"),
+        ("/a?b=1&c=2", True, "/a"),
+        ("/a?", False, "/a"),
+        ("/a#frag", False, "/a"),
+    ],
+)
+def test_normalize_uri(uri, strip_query, expected):
+    """
+    arrange: a requested URI
+    act: normalize it
+    assert: equivalent URIs are normalized the same way
+    """
+    assert log_report.normalize_uri(uri, strip_query) == expected
+
+
+@pytest.mark.parametrize(
+    "strip_query,expected",
+    [
+        (
+            False,
+            [
+                {"uri": "/big.iso", "misses": 3, "bytes": 3000, "upstream_time": 0.5},
+                {"uri": "/a?v=1", "misses": 1, "bytes": 10, "upstream_time": None},
+                {"uri": "/a?v=2", "misses": 1, "bytes": 10, "upstream_time": 0.5},
+            ],
+        ),
+        (
+            True,
+            [
+                {"uri": "/big.iso", "misses": 3, "bytes": 3000, "upstream_time": 0.5},
+                {"uri": "/a", "misses": 2, "bytes": 20, "upstream_time": 0.5},
+            ],
+        ),
+    ],
+)
+def test_top_misses(strip_query, expected):
+    """
+    arrange: log lines with hits and misses
+    act: list the top misses
+    assert: only MISS, EXPIRED and BYPASS are counted, with their bytes and upstream times
+    """
+    lines = [
+        access_log_line(request="GET /big.iso HTTP/1.1", cache_status="MISS", bytes_sent=1000),
+        access_log_line(request="GET //big.iso HTTP/1.1", cache_status="EXPIRED", bytes_sent=1000),
+        access_log_line(request="GET /big.iso HTTP/1.1", cache_status="BYPASS", bytes_sent=1000),
+        access_log_line(request="GET /big.iso HTTP/1.1", cache_status="HIT", bytes_sent=1000),
+        access_log_line(request="GET /a?v=1 HTTP/1.1", cache_status="MISS", bytes_sent=10),
+        access_log_line(request="GET /a?v=2 HTTP/1.1", cache_status="MISS", bytes_sent=10),
+        access_log_line(request="GET /hot HTTP/1.1", cache_status="HIT", bytes_sent=10),
+    ]
+    records = [PARSER.parse(line) for line in lines]
+    records[4].upstream_time = None
+    for record in records[:3] + records[5:6]:
+        record.upstream_time = 0.5
+
+    assert log_report.top_misses(records, strip_query=strip_query) == expected
+
+
+def test_top_misses_bounded():
+    """
+    arrange: more distinct missed URIs than the Space-Saving summary monitors
+    act: list the top misses with a limit
+    assert: the most missed URI is found, its count overestimated by at most the count it
+        inherited and its totals accumulated since it is monitored
+    """
+    lines = [
+        access_log_line(request=f"GET /{i} HTTP/1.1", cache_status="MISS") for i in range(5000)
+    ]
+    lines += [access_log_line(request="GET /top HTTP/1.1", cache_status="MISS")] * 50
+
+    misses = log_report.top_misses(map(PARSER.parse, lines), limit=1)
+
+    assert [(miss["uri"], miss["bytes"]) for miss in misses] == [("/top", 50 * 612)]
+    assert 50 <= misses[0]["misses"] <= 50 + 5000 // 1000
+    assert misses[0]["upstream_time"] == pytest.approx(0.003)
@@ -0,0 +1,168 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+import random
+from collections import Counter
+
+import pytest
+
+from sketches import QuantileSketch, SpaceSaving
+
+
+def test_space_saving_exact_under_capacity():
+    """
+    arrange: a Space-Saving summary larger than the number of distinct keys
+    act: count some keys
+    assert: the counts are exact
+    """
+    keys = ["a"] * 5 + ["b"] * 3 + ["c"]
+    summary = SpaceSaving(10)
+
+    for key in keys:
+        assert summary.add(key) is None
+
+    assert summary.most_common() == Counter(keys).most_common()
+    assert summary.most_common(1) == [("a", 5)]
+    assert len(summary) == 3
+    assert "c" in summary
+    assert summary.error("c") == 0
+
+
+def test_space_saving_evicts_min():
+    """
+    arrange: a full Space-Saving summary
+    act: count a new key
+    assert: the key with the lowest count is evicted and its count inherited
+    """
+    summary = SpaceSaving(2)
+    for key in ["a", "a", "b"]:
+        summary.add(key)
+
+    evicted = summary.add("c")
+
+    assert evicted == "b"
+    assert "b" not in summary
+    assert summary.most_common() == [("a", 2), ("c", 2)]
+    assert summary.error("c") == 1
+
+
+def test_space_saving_bounded_and_finds_heavy_hitters():
+    """
+    arrange: a stream of many distinct keys with a few heavy hitters
+    act: count it with a small summary
+    assert: memory stays bounded, the heavy hitters are found and their counts are
+        overestimated by no more than their error
+    """
+    rng = random.Random(42)
+    stream = [f"noise-{rng.randrange(100000)}" for _ in range(50000)]
+    stream += ["heavy-1"] * 3000 + ["heavy-2"] * 2000 + ["heavy-3"] * 1000
+    rng.shuffle(stream)
+    exact = Counter(stream)
+    summary = SpaceSaving(100)
+
+    for key in stream:
+        summary.add(key)
+
+    assert len(summary) == 100
+    top = summary.most_common(3)
+    assert [key for key, _ in top] == ["heavy-1", "heavy-2", "heavy-3"]
+    for key, count in top:
+        assert exact[key] <= count <= exact[key] + summary.error(key)
+
+
+def test_space_saving_invalid_capacity():
+    """
+    arrange: no summary
+    act: create a summary without capacity
+    assert: a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        SpaceSaving(0)
+
+
+@pytest.mark.parametrize("q", [0.0, 0.5, 0.9, 0.95, 0.99, 1.0])
+def test_quantile_sketch_relative_accuracy(q):
+    """
+    arrange: a sketch of request times spanning several orders of magnitude
+    act: estimate quantiles
+    assert: the estimates are within the relative accuracy of the exact quantiles
+    """
+    rng = random.Random(42)
+    values = sorted(rng.lognormvariate(-3, 1.5) for _ in range(20000))
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    exact = values[int(q * (len(values) - 1))]
+
+    assert sketch.count == len(values)
+    assert abs(sketch.quantile(q) - exact) <= 0.01 * exact
+
+
+def test_quantile_sketch_zeros_and_empty():
+    """
+    arrange: an empty sketch and a sketch of mostly zero times
+    act: estimate quantiles
+    assert: None is returned for the empty sketch, zero below the share of zeros
+    """
+    sketch = QuantileSketch()
+    assert sketch.quantile(0.5) is None
+
+    for value in [0.0] * 9 + [1.0]:
+        sketch.add(value)
+
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(1.0, rel=0.01)
+
+
+def test_quantile_sketch_merge():
+    """
+    arrange: two sketches of disjoint halves of a data set
+    act: merge them
+    assert: the merged sketch estimates the quantiles of the whole data set
+    """
+    first, second, whole = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for value in range(1, 1001):
+        (first if value % 2 else second).add(value / 1000)
+        whole.add(value / 1000)
+
+    first.merge(second)
+
+    assert first.count == whole.count
+    for q in (0.5, 0.95, 0.99):
+        assert first.quantile(q) == whole.quantile(q)
+
+
+def test_quantile_sketch_merge_mismatch():
+    """
+    arrange: two sketches with different accuracies
+    act: merge them
+    assert: a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+
+def test_quantile_sketch_bounded():
+    """
+    arrange: a sketch with few buckets
+    act: add values spanning many buckets
+    assert: the number of buckets stays bounded and the high quantiles stay accurate
+    """
+    sketch = QuantileSketch(relative_accuracy=0.01, max_buckets=50)
+
+    for value in range(1, 10001):
+        sketch.add(value / 1000)
+
+    assert len(sketch._buckets) == 50
+    assert sketch.quantile(0.99) == pytest.approx(9.9, rel=0.01)
+
+
+@pytest.mark.parametrize("relative_accuracy", [0, 1, -0.1])
+def test_quantile_sketch_invalid_accuracy(relative_accuracy):
+    """
+    arrange: no sketch
+    act: create a sketch with an invalid accuracy
+    assert: a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        QuantileSketch(relative_accuracy)